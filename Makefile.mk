@@ -7,7 +7,10 @@ pre-commit:
 pytest:
 	pytest
 
-.PHONY: dev dev-backend dev-frontend install pre-commit pytest
+benchmark:
+	poetry run python -m benchmarks.run_benchmark
+
+.PHONY: dev dev-backend dev-frontend install pre-commit pytest benchmark
 
 # --- Local Development ---
 
@@ -0,0 +1,137 @@
+"""
+Synthetic Teradata BTEQ / ANSI SQL scripts for benchmarks.
+
+Scripts mix the statement kinds the extraction prompts are written for:
+DATABASE, CREATE TABLE, INSERT...SELECT with joins, UPDATE, BTEQ control
+lines (.IF/.GOTO/.LABEL/.QUIT) and both comment styles. Generation is
+seeded, so the same parameters always produce the same corpus.
+"""
+import random
+
+_SCHEMAS = ["PROD_DB", "STG_DB", "EDW", "MART"]
+_NOUNS = ["CUSTOMER", "ACCOUNT", "ORDER", "PRODUCT", "SALES", "BRANCH", "REGION", "PAYMENT", "INVOICE", "LEDGER"]
+_SUFFIXES = ["", "_DTL", "_HIST", "_SUM", "_DIM", "_FACT"]
+_COLUMNS = ["ID", "CODE", "NAME", "STATUS", "AMOUNT", "QTY", "PRICE", "EFF_DT", "END_DT", "LOAD_TS", "REGION_CD"]
+_TYPES = ["INTEGER", "VARCHAR(50)", "DECIMAL(18,2)", "DATE", "TIMESTAMP(0)", "CHAR(1)"]
+
+
+def _table(rng: random.Random, work: bool = False) -> str:
+    name = rng.choice(_NOUNS) + rng.choice(_SUFFIXES)
+    if work:
+        name = "WK_" + name
+    return f"{rng.choice(_SCHEMAS)}.{name}"
+
+
+def _columns(rng: random.Random, count: int) -> list:
+    return rng.sample(_COLUMNS, min(count, len(_COLUMNS)))
+
+
+def _create_table(rng: random.Random, table: str) -> str:
+    columns = _columns(rng, rng.randint(4, 8))
+    body = ",\n    ".join(f"{column} {rng.choice(_TYPES)}" for column in columns)
+    kind = rng.choice(["MULTISET TABLE", "SET TABLE", "VOLATILE TABLE"])
+    return f"CREATE {kind} {table} (\n    {body}\n) PRIMARY INDEX ({columns[0]});"
+
+
+def _insert_select(rng: random.Random, target: str, sources: list) -> str:
+    columns = _columns(rng, rng.randint(3, 7))
+    aliases = [f"T{i + 1}" for i in range(len(sources))]
+    select = ",\n       ".join(
+        rng.choice([
+            f"{rng.choice(aliases)}.{column}",
+            f"COALESCE({rng.choice(aliases)}.{column}, 0)",
+            f"CASE WHEN {rng.choice(aliases)}.STATUS = 'A' THEN {rng.choice(aliases)}.{column} ELSE NULL END",
+            f"SUM({rng.choice(aliases)}.{column})",
+        ])
+        for column in columns
+    )
+    joins = "".join(
+        f"\n{rng.choice(['INNER', 'LEFT OUTER'])} JOIN {source} {alias}\n  ON T1.ID = {alias}.ID"
+        for source, alias in zip(sources[1:], aliases[1:])
+    )
+    return (
+        f"INSERT INTO {target} ({', '.join(columns)})\n"
+        f"SELECT {select}\n"
+        f"FROM {sources[0]} T1{joins}\n"
+        f"WHERE T1.EFF_DT <= CURRENT_DATE;"
+    )
+
+
+def _update(rng: random.Random, target: str, source: str) -> str:
+    column = rng.choice(_COLUMNS)
+    return (
+        f"UPDATE TGT\nFROM {target} TGT, {source} SRC\n"
+        f"SET {column} = SRC.{column}\n"
+        f"WHERE TGT.ID = SRC.ID;"
+    )
+
+
+def _control(rng: random.Random, label: str) -> str:
+    return f".IF ERRORCODE <> 0 THEN .GOTO {label};"
+
+
+def _comment(rng: random.Random) -> str:
+    text = rng.choice(["Load staging data", "Apply SCD2 changes", "Refresh aggregate", "Cleanup work tables"])
+    if rng.random() < 0.5:
+        return f"-- {text}"
+    return f"/* {text}\n   INSERT INTO {_table(rng)} SELECT * FROM {_table(rng)}; */"
+
+
+def generate_sql_script(rng: random.Random, num_statements: int, shared_statements: list = None,
+                        shared_ratio: float = 0.0) -> str:
+    """
+    Generates one BTEQ-style script with `num_statements` SQL statements;
+    `shared_ratio` of them are drawn from `shared_statements` instead.
+    """
+    lines = [
+        f"/* Job: {rng.choice(_NOUNS).title()} Load  Version: v{rng.randint(1, 3)}.{rng.randint(0, 9)} */",
+        ".LOGON tdprod/etl_user,********;",
+        f"DATABASE {rng.choice(_SCHEMAS)};",
+    ]
+    tables = [_table(rng) for _ in range(max(3, num_statements // 2))]
+    for i in range(num_statements):
+        if shared_statements and rng.random() < shared_ratio:
+            lines.append(rng.choice(shared_statements))
+            lines.append(_control(rng, "ERR_EXIT"))
+            continue
+        roll = rng.random()
+        if roll < 0.15:
+            lines.append(_comment(rng))
+        if roll < 0.25:
+            lines.append(_create_table(rng, _table(rng, work=rng.random() < 0.5)))
+        elif roll < 0.75:
+            sources = rng.sample(tables, min(len(tables), rng.randint(1, 4)))
+            lines.append(_insert_select(rng, _table(rng, work=rng.random() < 0.3), sources))
+        else:
+            lines.append(_update(rng, rng.choice(tables), rng.choice(tables)))
+        lines.append(_control(rng, "ERR_EXIT"))
+    lines += [".QUIT 0;", ".LABEL ERR_EXIT", ".QUIT 8;"]
+    return "\n\n".join(lines) + "\n"
+
+
+def generate_corpus(num_files: int, statements_per_file: int = 20, seed: int = 42,
+                    duplicate_ratio: float = 0.0, shared_statement_ratio: float = 0.0) -> list:
+    """
+    Returns `num_files` `{sql_file_name, sql_query}` items. Statement counts
+    vary by +/-50% around `statements_per_file`; `duplicate_ratio` of the
+    files reuse an earlier script's content under a new name (as copied jobs
+    do in real repositories), and `shared_statement_ratio` of the statements
+    come from a pool shared by all files (as common load steps do).
+    """
+    rng = random.Random(seed)
+    tables = [_table(rng) for _ in range(10)]
+    shared_statements = [
+        _update(rng, rng.choice(tables), rng.choice(tables)) if i % 3 == 0
+        else _insert_select(rng, _table(rng), rng.sample(tables, rng.randint(1, 3)))
+        for i in range(max(1, statements_per_file))
+    ] if shared_statement_ratio > 0 else []
+    items = []
+    for i in range(num_files):
+        if items and rng.random() < duplicate_ratio:
+            sql_query = rng.choice(items)["sql_query"]
+        else:
+            low = max(1, statements_per_file // 2)
+            sql_query = generate_sql_script(rng, rng.randint(low, statements_per_file + low),
+                                            shared_statements, shared_statement_ratio)
+        items.append({"sql_file_name": f"job_{i:05d}.sql", "sql_query": sql_query})
+    return items
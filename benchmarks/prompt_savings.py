@@ -0,0 +1,88 @@
+"""
+Token savings of prompt minimization across a corpus.
+
+Minimizes every script (the synthetic corpus, or the .sql files under a
+directory) and reports the estimated tokens of the script and of the full
+extraction prompts before and after. No model is called.
+
+Run from the repository root:
+
+    python -m benchmarks.prompt_savings --files 200
+    python -m benchmarks.prompt_savings --sql-dir path/to/scripts
+"""
+import argparse
+import glob
+import json
+import os
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.run_benchmark import percentile
+
+
+def _load_directory(sql_dir: str) -> list:
+    items = []
+    for path in sorted(glob.glob(os.path.join(sql_dir, "**", "*.sql"), recursive=True)):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            items.append({"sql_file_name": os.path.relpath(path, sql_dir), "sql_query": f.read()})
+    return items
+
+
+def measure(items: list) -> dict:
+    """Per-corpus totals and per-file percentiles of the script and prompt token savings."""
+    from src.agents.shared_libraries.llm_client import estimate_tokens
+    from src.agents.shared_libraries.sql_minimizer import count_sql_tokens, minimize_sql
+    from src.agents.tools.sql_analysis import build_json_extraction_prompt, build_markdown_extraction_prompt
+
+    script_totals = {"original": 0, "minimized": 0}
+    prompt_totals = {"original": 0, "minimized": 0}
+    savings = []
+    for item in items:
+        sql = item["sql_query"]
+        minimized = minimize_sql(sql)
+        tokens = count_sql_tokens(sql, minimized)
+        script_totals["original"] += tokens["original"]
+        script_totals["minimized"] += tokens["minimized"]
+        # "dual" mode sends the script twice, once in each prompt
+        for build in (build_json_extraction_prompt, build_markdown_extraction_prompt):
+            prompt_totals["original"] += estimate_tokens(build(sql))
+            prompt_totals["minimized"] += estimate_tokens(build(minimized))
+        savings.append(tokens["saved"] / tokens["original"] if tokens["original"] else 0.0)
+
+    def summary(totals: dict) -> dict:
+        saved = totals["original"] - totals["minimized"]
+        return {**totals, "saved": saved,
+                "saved_ratio": round(saved / totals["original"], 4) if totals["original"] else 0.0}
+
+    return {
+        "files": len(items),
+        "script_tokens": summary(script_totals),
+        "dual_prompt_tokens": summary(prompt_totals),
+        "per_file_saved_ratio": {
+            "p50": round(percentile(savings, 50), 4),
+            "p95": round(percentile(savings, 95), 4),
+            "min": round(min(savings), 4) if savings else 0.0,
+            "max": round(max(savings), 4) if savings else 0.0,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sql-dir", help="Directory of .sql files to measure instead of the synthetic corpus")
+    parser.add_argument("--files", type=int, default=100, help="Number of synthetic SQL files")
+    parser.add_argument("--statements", type=int, default=20, help="Mean number of statements per synthetic file")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the report JSON to this path as well")
+    args = parser.parse_args(argv)
+
+    items = _load_directory(args.sql_dir) if args.sql_dir else generate_corpus(args.files, args.statements, args.seed)
+    report = measure(items)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+End-to-end benchmark of the analysis pipeline on a synthetic corpus.
+
+Runs `extract_sql_details` (through the batch path), `create_data_model_from_bq`
+and `create_excel_report` against local stand-ins: the fake LLM client and
+an embedded SQLite storage backend in a temporary directory. Reports
+files/sec, per-file latency percentiles, tokens sent and peak RSS, and
+writes them as JSON so runs can be compared.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmark --files 200 --workers 8 --latency 0.2
+    python -m benchmarks.run_benchmark --compare benchmarks/results/<earlier run>.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.corpus import generate_corpus
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _configure_environment(args, work_dir: str):
+    # Settings are a process-wide snapshot, so this has to happen before the
+    # first get_settings() call (i.e. before the tools are imported).
+    os.environ.update({
+        "APP_LLM_PROVIDER": "fake",
+        "APP_STORAGE_BACKEND": "sqlite",
+        "APP_LOCAL_STORAGE_PATH": os.path.join(work_dir, "rea_local.db"),
+        "APP_ANALYSIS_CACHE_ENABLED": "true" if args.cache else "false",
+        "APP_ANALYSIS_CACHE_PATH": os.path.join(work_dir, "analysis_cache.db"),
+        "APP_EXTRACTION_MODE": args.mode,
+        "APP_STATEMENT_CACHE_ENABLED": "true" if args.statement_cache else "false",
+    })
+
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def run(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="rea-bench-") as work_dir:
+        _configure_environment(args, work_dir)
+
+        from src.agents.shared_libraries.llm_client import FakeLLMClient, set_llm_client
+        from src.agents.shared_libraries.storage import close_storage
+        from src.agents.tools.create_data_model import create_data_model_from_bq
+        from src.agents.tools.create_excel_report import create_excel_report
+        from src.agents.tools.sql_analysis import iter_extract_sql_details_batch
+
+        llm = FakeLLMClient(latency=args.latency, latency_jitter=args.latency_jitter,
+                            failure_rate=args.failure_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed,
+                            quota_concurrency=args.quota_concurrency)
+        set_llm_client(llm)
+
+        corpus = generate_corpus(args.files, args.statements, seed=args.seed, duplicate_ratio=args.duplicate_ratio,
+                                 shared_statement_ratio=args.shared_statement_ratio)
+        corpus_bytes = sum(len(item["sql_query"].encode("utf-8")) for item in corpus)
+        application_name = "benchmark_app"
+
+        records, analyze_seconds = _timed(
+            lambda: list(iter_extract_sql_details_batch(corpus, application_name, args.workers))
+        )
+        latencies = [r["elapsed_seconds"] for r in records if r["status"] != "skipped"]
+        statuses = {}
+        for record in records:
+            statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+        analyze_calls = llm.calls
+        analyze_prompt_tokens = llm.prompt_tokens_total
+        analyze_output_tokens = llm.output_tokens_total
+
+        data_model, data_model_seconds = _timed(create_data_model_from_bq, application_name)
+        report, report_seconds = _timed(create_excel_report, application_name)
+
+        set_llm_client(None)
+        close_storage()
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+        "corpus": {"files": len(corpus), "bytes": corpus_bytes},
+        "analyze": {
+            "wall_clock_seconds": round(analyze_seconds, 3),
+            "files_per_second": round(len(corpus) / analyze_seconds, 2) if analyze_seconds else 0.0,
+            "statuses": statuses,
+            "latency_seconds": {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": max(latencies) if latencies else 0.0,
+            },
+            "llm_calls": analyze_calls,
+            "quota_rejections": llm.quota_rejections,
+            "prompt_tokens": analyze_prompt_tokens,
+            "output_tokens": analyze_output_tokens,
+        },
+        "data_model": {
+            "wall_clock_seconds": round(data_model_seconds, 3),
+            "status": data_model.get("status"),
+            "results": len(data_model.get("results", [])),
+            "failed": len(data_model.get("failed_records", [])),
+            "llm_calls": llm.calls - analyze_calls,
+            "prompt_tokens": llm.prompt_tokens_total - analyze_prompt_tokens,
+        },
+        "excel_report": {
+            "wall_clock_seconds": round(report_seconds, 3),
+            "bytes": len(report),
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+_COMPARED_METRICS = [
+    ("analyze", "files_per_second"),
+    ("analyze", "latency_seconds", "p50"),
+    ("analyze", "latency_seconds", "p95"),
+    ("analyze", "latency_seconds", "p99"),
+    ("analyze", "prompt_tokens"),
+    ("data_model", "wall_clock_seconds"),
+    ("excel_report", "wall_clock_seconds"),
+    ("peak_rss_mb",),
+]
+
+
+def _lookup(result: dict, path: tuple):
+    for key in path:
+        result = result.get(key, {}) if isinstance(result, dict) else {}
+    return result if isinstance(result, (int, float)) else None
+
+
+def compare(baseline: dict, current: dict) -> list:
+    """Returns (metric, baseline, current, relative change) rows for the headline metrics."""
+    rows = []
+    for path in _COMPARED_METRICS:
+        before, after = _lookup(baseline, path), _lookup(current, path)
+        change = (after - before) / before if before and after is not None else None
+        rows.append((".".join(path), before, after, change))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100, help="Number of SQL files in the corpus")
+    parser.add_argument("--statements", type=int, default=20, help="Mean number of statements per file")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="Share of files that repeat earlier content")
+    parser.add_argument("--shared-statement-ratio", type=float, default=0.0,
+                        help="Share of statements drawn from a pool common to all files")
+    parser.add_argument("--workers", type=int, default=8, help="Files analyzed in parallel")
+    parser.add_argument("--mode", default="dual", help="EXTRACTION_MODE to benchmark")
+    parser.add_argument("--cache", action="store_true", help="Enable the analysis cache")
+    parser.add_argument("--statement-cache", action="store_true",
+                        help="Enable the statement-level cache (needs --cache and --mode single_pass)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated LLM latency in seconds")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Extra random LLM latency in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of LLM calls failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of LLM calls failing with a 429")
+    parser.add_argument("--quota-concurrency", type=int, default=0,
+                        help="Simulated quota: LLM calls beyond this many in flight get a 429 (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    output = args.output
+    compare_path = args.compare
+    del args.output, args.compare
+
+    result = run(args)
+
+    if output is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(json.dumps({key: result[key] for key in ("analyze", "data_model", "excel_report", "peak_rss_mb")}, indent=2))
+    print(f"Results written to {output}")
+
+    if compare_path:
+        with open(compare_path) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {compare_path}:")
+        for metric, before, after, change in compare(baseline, result):
+            delta = f"{change:+.1%}" if change is not None else "n/a"
+            print(f"  {metric:<40} {before!s:>12} -> {after!s:>12}  ({delta})")
+
+
+if __name__ == "__main__":
+    main()
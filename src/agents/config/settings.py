@@ -46,7 +46,8 @@ class Settings(BaseSettings):
             raise
 
     # Configure BaseSettings to read variables from yaml file
-    model_config = SettingsConfigDict(yaml_file=get_yaml_file(), env_prefix="APP_", extra="ignore")
+    # frozen: a single snapshot is shared process-wide, see shared_libraries/resources.py
+    model_config = SettingsConfigDict(yaml_file=get_yaml_file(), env_prefix="APP_", extra="ignore", frozen=True)
 
     @classmethod
     def settings_customise_sources(
@@ -69,6 +70,128 @@ class Settings(BaseSettings):
     # SERVICE_ACCOUNT: str = Field(..., env="SERVICE_ACCOUNT")
     REA_SQL_EXTRACTS_DATASET: str = Field("gdm", env="REA_SQL_EXTRACTS_DATASET")
     REA_SQL_EXTRACTS_TABLE: str = Field("rea_sql_extracts", env="REA_SQL_EXTRACTS_TABLE")
+    # Versions of each application's materialized data model (see DATA_MODEL_MATERIALIZE)
+    REA_DATA_MODELS_TABLE: str = Field("rea_data_models", env="REA_DATA_MODELS_TABLE")
+
+    # ---------- SQL ANALYSIS ----------
+    # "dual": the model writes both the Markdown report and the JSON (two calls).
+    # "single_pass": the model only writes the JSON; the report is rendered locally.
+    # "hybrid": a local SQL parser extracts entities, aliases and joins; the model
+    #           only writes descriptions and the mappings the parser cannot resolve.
+    # "parser_only": the local parser alone, with no model call (bulk inventory runs).
+    EXTRACTION_MODE: str = Field("dual", env="EXTRACTION_MODE")
+    LLM_CALL_TIMEOUT_SECONDS: float = Field(600, env="LLM_CALL_TIMEOUT_SECONDS")
+    # Scripts above this many (estimated) tokens are split into statement groups
+    # analyzed in parallel, in "dual" and "single_pass" modes (0 disables)
+    CHUNK_MAX_TOKENS: int = Field(8000, env="CHUNK_MAX_TOKENS")
+    CHUNK_MAX_CONCURRENCY: int = Field(8, env="CHUNK_MAX_CONCURRENCY")
+    # Send the model a minimized copy of each script (no comments, control lines,
+    # layout whitespace or repeated literal blocks); storage keeps the original
+    PROMPT_MINIMIZATION_ENABLED: bool = Field(True, env="PROMPT_MINIMIZATION_ENABLED")
+    # Reuse per-statement results across files and send the model only unseen
+    # statements ("single_pass" mode, needs the analysis cache)
+    STATEMENT_CACHE_ENABLED: bool = Field(False, env="STATEMENT_CACHE_ENABLED")
+
+    # ---------- LLM PROVIDER ----------
+    # "vertex" (Gemini on Vertex AI) or "fake" (offline template responses, for load testing)
+    LLM_PROVIDER: str = Field("vertex", env="LLM_PROVIDER")
+    FAKE_LLM_LATENCY_SECONDS: float = Field(0.0, env="FAKE_LLM_LATENCY_SECONDS")
+    FAKE_LLM_FAILURE_RATE: float = Field(0.0, env="FAKE_LLM_FAILURE_RATE")
+    FAKE_LLM_RATE_LIMIT_RATE: float = Field(0.0, env="FAKE_LLM_RATE_LIMIT_RATE")
+    # Simulated quota: calls beyond this many in flight get a 429 (0 = unlimited)
+    FAKE_LLM_QUOTA_CONCURRENCY: int = Field(0, env="FAKE_LLM_QUOTA_CONCURRENCY")
+
+    # ---------- LLM RETRIES AND ADAPTIVE CONCURRENCY ----------
+    # Retryable failures (429, 500, 502, 503, 504) are retried with exponential
+    # backoff and full jitter, waiting at least the server's retry-after hint
+    LLM_MAX_ATTEMPTS: int = Field(5, env="LLM_MAX_ATTEMPTS")
+    LLM_RETRY_BASE_DELAY_SECONDS: float = Field(1.0, env="LLM_RETRY_BASE_DELAY_SECONDS")
+    LLM_RETRY_MAX_DELAY_SECONDS: float = Field(60.0, env="LLM_RETRY_MAX_DELAY_SECONDS")
+    # Process-wide limit on concurrent calls per model, adapted AIMD-style:
+    # +1 per window of successes, halved on 429/503
+    LLM_CONCURRENCY_INITIAL: int = Field(8, env="LLM_CONCURRENCY_INITIAL")
+    LLM_CONCURRENCY_MIN: int = Field(1, env="LLM_CONCURRENCY_MIN")
+    LLM_CONCURRENCY_MAX: int = Field(64, env="LLM_CONCURRENCY_MAX")
+
+    # ---------- API CONCURRENCY (per endpoint) ----------
+    ANALYZE_MAX_CONCURRENCY: int = Field(16, env="ANALYZE_MAX_CONCURRENCY")
+    READ_MAX_CONCURRENCY: int = Field(8, env="READ_MAX_CONCURRENCY")
+    REPORT_MAX_CONCURRENCY: int = Field(2, env="REPORT_MAX_CONCURRENCY")
+    DATA_MODEL_MAX_CONCURRENCY: int = Field(4, env="DATA_MODEL_MAX_CONCURRENCY")
+    # Batch requests served at once; each analyzes up to BATCH_MAX_WORKERS files in parallel
+    BATCH_MAX_CONCURRENCY: int = Field(2, env="BATCH_MAX_CONCURRENCY")
+    # "graph": an application's records are merged locally into one data model
+    #          (optionally refined by a single model call, DATA_MODEL_LLM_REFINE)
+    # "per_record": one model call per record
+    DATA_MODEL_MODE: str = Field("graph", env="DATA_MODEL_MODE")
+    DATA_MODEL_LLM_REFINE: bool = Field(False, env="DATA_MODEL_LLM_REFINE")
+    # Tables left out of the consolidated model: whole-word name patterns or globs
+    DATA_MODEL_EXCLUDE_PATTERNS: List[str] = Field(
+        ["_LOG", "_AUDIT", "_ERR", "_TMP", "WK_"], env="DATA_MODEL_EXCLUDE_PATTERNS"
+    )
+    # Merge tables with the same name across databases (PROD_DB.CUSTOMER == CUSTOMER)
+    DATA_MODEL_STRIP_DATABASE: bool = Field(True, env="DATA_MODEL_STRIP_DATABASE")
+    # "graph" mode: store each build with an inserted_at watermark and merge only
+    # newer records on the next request. Records inserted up to the lookback
+    # before the watermark are re-read, since buffered writes can land late.
+    DATA_MODEL_MATERIALIZE: bool = Field(True, env="DATA_MODEL_MATERIALIZE")
+    DATA_MODEL_WATERMARK_LOOKBACK_SECONDS: float = Field(600, env="DATA_MODEL_WATERMARK_LOOKBACK_SECONDS")
+    # On BigQuery, each stored version is split into rows of at most this many
+    # bytes (streaming inserts are limited to 10 MB per row and per request)
+    DATA_MODEL_STATE_CHUNK_BYTES: int = Field(4 * 1024 * 1024, env="DATA_MODEL_STATE_CHUNK_BYTES")
+    # "per_record" mode: records processed in parallel, and how long a single
+    # record's model call may take before it is reported as failed
+    DATA_MODEL_RECORD_CONCURRENCY: int = Field(8, env="DATA_MODEL_RECORD_CONCURRENCY")
+    DATA_MODEL_RECORD_TIMEOUT_SECONDS: float = Field(300, env="DATA_MODEL_RECORD_TIMEOUT_SECONDS")
+    # Files analyzed in parallel within a single batch request: the default
+    # and the upper bound of the request's `max_concurrency`
+    BATCH_MAX_WORKERS: int = Field(8, env="BATCH_MAX_WORKERS")
+
+    # ---------- SHARED CLIENTS ----------
+    BQ_HTTP_POOL_SIZE: int = Field(32, env="BQ_HTTP_POOL_SIZE")
+    # Bulk reads stream Arrow record batches over the BigQuery Storage Read API
+    # (needs google-cloud-bigquery-storage; otherwise the REST API is paged)
+    BQ_STORAGE_READ_ENABLED: bool = Field(True, env="BQ_STORAGE_READ_ENABLED")
+    # Poll the config file and reload settings/clients when it changes (0 disables).
+    # Endpoint pool sizes follow the reload; JOB_WORKERS needs a restart.
+    CONFIG_RELOAD_INTERVAL_SECONDS: float = Field(0, env="CONFIG_RELOAD_INTERVAL_SECONDS")
+
+    # ---------- STORAGE ----------
+    # "bigquery" or "sqlite" (embedded local database at LOCAL_STORAGE_PATH)
+    STORAGE_BACKEND: str = Field("bigquery", env="STORAGE_BACKEND")
+    LOCAL_STORAGE_PATH: str = Field("./.data/rea_local.db", env="LOCAL_STORAGE_PATH")
+    # Rows per record batch in bulk reads from the SQLite backend
+    READ_BATCH_ROWS: int = Field(500, env="READ_BATCH_ROWS")
+    # /get-data-model page size when the request gives no limit, and its upper bound
+    DATA_MODEL_PAGE_SIZE: int = Field(50, env="DATA_MODEL_PAGE_SIZE")
+    DATA_MODEL_MAX_PAGE_SIZE: int = Field(500, env="DATA_MODEL_MAX_PAGE_SIZE")
+
+    # ---------- BUFFERED BIGQUERY WRITES ----------
+    BQ_WRITE_BUFFER_ENABLED: bool = Field(True, env="BQ_WRITE_BUFFER_ENABLED")
+    BQ_WRITE_BATCH_ROWS: int = Field(500, env="BQ_WRITE_BATCH_ROWS")
+    BQ_WRITE_BATCH_BYTES: int = Field(8 * 1024 * 1024, env="BQ_WRITE_BATCH_BYTES")
+    BQ_WRITE_FLUSH_INTERVAL_SECONDS: float = Field(2.0, env="BQ_WRITE_FLUSH_INTERVAL_SECONDS")
+    BQ_WRITE_BUFFER_MAX_ROWS: int = Field(5000, env="BQ_WRITE_BUFFER_MAX_ROWS")
+    BQ_WRITE_BUFFER_TIMEOUT_SECONDS: float = Field(30, env="BQ_WRITE_BUFFER_TIMEOUT_SECONDS")
+    BQ_WRITE_MAX_RETRIES: int = Field(3, env="BQ_WRITE_MAX_RETRIES")
+
+    # ---------- COMPLETED FILES INDEX ----------
+    COMPLETED_INDEX_TTL_SECONDS: float = Field(300, env="COMPLETED_INDEX_TTL_SECONDS")
+
+    # ---------- BACKGROUND JOBS (persisted in SESSION_DB_URL) ----------
+    JOB_WORKERS: int = Field(2, env="JOB_WORKERS")
+    JOB_POLL_INTERVAL_SECONDS: float = Field(1.0, env="JOB_POLL_INTERVAL_SECONDS")
+    # A running job's lease is renewed every third of this; jobs whose lease
+    # expired (their process died) are re-queued, up to JOB_MAX_ATTEMPTS runs
+    JOB_LEASE_SECONDS: float = Field(60, env="JOB_LEASE_SECONDS")
+    JOB_MAX_ATTEMPTS: int = Field(3, env="JOB_MAX_ATTEMPTS")
+
+    # ---------- ANALYSIS CACHE ----------
+    ANALYSIS_CACHE_ENABLED: bool = Field(True, env="ANALYSIS_CACHE_ENABLED")
+    ANALYSIS_CACHE_PATH: str = Field("./.cache/analysis_cache.db", env="ANALYSIS_CACHE_PATH")
+    ANALYSIS_CACHE_MAX_ENTRIES: int = Field(10000, env="ANALYSIS_CACHE_MAX_ENTRIES")
+    ANALYSIS_CACHE_MAX_BYTES: int = Field(512 * 1024 * 1024, env="ANALYSIS_CACHE_MAX_BYTES")
+    ANALYSIS_CACHE_MAX_AGE_SECONDS: int = Field(30 * 24 * 3600, env="ANALYSIS_CACHE_MAX_AGE_SECONDS")
 
     # RAW_DATA_BUCKET: str = Field(..., env="RAW_DATA_BUCKET")
     # DOCUMENTS_FOLDER: str = Field(..., env="DOCUMENTS_FOLDER")
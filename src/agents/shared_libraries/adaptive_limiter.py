@@ -0,0 +1,142 @@
+import asyncio
+import collections
+import threading
+import time
+from typing import Callable, Optional
+
+# Outcomes reported to `AdaptiveConcurrencyLimiter.release`
+SUCCESS = "success"
+OVERLOAD = "overload"
+IGNORE = "ignore"
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, event: threading.Event = None, loop=None, future=None):
+        self.event = event
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+
+def _set_future_result(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Concurrency limit that adapts to the backend's capacity (AIMD).
+
+    Every call holds one slot from `acquire` (or `acquire_async`) to
+    `release`. A successful call raises the limit by `increase / limit`,
+    i.e. by about `increase` per full window of calls. An overload signal
+    (HTTP 429/503) multiplies it by `decrease_factor`. Only one decrease
+    happens per window: calls that started before the last decrease do not
+    cut the limit again, so a burst of rejections from one window does not
+    collapse it to the minimum.
+
+    Threads and coroutines on any event loop share the same slots; waiters
+    are served in FIFO order. `on_change` is called with a `stats()` dict
+    whenever the state changes (used to export it as metrics).
+    """
+
+    def __init__(self, initial_limit: float, min_limit: float = 1, max_limit: float = 64,
+                 increase: float = 1.0, decrease_factor: float = 0.5,
+                 on_change: Optional[Callable[[dict], None]] = None):
+        self.min_limit = max(1.0, float(min_limit))
+        self.max_limit = max(self.min_limit, float(max_limit))
+        self.limit = min(self.max_limit, max(self.min_limit, float(initial_limit)))
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.on_change = on_change
+        self.in_flight = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    # ---------- acquire / release ----------
+
+    def acquire(self, timeout: float = None) -> float:
+        """Blocks until a slot is free; returns the start time to pass to `release`."""
+        with self._lock:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                waiter = None
+            else:
+                waiter = _Waiter(event=threading.Event())
+                self._waiters.append(waiter)
+        self._notify()
+        if waiter is not None and not waiter.event.wait(timeout):
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                    raise TimeoutError("Timed out waiting for a concurrency slot")
+        return time.monotonic()
+
+    async def acquire_async(self) -> float:
+        """Awaits a free slot without blocking the event loop; returns the start time to pass to `release`."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                waiter = None
+            else:
+                waiter = _Waiter(loop=loop, future=loop.create_future())
+                self._waiters.append(waiter)
+        self._notify()
+        if waiter is not None:
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter.granted:
+                        granted = True
+                    else:
+                        granted = False
+                        self._waiters.remove(waiter)
+                if granted:
+                    self.release(time.monotonic(), IGNORE)
+                raise
+        return time.monotonic()
+
+    def release(self, started: float, outcome: str = SUCCESS):
+        """Frees a slot and adapts the limit to the call's outcome (`SUCCESS`, `OVERLOAD` or `IGNORE`)."""
+        with self._lock:
+            self.in_flight -= 1
+            if outcome == SUCCESS:
+                self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            elif outcome == OVERLOAD and started >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._last_decrease = time.monotonic()
+                self.decreases += 1
+            self._grant_waiters()
+        self._notify()
+
+    def _grant_waiters(self):
+        # Called with the lock held
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self.in_flight += 1
+            if waiter.event is not None:
+                waiter.event.set()
+            else:
+                waiter.loop.call_soon_threadsafe(_set_future_result, waiter.future)
+
+    # ---------- state ----------
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limit": round(self.limit, 3),
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "decreases": self.decreases,
+            }
+
+    def _notify(self):
+        if self.on_change is not None:
+            self.on_change(self.stats())
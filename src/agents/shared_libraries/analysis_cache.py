@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src.agents.shared_libraries import metrics
+from src.agents.shared_libraries.resources import get_settings
+
+
+def normalize_sql_text(sql_query: str) -> str:
+    """
+    Normalizes a SQL script so that copies which only differ in line endings,
+    indentation, trailing whitespace or blank lines map to the same cache key.
+    """
+    lines = []
+    for line in sql_query.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        collapsed = " ".join(line.split())
+        if collapsed:
+            lines.append(collapsed)
+    return "\n".join(lines)
+
+
+def compute_cache_key(sql_query: str, prompt_version: str, model_name: str) -> str:
+    """Builds the content-addressed key for an analysis result."""
+    digest = hashlib.sha256()
+    for part in (prompt_version, model_name, normalize_sql_text(sql_query)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """
+    Persistent, content-addressed cache for SQL analysis results backed by a
+    local SQLite file.
+
+    Entries are evicted when they are older than `max_age_seconds` or, least
+    recently used first, when the cache grows beyond `max_entries` or
+    `max_bytes`. Hit and miss counters are kept per process and exported
+    on `/metrics` (see `export_metrics`).
+
+    A second table holds statement-level fragments (see `statement_cache`)
+    under the same eviction policy, applied to each table separately.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 10000, max_bytes: int = 512 * 1024 * 1024,
+                 max_age_seconds: int = 30 * 24 * 3600):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.statement_hits = 0
+        self.statement_misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                cache_key TEXT PRIMARY KEY,
+                parser_output TEXT NOT NULL,
+                report_markdown TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_accessed ON analysis_cache (last_accessed_at)"
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS statement_cache (
+                cache_key TEXT PRIMARY KEY,
+                fragment TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_statement_cache_last_accessed ON statement_cache (last_accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, cache_key: str) -> Optional[dict]:
+        """Returns the cached `parser_output` and `report_markdown`, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT parser_output, report_markdown, created_at FROM analysis_cache WHERE cache_key = ?",
+                (cache_key,),
+            ).fetchone()
+            if row is None or now - row[2] > self.max_age_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM analysis_cache WHERE cache_key = ?", (cache_key,))
+                    self._conn.commit()
+                self.misses += 1
+                metrics.ANALYSIS_CACHE_LOOKUPS.inc(cache="result", outcome="miss")
+                return None
+
+            self._conn.execute(
+                "UPDATE analysis_cache SET last_accessed_at = ? WHERE cache_key = ?", (now, cache_key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        metrics.ANALYSIS_CACHE_LOOKUPS.inc(cache="result", outcome="hit")
+        return {"parser_output": json.loads(row[0]), "report_markdown": row[1]}
+
+    def put(self, cache_key: str, parser_output: dict, report_markdown: str):
+        """Stores an analysis result and applies the eviction policy."""
+        parser_output_str = json.dumps(parser_output)
+        size_bytes = len(parser_output_str.encode("utf-8")) + len(report_markdown.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO analysis_cache
+                    (cache_key, parser_output, report_markdown, size_bytes, created_at, last_accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (cache_key, parser_output_str, report_markdown, size_bytes, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def get_fragments(self, cache_keys: List[str]) -> Dict[str, dict]:
+        """Returns the cached statement fragments among `cache_keys`, by key."""
+        if not cache_keys:
+            return {}
+        now = time.time()
+        fragments = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(cache_keys), 500):
+                batch = cache_keys[start:start + 500]
+                placeholders = ", ".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT cache_key, fragment FROM statement_cache "
+                    f"WHERE cache_key IN ({placeholders}) AND created_at >= ?",
+                    (*batch, now - self.max_age_seconds),
+                ).fetchall()
+                fragments.update((cache_key, json.loads(fragment)) for cache_key, fragment in rows)
+            if fragments:
+                self._conn.executemany(
+                    "UPDATE statement_cache SET last_accessed_at = ? WHERE cache_key = ?",
+                    [(now, cache_key) for cache_key in fragments],
+                )
+                self._conn.commit()
+            self.statement_hits += len(fragments)
+            self.statement_misses += len(cache_keys) - len(fragments)
+        if fragments:
+            metrics.ANALYSIS_CACHE_LOOKUPS.inc(len(fragments), cache="statement", outcome="hit")
+        if len(cache_keys) > len(fragments):
+            metrics.ANALYSIS_CACHE_LOOKUPS.inc(len(cache_keys) - len(fragments), cache="statement", outcome="miss")
+        return fragments
+
+    def put_fragments(self, fragments: Dict[str, dict]):
+        """Stores statement fragments and applies the eviction policy."""
+        if not fragments:
+            return
+        now = time.time()
+        rows = []
+        for cache_key, fragment in fragments.items():
+            fragment_str = json.dumps(fragment)
+            rows.append((cache_key, fragment_str, len(fragment_str.encode("utf-8")), now, now))
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO statement_cache
+                    (cache_key, fragment, size_bytes, created_at, last_accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            self._evict(now, "statement_cache")
+            self._conn.commit()
+
+    def _evict(self, now: float, table: str = "analysis_cache"):
+        self._conn.execute(
+            f"DELETE FROM {table} WHERE created_at < ?", (now - self.max_age_seconds,)
+        )
+        count, total_bytes = self._conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM {table}"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            f"SELECT cache_key, size_bytes FROM {table} ORDER BY last_accessed_at ASC"
+        ).fetchall()
+        to_delete = []
+        for cache_key, size_bytes in rows:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            to_delete.append((cache_key,))
+            count -= 1
+            total_bytes -= size_bytes
+        self._conn.executemany(f"DELETE FROM {table} WHERE cache_key = ?", to_delete)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters together with the current cache size."""
+        with self._lock:
+            count, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM analysis_cache"
+            ).fetchone()
+            statement_count = self._conn.execute("SELECT COUNT(*) FROM statement_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        statement_lookups = self.statement_hits + self.statement_misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "size_bytes": total_bytes,
+            "statement_hits": self.statement_hits,
+            "statement_misses": self.statement_misses,
+            "statement_hit_ratio": self.statement_hits / statement_lookups if statement_lookups else 0.0,
+            "statement_entries": statement_count,
+        }
+
+    def export_metrics(self):
+        """Publishes the current cache size as gauges; called when `/metrics` is scraped."""
+        stats = self.stats()
+        metrics.ANALYSIS_CACHE_ENTRIES.set(stats["entries"], cache="result")
+        metrics.ANALYSIS_CACHE_ENTRIES.set(stats["statement_entries"], cache="statement")
+        metrics.ANALYSIS_CACHE_SIZE_BYTES.set(stats["size_bytes"])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_analysis_cache = None
+_analysis_cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    """Returns the process-wide analysis cache, or None when caching is disabled."""
+    global _analysis_cache
+    config = get_settings()
+    if not config.ANALYSIS_CACHE_ENABLED:
+        return None
+    with _analysis_cache_lock:
+        if _analysis_cache is None:
+            _analysis_cache = AnalysisCache(
+                db_path=config.ANALYSIS_CACHE_PATH,
+                max_entries=config.ANALYSIS_CACHE_MAX_ENTRIES,
+                max_bytes=config.ANALYSIS_CACHE_MAX_BYTES,
+                max_age_seconds=config.ANALYSIS_CACHE_MAX_AGE_SECONDS,
+            )
+    return _analysis_cache
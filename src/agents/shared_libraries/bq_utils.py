@@ -2,89 +2,201 @@ from google.cloud import bigquery
 from google.api_core.exceptions import NotFound
 from datetime import datetime, timezone
 import json
-from src.agents.config.settings import Settings
+import time
+from typing import Optional
+from src.agents.shared_libraries import metrics
+from src.agents.shared_libraries.resources import get_settings, get_bq_client as get_shared_bq_client
+from src.agents.shared_libraries.resources import get_bqstorage_client
+
+# Columns of the sql extracts table, in the order of `build_sql_extract_row`
+EXTRACT_COLUMNS = (
+    "sql_id", "sql_file_name", "raw_sql_text", "parser_output", "processing_status",
+    "application_name", "inserted_at", "parser_output_tables",
+)
 
 def get_bq_client():
-    """Initializes the BigQuery client."""
+    """Returns the shared, process-wide BigQuery client."""
     try:
-        config = Settings.get_settings()
-        client = bigquery.Client(project=config.PROJECT_ID)
-        return client
+        return get_shared_bq_client()
     except Exception as e:
         print(f"Could not connect to BigQuery. Please check your GCP authentication. Error: {e}")
         return None
 
-def insert_sql_extract_to_bq(sql_id: str, sql_file_name: str, raw_sql_text: str, parser_output: dict,parser_output_tables:str,application_name:str, processing_status: str):
-    """Inserts a record into the raw_sql_extracts table."""
-    print("Inserting record into BigQuery...")
+def run_query(client, query: str, job_config, operation: str):
+    """
+    Runs a query job and waits for it, recording its duration and bytes
+    processed under `operation` (and the endpoint and application of the
+    request context) in `metrics`. Returns the row iterator.
+    """
+    started = time.perf_counter()
+    try:
+        query_job = client.query(query, job_config=job_config)
+        results = query_job.result()
+    except Exception:
+        metrics.BQ_JOBS.inc(operation=operation, outcome="error")
+        metrics.BQ_JOB_DURATION.observe(time.perf_counter() - started, operation=operation)
+        raise
+    metrics.BQ_JOBS.inc(operation=operation, outcome="success")
+    metrics.BQ_JOB_DURATION.observe(time.perf_counter() - started, operation=operation)
+    metrics.BQ_BYTES_PROCESSED.inc(query_job.total_bytes_processed or 0, operation=operation)
+    return results
+
+def check_extract_columns(columns) -> list:
+    """Validates caller-supplied column names (they are interpolated into queries) and returns them as a list."""
+    columns = list(columns)
+    unknown = [column for column in columns if column not in EXTRACT_COLUMNS]
+    if unknown or not columns:
+        raise ValueError(f"Unknown or missing sql extracts columns: {unknown}")
+    return columns
+
+def check_extract_order(order_by) -> list:
+    """Validates `ORDER BY` terms: a column name, optionally followed by ASC or DESC."""
+    terms = []
+    for term in order_by:
+        column, _, direction = str(term).partition(" ")
+        if direction.strip().upper() not in ("", "ASC", "DESC"):
+            raise ValueError(f"Invalid sort direction in '{term}'")
+        check_extract_columns([column])
+        terms.append(f"{column} {direction.strip().upper()}".strip())
+    return terms
+
+def build_sql_extract_row(sql_id: str, sql_file_name: str, raw_sql_text: str, parser_output: dict,
+                          parser_output_tables: str, application_name: str, processing_status: str) -> dict:
+    """Builds one row of the sql extracts table."""
+    return {
+        "sql_id": sql_id,
+        "sql_file_name": sql_file_name,
+        "raw_sql_text": raw_sql_text,
+        "parser_output": json.dumps(parser_output),
+        "processing_status": processing_status,
+        "application_name":application_name,
+        "inserted_at": datetime.now(timezone.utc).isoformat(),
+        "parser_output_tables" : parser_output_tables
+    }
+
+def insert_rows_to_bq(rows: list) -> list:
+    """
+    Inserts many rows with a single streaming insert. Returns the per-row
+    errors reported by `insert_rows_json`; raises if the call itself fails.
+
+    Each row's `sql_id` is sent as its insert id, so when a batch is retried
+    after a call that failed but had already been committed (e.g. a
+    timeout), BigQuery drops the rows it already has.
+    """
     client = get_bq_client()
     if not client:
-        print("BigQuery client not available. Skipping insert.")
-        return False
+        raise RuntimeError("BigQuery client not available.")
 
-    config = Settings.get_settings()
+    config = get_settings()
     table_id = f"{config.PROJECT_ID}.{config.REA_SQL_EXTRACTS_DATASET}.{config.REA_SQL_EXTRACTS_TABLE}"
+    started = time.perf_counter()
+    try:
+        errors = client.insert_rows_json(table_id, rows, row_ids=[row["sql_id"] for row in rows])
+    except Exception:
+        metrics.BQ_JOBS.inc(operation="insert_rows", outcome="error")
+        raise
+    finally:
+        metrics.BQ_JOB_DURATION.observe(time.perf_counter() - started, operation="insert_rows")
+    metrics.BQ_JOBS.inc(operation="insert_rows", outcome="partial_failure" if errors else "success")
+    metrics.BQ_ROWS_INSERTED.inc(len(rows))
+    return errors
 
-    rows_to_insert = [
-        {
-            "sql_id": sql_id,
-            "sql_file_name": sql_file_name,
-            "raw_sql_text": raw_sql_text,
-            "parser_output": json.dumps(parser_output),
-            "processing_status": processing_status,
-            "application_name":application_name,
-            "inserted_at": datetime.now(timezone.utc).isoformat(),
-            "parser_output_tables" : parser_output_tables
-        }
-    ]
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+def iter_extract_batches_from_bq(application_name: str, columns, order_by=("inserted_at", "sql_id"),
+                                 since: str = None, operation: str = "read_batches"):
+    """
+    Streams an application's rows of the sql extracts table as
+    `pyarrow.RecordBatch`es holding only `columns`, in `order_by` order
+    (and only rows inserted at or after `since` when it is given).
+
+    Batches come over the BigQuery Storage Read API when it is available
+    (`resources.get_bqstorage_client`), otherwise page by page over the REST
+    API; either way only one batch is held in memory at a time.
+    """
+    columns = check_extract_columns(columns)
+    order_by = check_extract_order(order_by)
+    client = get_bq_client()
+    if not client:
+        print("BigQuery client not available. Skipping fetch.")
+        return
+
+    config = get_settings()
+    table_id = f"{config.PROJECT_ID}.{config.REA_SQL_EXTRACTS_DATASET}.{config.REA_SQL_EXTRACTS_TABLE}"
+
+    query_parameters = [bigquery.ScalarQueryParameter("application_name", "STRING", application_name)]
+    since_filter = ""
+    if since:
+        since_filter = "AND inserted_at >= @since"
+        query_parameters.append(bigquery.ScalarQueryParameter("since", "TIMESTAMP", _parse_timestamp(since)))
+
+    query = f"""
+        SELECT {", ".join(columns)}
+        FROM `{table_id}`
+        WHERE application_name = @application_name {since_filter}
+        ORDER BY {", ".join(order_by)}
+    """
+
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
 
     try:
-        errors = client.insert_rows_json(table_id, rows_to_insert)
-        if not errors:
-            print(f"Successfully inserted record with sql_id: {sql_id}")
-            return True
-        else:
-            print(f"Failed to insert record into BigQuery: {errors}")
-            return False
+        results = run_query(client, query, job_config, operation)
     except NotFound:
         print(f"Table {table_id} not found. Please create it.")
-        # Here you could add logic to create the table if it doesn't exist.
-        # For now, we just print an error.
-        return False
+        return
     except Exception as e:
-        print(f"An error occurred during the BigQuery insert operation: {e}")
-        return False
+        print(f"An error occurred during the BigQuery fetch operation: {e}")
+        return
+
+    for batch in results.to_arrow_iterable(bqstorage_client=get_bqstorage_client()):
+        metrics.BQ_ROWS_READ.inc(batch.num_rows, operation=operation)
+        yield batch
 
-def fetch_from_bq(application_name:str):
-    """Fetches all records from the raw_sql_extracts table."""
-    print(f"Fetching records from BigQuery for application_name:{application_name} ...")
+def fetch_extract_page_from_bq(application_name: str, columns, limit: int, after=None, sql_ids=None) -> list:
+    """
+    Fetches up to `limit` of an application's rows of the sql extracts table,
+    newest first (by `inserted_at`, then `sql_id`), holding `columns` plus
+    that key. `after` is the (inserted_at, sql_id) key of the last row of the
+    previous page; `sql_ids` restricts the page to those records.
+    """
+    columns = check_extract_columns(columns)
     client = get_bq_client()
     if not client:
         print("BigQuery client not available. Skipping fetch.")
         return []
 
-    config = Settings.get_settings()
+    config = get_settings()
     table_id = f"{config.PROJECT_ID}.{config.REA_SQL_EXTRACTS_DATASET}.{config.REA_SQL_EXTRACTS_TABLE}"
 
+    query_parameters = [
+        bigquery.ScalarQueryParameter("application_name", "STRING", application_name),
+        bigquery.ScalarQueryParameter("limit", "INT64", limit),
+    ]
+    filters = ""
+    if sql_ids is not None:
+        filters += " AND sql_id IN UNNEST(@sql_ids)"
+        query_parameters.append(bigquery.ArrayQueryParameter("sql_ids", "STRING", list(sql_ids)))
+    if after:
+        # Keyset pagination: rows strictly after the previous page's last key
+        filters += " AND (inserted_at < @after_inserted_at OR (inserted_at = @after_inserted_at AND sql_id < @after_sql_id))"
+        query_parameters.append(bigquery.ScalarQueryParameter("after_inserted_at", "TIMESTAMP", _parse_timestamp(after[0])))
+        query_parameters.append(bigquery.ScalarQueryParameter("after_sql_id", "STRING", after[1]))
+
+    selected = columns + [column for column in ("inserted_at", "sql_id") if column not in columns]
     query = f"""
-    SELECT sql_file_name,parser_output_tables
-    FROM `{table_id}`
-    WHERE application_name = @application_name
-    ORDER BY inserted_at DESC
+        SELECT {", ".join(selected)}
+        FROM `{table_id}`
+        WHERE application_name = @application_name{filters}
+        ORDER BY inserted_at DESC, sql_id DESC
+        LIMIT @limit
     """
 
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("application_name", "STRING", application_name)
-        ]
-    )
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
 
     try:
-        query_job = client.query(query, job_config=job_config)
-        results = query_job.result()
-        records = [dict(row) for row in results]
-        print(f"Fetched {len(records)} records from BigQuery.")
-        return records
+        results = run_query(client, query, job_config, "fetch_page")
+        return [dict(row) for row in results]
     except NotFound:
         print(f"Table {table_id} not found. Please create it.")
         return []
@@ -92,22 +204,97 @@ def fetch_from_bq(application_name:str):
         print(f"An error occurred during the BigQuery fetch operation: {e}")
         return []
 
-def fetch_report_data_from_bq(application_name: str) -> list:
-    """Fetches sql_file_name and parser_output_tables for a given application."""
-    print(f"Fetching report data from BigQuery for application: {application_name}...")
+# Schema of the materialized data models table. A version is stored as
+# `chunk_count` rows: its recent_records, state and result are serialized into
+# one JSON payload that is split across the rows, since the graph state of a
+# large application can exceed BigQuery's streaming insert row size limit.
+DATA_MODELS_SCHEMA = [
+    bigquery.SchemaField("application_name", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("version", "INT64", mode="REQUIRED"),
+    bigquery.SchemaField("chunk_index", "INT64", mode="REQUIRED"),
+    bigquery.SchemaField("chunk_count", "INT64", mode="REQUIRED"),
+    bigquery.SchemaField("watermark", "STRING"),
+    bigquery.SchemaField("fingerprint", "STRING"),
+    bigquery.SchemaField("created_at", "TIMESTAMP"),
+    bigquery.SchemaField("payload", "STRING"),
+]
+_DATA_MODEL_PAYLOAD_FIELDS = ("recent_records", "state", "result")
+
+def _data_models_table_id() -> str:
+    config = get_settings()
+    return f"{config.PROJECT_ID}.{config.REA_SQL_EXTRACTS_DATASET}.{config.REA_DATA_MODELS_TABLE}"
+
+def ensure_data_models_table():
+    """Creates the data models table, clustered on application_name and version, if it does not exist."""
+    client = get_bq_client()
+    if not client:
+        raise RuntimeError("BigQuery client not available.")
+    table = bigquery.Table(_data_models_table_id(), schema=DATA_MODELS_SCHEMA)
+    table.clustering_fields = ["application_name", "version"]
+    client.create_table(table, exists_ok=True)
+
+def split_data_model_row(row: dict, chunk_bytes: int) -> list:
+    """Splits a data model version into table rows whose payload is at most `chunk_bytes` long."""
+    # ASCII-only JSON, so characters and bytes are the same
+    payload = json.dumps({field: row.get(field) for field in _DATA_MODEL_PAYLOAD_FIELDS})
+    chunks = [payload[start:start + chunk_bytes] for start in range(0, len(payload), chunk_bytes)]
+    return [
+        {
+            "application_name": row["application_name"],
+            "version": row["version"],
+            "chunk_index": index,
+            "chunk_count": len(chunks),
+            "watermark": row.get("watermark"),
+            "fingerprint": row.get("fingerprint"),
+            "created_at": row.get("created_at"),
+            "payload": chunk,
+        }
+        for index, chunk in enumerate(chunks)
+    ]
+
+def join_data_model_rows(rows: list) -> dict:
+    """Reassembles the rows of one data model version; raises ValueError if chunks are missing."""
+    chunks = {row["chunk_index"]: row for row in rows}
+    first = chunks.get(0)
+    if first is None or sorted(chunks) != list(range(first["chunk_count"])):
+        raise ValueError("Incomplete data model version")
+    payload = json.loads("".join(chunks[index]["payload"] for index in sorted(chunks)))
+    return {
+        "application_name": first["application_name"],
+        "version": first["version"],
+        "watermark": first["watermark"],
+        "fingerprint": first["fingerprint"],
+        "created_at": first["created_at"],
+        **{field: payload.get(field) for field in _DATA_MODEL_PAYLOAD_FIELDS},
+    }
+
+def fetch_latest_data_model_from_bq(application_name: str):
+    """Fetches the newest complete materialized data model of an application, or None."""
     client = get_bq_client()
     if not client:
         print("BigQuery client not available. Skipping fetch.")
-        return []
+        return None
 
-    config = Settings.get_settings()
-    table_id = f"{config.PROJECT_ID}.{config.REA_SQL_EXTRACTS_DATASET}.{config.REA_SQL_EXTRACTS_TABLE}"
+    table_id = _data_models_table_id()
 
+    # Chunks are streamed one request at a time, so skip writes that were cut
+    # short; a retried write of the same version is told apart by its created_at
     query = f"""
-        SELECT sql_file_name, parser_output_tables, parser_output 
-        FROM `{table_id}`
-        WHERE application_name = @application_name
-        ORDER BY sql_file_name
+        WITH latest AS (
+            SELECT version, created_at
+            FROM `{table_id}`
+            WHERE application_name = @application_name
+            GROUP BY version, created_at
+            HAVING COUNT(DISTINCT chunk_index) = MAX(chunk_count)
+            ORDER BY version DESC, created_at DESC
+            LIMIT 1
+        )
+        SELECT t.application_name, t.version, t.chunk_index, t.chunk_count, t.watermark, t.fingerprint,
+               t.created_at, t.payload
+        FROM `{table_id}` AS t
+        JOIN latest USING (version, created_at)
+        WHERE t.application_name = @application_name
+        ORDER BY t.chunk_index
     """
 
     job_config = bigquery.QueryJobConfig(
@@ -117,15 +304,45 @@ def fetch_report_data_from_bq(application_name: str) -> list:
     )
 
     try:
-        query_job = client.query(query, job_config=job_config)
-        results = query_job.result()
-        records = [dict(row) for row in results]
-        print(f"Fetched {len(records)} records for the report.")
-        return records
+        rows = [dict(row) for row in run_query(client, query, job_config, "fetch_data_model")]
+        return join_data_model_rows(rows) if rows else None
+    except NotFound:
+        print(f"Table {table_id} not found. It is created when the first data model is stored.")
+        return None
     except Exception as e:
-        print(f"An error occurred while fetching report data: {e}")
-        return []
+        print(f"An error occurred while fetching the materialized data model: {e}")
+        return None
 
+def insert_data_model_to_bq(row: dict) -> list:
+    """
+    Appends one materialized data model version, split into rows of at most
+    `DATA_MODEL_STATE_CHUNK_BYTES` (see `split_data_model_row`), one streaming
+    insert per row. Returns the per-row errors reported by `insert_rows_json`;
+    raises if a call itself fails.
+    """
+    client = get_bq_client()
+    if not client:
+        raise RuntimeError("BigQuery client not available.")
+
+    config = get_settings()
+    table_id = _data_models_table_id()
+    errors = []
+    started = time.perf_counter()
+    try:
+        for chunk in split_data_model_row(row, config.DATA_MODEL_STATE_CHUNK_BYTES):
+            # The row id lets BigQuery drop a chunk resent by a retried request
+            row_id = f"{chunk['application_name']}:{chunk['version']}:{chunk['created_at']}:{chunk['chunk_index']}"
+            for error in client.insert_rows_json(table_id, [chunk], row_ids=[row_id]) or []:
+                errors.append({**error, "index": chunk["chunk_index"]})
+            if errors:
+                break
+    except Exception:
+        metrics.BQ_JOBS.inc(operation="insert_data_model", outcome="error")
+        raise
+    finally:
+        metrics.BQ_JOB_DURATION.observe(time.perf_counter() - started, operation="insert_data_model")
+    metrics.BQ_JOBS.inc(operation="insert_data_model", outcome="partial_failure" if errors else "success")
+    return errors
 
 def get_completed_sql_files_from_bq(application_name: str) -> list:
     """Fetches distinct sql_file_name for a given application from BigQuery."""
@@ -135,7 +352,7 @@ def get_completed_sql_files_from_bq(application_name: str) -> list:
         print("BigQuery client not available. Skipping fetch.")
         return []
 
-    config = Settings.get_settings()
+    config = get_settings()
     table_id = f"{config.PROJECT_ID}.{config.REA_SQL_EXTRACTS_DATASET}.{config.REA_SQL_EXTRACTS_TABLE}"
 
     query = f"""
@@ -151,10 +368,43 @@ def get_completed_sql_files_from_bq(application_name: str) -> list:
     )
 
     try:
-        query_job = client.query(query, job_config=job_config)
-        completed_files = [row.sql_file_name for row in query_job.result()]
+        completed_files = [row.sql_file_name for row in run_query(client, query, job_config, "list_completed_files")]
         print(f"Found {len(completed_files)} completed files in BigQuery.")
         return completed_files
     except Exception as e:
         print(f"An error occurred while fetching completed files: {e}")
-        return []
\ No newline at end of file
+        return []
+
+def is_sql_file_completed_in_bq(application_name: str, sql_file_name: str) -> Optional[bool]:
+    """
+    Point lookup: checks whether one file has already been analyzed for an
+    application. Returns None when the lookup fails, so it is not cached.
+    """
+    client = get_bq_client()
+    if not client:
+        print("BigQuery client not available. Skipping lookup.")
+        return None
+
+    config = get_settings()
+    table_id = f"{config.PROJECT_ID}.{config.REA_SQL_EXTRACTS_DATASET}.{config.REA_SQL_EXTRACTS_TABLE}"
+
+    query = f"""
+        SELECT 1
+        FROM `{table_id}`
+        WHERE application_name = @application_name AND sql_file_name = @sql_file_name
+        LIMIT 1
+    """
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("application_name", "STRING", application_name),
+            bigquery.ScalarQueryParameter("sql_file_name", "STRING", sql_file_name),
+        ]
+    )
+
+    try:
+        return any(True for _ in run_query(client, query, job_config, "is_file_completed"))
+    except Exception as e:
+        print(f"An error occurred while checking for a completed file: {e}")
+        return None
+
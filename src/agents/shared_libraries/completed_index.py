@@ -0,0 +1,142 @@
+import threading
+import time
+from typing import Callable, Iterable, Optional, Set
+
+
+class CompletedFilesIndex:
+    """
+    In-process index of the (application, sql_file_name) pairs that have
+    already been analyzed.
+
+    A warm application answers lookups, hits and misses alike, from its full
+    file list, loaded with `load_all` and kept for `ttl_seconds`. A lookup on
+    a cold application (never loaded, or expired) does not wait for that
+    scan: it asks `point_lookup` for the one file, caches the answer, positive
+    or negative, for `ttl_seconds`, and starts loading the full list in the
+    background. `get_completed` needs the whole list and loads it in the
+    caller's thread; concurrent loads of one application are shared.
+    Successful inserts are recorded with `mark_completed` so the index stays
+    current in between reloads.
+    """
+
+    def __init__(self, load_all: Callable[[str], Iterable[str]],
+                 point_lookup: Callable[[str, str], Optional[bool]] = None, ttl_seconds: float = 300):
+        self._load_all = load_all
+        self._point_lookup = point_lookup
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # application_name -> (completed file names, loaded_at)
+        self._warm = {}
+        # Files marked completed for applications that are not warm, merged in on load
+        self._known = {}
+        # application_name -> {sql_file_name: (completed, looked_up_at)} for cold applications
+        self._lookups = {}
+        # application_name -> lock held while its file list is being loaded
+        self._loading = {}
+        # Applications whose file list is being loaded in the background
+        self._warming = set()
+
+    def _get_warm(self, application_name: str):
+        entry = self._warm.get(application_name)
+        if entry is None:
+            return None
+        files, loaded_at = entry
+        if time.monotonic() - loaded_at > self.ttl_seconds:
+            del self._warm[application_name]
+            return None
+        return files
+
+    def _get_lookup(self, application_name: str, sql_file_name: str) -> Optional[bool]:
+        entry = self._lookups.get(application_name, {}).get(sql_file_name)
+        if entry is None or time.monotonic() - entry[1] > self.ttl_seconds:
+            return None
+        return entry[0]
+
+    def _warm_up(self, application_name: str) -> Set[str]:
+        """Returns the (live) completed set of an application, loading it if cold."""
+        with self._lock:
+            files = self._get_warm(application_name)
+            if files is not None:
+                return files
+            loading = self._loading.setdefault(application_name, threading.Lock())
+
+        with loading:
+            # Another thread may have loaded it while this one waited
+            with self._lock:
+                files = self._get_warm(application_name)
+                if files is not None:
+                    return files
+            files = set(self._load_all(application_name))
+            with self._lock:
+                files |= self._known.pop(application_name, set())
+                self._warm[application_name] = (files, time.monotonic())
+                self._lookups.pop(application_name, None)
+                self._loading.pop(application_name, None)
+        return files
+
+    def _warm_in_background(self, application_name: str):
+        with self._lock:
+            if application_name in self._warming:
+                return
+            self._warming.add(application_name)
+        threading.Thread(
+            target=self._background_warm, args=(application_name,), name="completed-index-load", daemon=True,
+        ).start()
+
+    def _background_warm(self, application_name: str):
+        try:
+            self._warm_up(application_name)
+        except Exception as e:
+            print(f"Could not load the completed files of '{application_name}': {e}")
+        finally:
+            with self._lock:
+                self._warming.discard(application_name)
+
+    def get_completed(self, application_name: str) -> Set[str]:
+        """Returns the completed file names of an application, loading them if cold."""
+        files = self._warm_up(application_name)
+        with self._lock:
+            return set(files)
+
+    def is_completed(self, application_name: str, sql_file_name: str) -> bool:
+        """Checks a single file: O(1) when warm, a cached or single-row lookup when cold."""
+        with self._lock:
+            files = self._get_warm(application_name)
+            if files is not None:
+                return sql_file_name in files
+            if sql_file_name in self._known.get(application_name, ()):
+                return True
+            cached = self._get_lookup(application_name, sql_file_name)
+            if cached is not None:
+                return cached
+
+        if self._point_lookup is None:
+            return sql_file_name in self._warm_up(application_name)
+        self._warm_in_background(application_name)
+        completed = self._point_lookup(application_name, sql_file_name)
+        if completed is None:
+            # The lookup failed: answer "not completed" without caching it
+            return False
+        with self._lock:
+            if self._get_warm(application_name) is None:
+                self._lookups.setdefault(application_name, {})[sql_file_name] = (completed, time.monotonic())
+        return completed
+
+    def mark_completed(self, application_name: str, sql_file_name: str):
+        with self._lock:
+            files = self._get_warm(application_name)
+            if files is not None:
+                files.add(sql_file_name)
+            else:
+                self._known.setdefault(application_name, set()).add(sql_file_name)
+
+    def invalidate(self, application_name: str = None):
+        with self._lock:
+            if application_name is None:
+                self._warm.clear()
+                self._known.clear()
+                self._lookups.clear()
+            else:
+                self._warm.pop(application_name, None)
+                self._known.pop(application_name, None)
+                self._lookups.pop(application_name, None)
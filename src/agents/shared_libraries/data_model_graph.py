@@ -0,0 +1,351 @@
+"""
+Deterministic consolidation of an application's `parser_output`s into a
+single data model graph.
+
+Every record contributes its entities (nodes), its join relationships
+(undirected edges) and its data flows (directed lineage edges, source to
+target). Entity names are normalized before they are merged: quotes and
+brackets are dropped, names are upper-cased and, by default, the database
+prefix is removed, so `"Prod_DB"."Customer"`, `prod_db.CUSTOMER` and
+`CUSTOMER` are the same node. Duplicate edges are merged and counted.
+
+Audit, log, error and work tables are filtered out when the graph is
+rendered (`to_dict`), by name pattern. Lineage that runs through a filtered
+table (`SRC -> WK_STAGE -> TGT`) is kept as a direct `SRC -> TGT` edge.
+The graph keeps everything it was given, so its `state()` can be stored and
+extended later without re-reading the records it already contains.
+"""
+import fnmatch
+import re
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+DEFAULT_EXCLUDE_PATTERNS = ("_LOG", "_AUDIT", "_ERR", "_TMP", "WK_")
+
+# When records classify the same table differently, the stronger type wins
+_ENTITY_TYPE_PRECEDENCE = {"WORK_TABLE": 3, "TARGET_TABLE": 2, "SOURCE_TABLE": 1}
+_QUOTE_PATTERN = re.compile(r'["`\[\]]')
+# Excluded tables named in a bridged lineage edge's `transformation`
+_MAX_VIA_SHOWN = 3
+
+
+def normalize_entity_name(name, strip_database: bool = True) -> str:
+    """`"Prod_DB"."Customer"` -> `CUSTOMER` (or `PROD_DB.CUSTOMER` when `strip_database` is False)."""
+    parts = [_QUOTE_PATTERN.sub("", part).strip().upper() for part in str(name or "").split(".")]
+    parts = [part for part in parts if part]
+    if not parts:
+        return ""
+    return parts[-1] if strip_database else ".".join(parts)
+
+
+def _database_of(name) -> str:
+    parts = [_QUOTE_PATTERN.sub("", part).strip().upper() for part in str(name or "").split(".")]
+    parts = [part for part in parts if part]
+    return ".".join(parts[:-1])
+
+
+def matches_exclude_pattern(name: str, patterns: Sequence[str]) -> bool:
+    """
+    Whether a table name matches one of the exclusion patterns. Patterns
+    with `*`, `?` or `[` are globs on the bare table name; any other pattern
+    is a sequence of underscore-separated words that must appear as whole
+    words in the name: `_LOG` matches `ETL_LOG` and `LOG_DETAIL` but not
+    `CATALOG` or `SALES_LOGISTICS`, and `WK_` matches `WK_ORDERS`.
+    """
+    bare = str(name or "").split(".")[-1].upper()
+    words = bare.split("_")
+    for pattern in patterns:
+        pattern = str(pattern).upper()
+        if any(char in pattern for char in "*?["):
+            if fnmatch.fnmatchcase(bare, pattern):
+                return True
+            continue
+        needle = [word for word in pattern.split("_") if word]
+        if needle and any(words[i:i + len(needle)] == needle for i in range(len(words) - len(needle) + 1)):
+            return True
+    return False
+
+
+# Fields of a `parser_output` that must be lists of objects, and the list fields of those objects
+_LIST_FIELDS = {
+    "entities": ("attributes",),
+    "relationships": ("join_conditions",),
+    "data_flows": ("source_entities",),
+}
+_NAME_FIELDS = ("entity_name", "left_entity", "right_entity", "target_entity")
+
+
+def check_parser_output(parser_output: dict):
+    """
+    Raises ValueError when a `parser_output` does not have the shape the
+    graph merges, e.g. entities given as bare strings or `source_entities`
+    as one string, which would otherwise be merged character by character.
+    """
+    for field, list_fields in _LIST_FIELDS.items():
+        items = parser_output.get(field)
+        if items is None:
+            continue
+        if not isinstance(items, list):
+            raise ValueError(f"parser_output.{field} is not a list")
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                raise ValueError(f"parser_output.{field}[{index}] is not an object")
+            for list_field in list_fields:
+                if item.get(list_field) is not None and not isinstance(item[list_field], list):
+                    raise ValueError(f"parser_output.{field}[{index}].{list_field} is not a list")
+            for name_field in _NAME_FIELDS:
+                if item.get(name_field) is not None and not isinstance(item[name_field], str):
+                    raise ValueError(f"parser_output.{field}[{index}].{name_field} is not a string")
+            # Merged into edges that are joined into text when the model is rendered
+            for list_field, element_field in (("source_entities", "data_flows"), ("join_conditions", "relationships")):
+                if field == element_field and any(not isinstance(value, str) for value in item.get(list_field) or []):
+                    raise ValueError(f"parser_output.{field}[{index}].{list_field} has a non-string entry")
+
+
+class DataModelGraph:
+    """
+    Union of entities, relationships and lineage across many `parser_output`s.
+
+    Add records with `add_parser_output`, then render the filtered, merged
+    model with `to_dict`. `state()` / `from_state()` round-trip the unfiltered
+    graph through JSON.
+    """
+
+    def __init__(self, exclude_patterns: Sequence[str] = DEFAULT_EXCLUDE_PATTERNS, strip_database: bool = True):
+        self.exclude_patterns = tuple(exclude_patterns)
+        self.strip_database = strip_database
+        self.records = 0
+        # name -> {"entity_type", "attributes": {UPPER: name}, "databases": set, "sql_files": set}
+        self._entities: Dict[str, dict] = {}
+        # (type, left, right) with left <= right -> {"join_conditions": list, "occurrences"}
+        self._relationships: Dict[Tuple[str, str, str], dict] = {}
+        # (source, target) -> {"operations": list, "occurrences"}
+        self._lineage: Dict[Tuple[str, str], dict] = {}
+        self._names: Dict[str, Tuple[str, str]] = {}
+
+    # ---------- building ----------
+
+    def _normalize(self, name) -> str:
+        return normalize_entity_name(name, self.strip_database)
+
+    def _entity(self, raw_name, sql_file: str = "") -> str:
+        # The same few hundred raw names repeat across thousands of records
+        normalized = self._names.get(raw_name)
+        if normalized is None:
+            normalized = self._names[raw_name] = (self._normalize(raw_name), _database_of(raw_name))
+        name, database = normalized
+        if not name:
+            return ""
+        entity = self._entities.get(name)
+        if entity is None:
+            entity = self._entities[name] = {"entity_type": "", "attributes": {}, "databases": set(), "sql_files": set()}
+        if database and self.strip_database:
+            entity["databases"].add(database)
+        if sql_file:
+            entity["sql_files"].add(sql_file)
+        return name
+
+    def add_parser_output(self, parser_output: dict, sql_file: str = ""):
+        """
+        Merges one record's `parser_output` into the graph. A malformed
+        record raises ValueError (see `check_parser_output`) before anything
+        is merged.
+        """
+        check_parser_output(parser_output)
+        self.records += 1
+        for raw in parser_output.get("entities") or []:
+            name = self._entity(raw.get("entity_name"), sql_file)
+            if not name:
+                continue
+            entity = self._entities[name]
+            entity_type = raw.get("entity_type") or ""
+            if _ENTITY_TYPE_PRECEDENCE.get(entity_type, 0) > _ENTITY_TYPE_PRECEDENCE.get(entity["entity_type"], 0):
+                entity["entity_type"] = entity_type
+            for attribute in raw.get("attributes") or []:
+                attribute_name = attribute.get("attribute_name") if isinstance(attribute, dict) else attribute
+                if attribute_name:
+                    entity["attributes"].setdefault(str(attribute_name).upper(), str(attribute_name))
+
+        for raw in parser_output.get("relationships") or []:
+            left = self._entity(raw.get("left_entity"), sql_file)
+            right = self._entity(raw.get("right_entity"), sql_file)
+            if not left or not right:
+                continue
+            left, right = sorted((left, right))
+            key = (str(raw.get("type") or "JOIN").upper(), left, right)
+            edge = self._relationships.get(key)
+            if edge is None:
+                edge = self._relationships[key] = {"join_conditions": [], "occurrences": 0}
+            edge["occurrences"] += 1
+            for condition in raw.get("join_conditions") or []:
+                if condition not in edge["join_conditions"]:
+                    edge["join_conditions"].append(condition)
+
+        for flow in parser_output.get("data_flows") or []:
+            target = self._entity(flow.get("target_entity"), sql_file)
+            if not target:
+                continue
+            if not self._entities[target]["entity_type"]:
+                self._entities[target]["entity_type"] = "TARGET_TABLE"
+            operation = str(flow.get("operation_type") or "").upper()
+            for raw_source in flow.get("source_entities") or []:
+                source = self._entity(raw_source, sql_file)
+                if not source or source == target:
+                    continue
+                edge = self._lineage.get((source, target))
+                if edge is None:
+                    edge = self._lineage[(source, target)] = {"operations": [], "occurrences": 0}
+                edge["occurrences"] += 1
+                if operation and operation not in edge["operations"]:
+                    edge["operations"].append(operation)
+
+    def add_records(self, records: Iterable[dict]):
+        """Adds storage records (`parser_output` as a dict, plus `sql_file_name`)."""
+        for record in records:
+            self.add_parser_output(record["parser_output"], record.get("sql_file_name") or "")
+
+    # ---------- rendering ----------
+
+    def is_excluded(self, name: str) -> bool:
+        return matches_exclude_pattern(name, self.exclude_patterns)
+
+    def _reachable_kept(self, node: str, outgoing: Dict[str, List[str]], excluded: set) -> Dict[str, List[str]]:
+        """Kept entities reachable from an excluded one through excluded tables only, with the tables passed."""
+        reached = {}
+        stack, seen = [(node, [node])], {node}
+        while stack:
+            current, path = stack.pop()
+            for successor in outgoing.get(current, []):
+                if successor in seen:
+                    continue
+                seen.add(successor)
+                if successor in excluded:
+                    stack.append((successor, path + [successor]))
+                else:
+                    reached[successor] = path
+        return reached
+
+    def _bridged_lineage(self, excluded: set) -> Dict[Tuple[str, str], dict]:
+        """Lineage between kept entities, with paths through excluded tables collapsed to direct edges."""
+        outgoing: Dict[str, List[str]] = {}
+        for source, target in self._lineage:
+            outgoing.setdefault(source, []).append(target)
+        reachable = {}
+
+        edges = {}
+
+        def merge(source: str, target: str, edge: dict, via: List[str]):
+            merged = edges.get((source, target))
+            if merged is None:
+                merged = edges[(source, target)] = {"operations": set(), "occurrences": 0, "via": set()}
+            merged["occurrences"] += edge["occurrences"]
+            merged["operations"].update(edge["operations"])
+            merged["via"].update(via)
+
+        for (source, target), edge in self._lineage.items():
+            if source in excluded:
+                continue
+            if target not in excluded:
+                merge(source, target, edge, [])
+                continue
+            if target not in reachable:
+                reachable[target] = self._reachable_kept(target, outgoing, excluded)
+            for successor, path in reachable[target].items():
+                if successor != source:
+                    merge(source, successor, edge, path)
+        return edges
+
+    def to_dict(self) -> dict:
+        """
+        The consolidated model: `entities` (`name`, `entity_type`,
+        `attributes`, `databases`, `sql_files`), `relationships` (`from`,
+        `to`, `type`, `details`, `join_conditions`, `occurrences`) and
+        `lineage` (`source`, `target`, `transformation`, `occurrences`),
+        sorted by name, plus the `excluded_entities`.
+        """
+        excluded = {name for name in self._entities if self.is_excluded(name)}
+
+        relationships = []
+        for (rel_type, left, right), edge in sorted(self._relationships.items()):
+            if left in excluded or right in excluded:
+                continue
+            relationships.append({
+                "from": left,
+                "to": right,
+                "type": rel_type,
+                "details": "; ".join(map(str, edge["join_conditions"])),
+                "join_conditions": list(edge["join_conditions"]),
+                "occurrences": edge["occurrences"],
+            })
+
+        lineage = []
+        for (source, target), edge in sorted(self._bridged_lineage(excluded).items()):
+            transformation = ", ".join(sorted(edge["operations"])) or "LINEAGE"
+            via = sorted(edge["via"])
+            if via:
+                transformation += f" via {', '.join(via[:_MAX_VIA_SHOWN])}"
+                if len(via) > _MAX_VIA_SHOWN:
+                    transformation += f" and {len(via) - _MAX_VIA_SHOWN} more"
+            lineage.append({
+                "source": source,
+                "target": target,
+                "transformation": transformation,
+                "occurrences": edge["occurrences"],
+            })
+
+        entities = []
+        for name, entity in sorted(self._entities.items()):
+            if name in excluded:
+                continue
+            entities.append({
+                "name": name,
+                "entity_type": entity["entity_type"] or "SOURCE_TABLE",
+                "attributes": sorted(entity["attributes"].values(), key=str.upper),
+                "databases": sorted(entity["databases"]),
+                "sql_files": sorted(entity["sql_files"]),
+            })
+
+        return {
+            "entities": entities,
+            "relationships": relationships,
+            "lineage": lineage,
+            "excluded_entities": sorted(excluded),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "records": self.records,
+            "entities": len(self._entities),
+            "relationships": len(self._relationships),
+            "lineage": len(self._lineage),
+            "duplicate_edges_merged": sum(edge["occurrences"] - 1 for edge in self._relationships.values())
+            + sum(edge["occurrences"] - 1 for edge in self._lineage.values()),
+        }
+
+    # ---------- persistence ----------
+
+    def state(self) -> dict:
+        """JSON-serializable snapshot of the unfiltered graph (see `from_state`)."""
+        return {
+            "strip_database": self.strip_database,
+            "records": self.records,
+            "entities": {
+                name: {**entity, "databases": sorted(entity["databases"]), "sql_files": sorted(entity["sql_files"])}
+                for name, entity in self._entities.items()
+            },
+            "relationships": [[list(key), edge] for key, edge in self._relationships.items()],
+            "lineage": [[list(key), edge] for key, edge in self._lineage.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict, exclude_patterns: Sequence[str] = DEFAULT_EXCLUDE_PATTERNS) -> "DataModelGraph":
+        graph = cls(exclude_patterns, strip_database=state.get("strip_database", True))
+        graph.records = state.get("records", 0)
+        for name, entity in (state.get("entities") or {}).items():
+            graph._entities[name] = {
+                **entity, "databases": set(entity["databases"]), "sql_files": set(entity["sql_files"]),
+            }
+        for key, edge in state.get("relationships") or []:
+            graph._relationships[tuple(key)] = edge
+        for key, edge in state.get("lineage") or []:
+            graph._lineage[tuple(key)] = edge
+        return graph
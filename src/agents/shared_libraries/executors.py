@@ -0,0 +1,79 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.agents.shared_libraries.resources import get_settings
+
+
+class EndpointPool:
+    """
+    A bounded pool for one class of API work.
+
+    Blocking calls (BigQuery jobs, openpyxl writing, synchronous SDK calls) are
+    offloaded to a dedicated `ThreadPoolExecutor` so they never run on the
+    event loop, and `limit()` bounds natively async work to the same
+    concurrency. Each endpoint gets its own pool so a burst of slow analyses
+    cannot starve cheap reads.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._semaphore = None
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs a blocking callable in this pool and awaits its result."""
+        loop = asyncio.get_running_loop()
+        # Carry context variables (e.g. request labels) into the worker thread
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, functools.partial(ctx.run, fn, *args, **kwargs))
+
+    def limit(self) -> asyncio.Semaphore:
+        """Returns the semaphore bounding natively async work in this pool."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        return self._semaphore
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+def submit_with_context(executor, fn, *args, **kwargs):
+    """`executor.submit` that runs `fn` in a copy of the caller's context (e.g. request metric labels)."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str) -> EndpointPool:
+    """
+    Returns the named pool, creating it on first use. Pool sizes come from
+    the settings (`ANALYZE_MAX_CONCURRENCY`, `READ_MAX_CONCURRENCY`,
+    `REPORT_MAX_CONCURRENCY`, `DATA_MODEL_MAX_CONCURRENCY`).
+
+    When a config reload changes the size, a new pool replaces the old one.
+    The old pool is not shut down: callers still holding it (e.g. a
+    streaming response) keep using it, and its threads exit once it is
+    collected.
+    """
+    max_workers = getattr(get_settings(), f"{name.upper()}_MAX_CONCURRENCY")
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None or pool.max_workers != max_workers:
+            pool = EndpointPool(name, max_workers)
+            _pools[name] = pool
+    return pool
+
+
+def shutdown_pools(wait: bool = True):
+    """Shuts down every pool; called on application shutdown."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait)
@@ -0,0 +1,338 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Upper bound of the wait between retries while the database keeps failing
+_MAX_BACKOFF_SECONDS = 30.0
+
+
+def sqlite_path_from_url(db_url: str) -> str:
+    """Converts a SQLAlchemy-style URL such as `sqlite:///./sessions.db` into a file path."""
+    prefix = "sqlite:///"
+    if db_url.startswith(prefix):
+        return db_url[len(prefix):]
+    return db_url
+
+
+class JobContext:
+    """Handed to job handlers so they can report progress and checkpoint per-item results."""
+
+    def __init__(self, queue: "JobQueue", job_id: str):
+        self._queue = queue
+        self.job_id = job_id
+
+    def report_progress(self, done: int, total: int, message: str = ""):
+        self._queue._update(self.job_id, progress=json.dumps({"done": done, "total": total, "message": message}))
+
+    def completed_items(self) -> Dict[int, dict]:
+        """Returns the per-item results already checkpointed, e.g. before a restart."""
+        return self._queue._get_items(self.job_id)
+
+    def record_item(self, item_index: int, result: dict):
+        """Checkpoints the result of one item so it is not redone when the job resumes."""
+        self._queue._record_item(self.job_id, item_index, result)
+
+
+class JobQueue:
+    """
+    Durable background job queue backed by a local SQLite file.
+
+    Jobs are persisted on submit and executed by a pool of worker threads.
+    Handlers are registered per job kind and receive the job payload plus a
+    `JobContext` for progress reporting and per-item checkpoints.
+
+    Several processes may share the database. A job is claimed with a
+    conditional update, so only one worker runs it, and held under a lease
+    that the owning queue renews every `lease_seconds / 3`. Jobs whose lease
+    expired (their process stopped or crashed) are re-queued and resume from
+    their last checkpoint, until they have been attempted `max_attempts`
+    times; then they are marked failed.
+    """
+
+    def __init__(self, db_path: str, handlers: Dict[str, Callable], num_workers: int = 2,
+                 poll_interval: float = 1.0, lease_seconds: float = 60.0, max_attempts: int = 3):
+        self.db_path = db_path
+        self.handlers = handlers
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Identifies this queue's leases among the processes sharing the database
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._workers = []
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                item_index INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (job_id, item_index)
+            );
+            """
+        )
+        # Lease columns, added in place to databases created before them
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for name, column_type in (("owner", "TEXT"), ("lease_expires_at", "REAL")):
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+        self._conn.commit()
+
+    # ---------- Public API ----------
+
+    def submit(self, kind: str, payload: dict) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, kind, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(payload), now, now),
+            )
+            self._conn.commit()
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, kind, status, progress, result, error, attempts, created_at, updated_at "
+                "FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "progress": json.loads(row[3]) if row[3] else None,
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "attempts": row[6],
+            "created_at": row[7],
+            "updated_at": row[8],
+        }
+
+    def start(self):
+        """
+        Re-queues jobs interrupted by a previous shutdown (this queue's own
+        and those whose lease expired) and starts the workers and the lease
+        heartbeat.
+        """
+        if self._workers:
+            return
+        self._stopping.clear()
+        resumed = self._requeue_abandoned(include_own=True)
+        if resumed:
+            print(f"Resuming {resumed} interrupted job(s).")
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-lease-heartbeat", daemon=True)
+        heartbeat.start()
+        self._workers.append(heartbeat)
+
+    def stop(self, timeout: float = None):
+        """
+        Stops the workers. Jobs still running are left in the `running` state
+        and are resumed by the next `start()`, or by another process once
+        their lease expires.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    # ---------- Internals ----------
+
+    def _requeue_abandoned(self, include_own: bool = False) -> int:
+        """
+        Re-queues running jobs whose lease expired (and, with `include_own`,
+        those leased by this queue), or fails them once they have used up
+        `max_attempts`. Returns the number of jobs re-queued.
+        """
+        now = time.time()
+        stale = "status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?"
+        params = [RUNNING, now]
+        if include_own:
+            stale += " OR owner = ?"
+            params.append(self.owner)
+        stale += ")"
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET status = ?, error = ?, owner = NULL, lease_expires_at = NULL, updated_at = ? "
+                f"WHERE {stale} AND attempts >= ?",
+                (FAILED, f"Abandoned after {self.max_attempts} attempt(s): the worker running it stopped.", now,
+                 *params, self.max_attempts),
+            )
+            resumed = self._conn.execute(
+                f"UPDATE jobs SET status = ?, owner = NULL, lease_expires_at = NULL, updated_at = ? WHERE {stale}",
+                (QUEUED, now, *params),
+            ).rowcount
+            self._conn.commit()
+        return resumed
+
+    def _claim_next(self) -> Optional[tuple]:
+        if self._requeue_abandoned():
+            print("Re-queued job(s) whose worker lease expired.")
+        while True:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT job_id, kind, payload FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                # Only one worker (of any process) wins the queued -> running transition
+                claimed = self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, owner = ?, lease_expires_at = ?, "
+                    "updated_at = ? WHERE job_id = ? AND status = ?",
+                    (RUNNING, self.owner, now + self.lease_seconds, now, row[0], QUEUED),
+                ).rowcount
+                self._conn.commit()
+            if claimed:
+                return row
+
+    def _heartbeat_loop(self):
+        """Renews the leases of the jobs this queue is running."""
+        while not self._stopping.wait(self.lease_seconds / 3):
+            try:
+                now = time.time()
+                with self._lock:
+                    self._conn.execute(
+                        "UPDATE jobs SET lease_expires_at = ? WHERE owner = ? AND status = ?",
+                        (now + self.lease_seconds, self.owner, RUNNING),
+                    )
+                    self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Could not renew job leases: {e}")
+
+    def _worker_loop(self):
+        failures = 0
+        while not self._stopping.is_set():
+            try:
+                claimed = self._claim_next()
+            except sqlite3.Error as e:
+                failures += 1
+                print(f"Could not claim a job: {e}")
+                self._backoff(failures)
+                continue
+            failures = 0
+            if claimed is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id, kind, payload = claimed
+            try:
+                result = self.handlers[kind](json.loads(payload), JobContext(self, job_id))
+                outcome = {"status": SUCCEEDED, "result": json.dumps(result)}
+            except Exception as e:
+                print(f"Job {job_id} ({kind}) failed: {e}")
+                traceback.print_exc()
+                outcome = {"status": FAILED, "error": str(e)}
+            self._record_outcome(job_id, outcome)
+
+    def _record_outcome(self, job_id: str, outcome: dict):
+        """
+        Retries `_finish` until the outcome is stored. If the queue stops
+        first, the job stays leased by this queue and is resumed by the next
+        `start()`.
+        """
+        failures = 0
+        while True:
+            try:
+                self._finish(job_id, **outcome)
+                return
+            except sqlite3.Error as e:
+                failures += 1
+                print(f"Could not record the outcome of job {job_id}: {e}")
+                if self._stopping.is_set():
+                    return
+                self._backoff(failures)
+
+    def _backoff(self, failures: int):
+        """Waits after a database error, doubling the poll interval per consecutive failure."""
+        self._rollback()
+        self._stopping.wait(min(self.poll_interval * 2 ** (failures - 1), _MAX_BACKOFF_SECONDS))
+
+    def _rollback(self):
+        # Releases the write lock of a transaction interrupted by the error
+        try:
+            with self._lock:
+                self._conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _finish(self, job_id: str, **fields):
+        """Records a job's outcome, unless its lease was lost and another worker took it over."""
+        fields.update(owner=None, lease_expires_at=None, updated_at=time.time())
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            updated = self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ? AND owner = ?",
+                (*fields.values(), job_id, self.owner),
+            ).rowcount
+            self._conn.commit()
+        if not updated:
+            print(f"Job {job_id} finished after its lease was taken over; its outcome was not recorded.")
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id)
+            )
+            self._conn.commit()
+
+    def _get_items(self, job_id: str) -> Dict[int, dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT item_index, result FROM job_items WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {index: json.loads(result) for index, result in rows}
+
+    def _record_item(self, job_id: str, item_index: int, result: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_items (job_id, item_index, result) VALUES (?, ?, ?)",
+                (job_id, item_index, json.dumps(result)),
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+            self._conn.commit()
@@ -0,0 +1,534 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from src.agents.shared_libraries import metrics
+from src.agents.shared_libraries.adaptive_limiter import IGNORE, OVERLOAD, SUCCESS, AdaptiveConcurrencyLimiter
+from src.agents.shared_libraries.resources import get_generative_model, get_settings, on_reload
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used when the provider reports none."""
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+@dataclass
+class LLMResponse:
+    """Text and usage of a single generation."""
+    text: str
+    model_name: str
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    finish_reason: str = ""
+    latency_seconds: float = 0.0
+
+
+class LLMError(Exception):
+    """A failed generation. `status_code` mirrors the HTTP status where one is known."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RateLimitError(LLMError):
+    """Quota exhausted (HTTP 429)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message, status_code=429, retry_after=retry_after)
+
+
+class LLMClient(ABC):
+    """Provider-neutral interface used by the analysis and data model tools."""
+
+    model_name: str
+
+    @abstractmethod
+    def generate(self, prompt: str, generation_config: dict = None, safety_settings: list = None) -> LLMResponse:
+        """Generates a response for a single prompt."""
+
+    async def generate_async(self, prompt: str, generation_config: dict = None,
+                             safety_settings: list = None) -> LLMResponse:
+        """Async variant; providers without a native async client run `generate` in a thread."""
+        return await asyncio.to_thread(self.generate, prompt, generation_config, safety_settings)
+
+    def count_tokens(self, text: str) -> int:
+        return estimate_tokens(text)
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    """The server's retry delay hint (google.rpc.RetryInfo), if the error carries one."""
+    for detail in getattr(e, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return getattr(delay, "seconds", 0) + getattr(delay, "nanos", 0) / 1e9
+    return None
+
+
+def _to_llm_error(e: Exception) -> LLMError:
+    if isinstance(e, google_exceptions.ResourceExhausted):
+        return RateLimitError(str(e), retry_after=_retry_after(e))
+    if isinstance(e, google_exceptions.GoogleAPICallError):
+        return LLMError(str(e), status_code=e.code, retry_after=_retry_after(e))
+    return LLMError(str(e))
+
+
+class VertexLLMClient(LLMClient):
+    """Gemini on Vertex AI, using the shared model handles from `resources`."""
+
+    def __init__(self, model_name: str, system_instruction: str = None):
+        self.model_name = model_name
+        self._model = get_generative_model(model_name, system_instruction)
+
+    def _to_response(self, response, latency_seconds: float, prompt: str) -> LLMResponse:
+        text = response.text
+        usage = getattr(response, "usage_metadata", None)
+        finish_reason = ""
+        if response.candidates:
+            finish_reason = getattr(response.candidates[0].finish_reason, "name", str(response.candidates[0].finish_reason))
+        return LLMResponse(
+            text=text,
+            model_name=self.model_name,
+            prompt_tokens=getattr(usage, "prompt_token_count", 0) or estimate_tokens(prompt),
+            output_tokens=getattr(usage, "candidates_token_count", 0) or estimate_tokens(text),
+            finish_reason=finish_reason,
+            latency_seconds=latency_seconds,
+        )
+
+    def generate(self, prompt: str, generation_config: dict = None, safety_settings: list = None) -> LLMResponse:
+        started = time.perf_counter()
+        try:
+            response = self._model.generate_content(
+                [prompt], generation_config=generation_config, safety_settings=safety_settings, stream=False
+            )
+            return self._to_response(response, time.perf_counter() - started, prompt)
+        except google_exceptions.GoogleAPICallError as e:
+            raise _to_llm_error(e) from e
+
+    async def generate_async(self, prompt: str, generation_config: dict = None,
+                             safety_settings: list = None) -> LLMResponse:
+        started = time.perf_counter()
+        try:
+            response = await self._model.generate_content_async(
+                [prompt], generation_config=generation_config, safety_settings=safety_settings, stream=False
+            )
+            return self._to_response(response, time.perf_counter() - started, prompt)
+        except google_exceptions.GoogleAPICallError as e:
+            raise _to_llm_error(e) from e
+
+
+_TABLE_PATTERN = re.compile(
+    r"\b(?:FROM|JOIN|INTO|UPDATE|TABLE)\s+([A-Za-z_][\w$]*(?:\.[A-Za-z_][\w$]*)?)", re.IGNORECASE
+)
+_TARGET_PATTERN = re.compile(
+    r"\b(INSERT\s+INTO|UPDATE)\s+([A-Za-z_][\w$]*(?:\.[A-Za-z_][\w$]*)?)", re.IGNORECASE
+)
+_SQL_BLOCK_PATTERN = re.compile(r"```sql(.*?)```", re.DOTALL)
+_ENTITY_NAME_PATTERN = re.compile(r'"name":\s*"([^"]+)"')
+_SQL_KEYWORDS = {"SELECT", "SET", "WHERE", "VALUES", "AS", "ON"}
+
+
+def fake_extraction_json(sql: str) -> dict:
+    """Builds a plausible `parser_output` from the table names found in a SQL script."""
+    tables = []
+    for name in _TABLE_PATTERN.findall(sql):
+        if name.upper() not in _SQL_KEYWORDS and name not in tables:
+            tables.append(name)
+    targets = []
+    data_flows = []
+    for operation, target in _TARGET_PATTERN.findall(sql):
+        operation_type = "UPDATE" if operation.upper() == "UPDATE" else "INSERT"
+        targets.append(target)
+        data_flows.append({
+            "flow_description": f"{operation_type} into {target}.",
+            "operation_type": operation_type,
+            "target_entity": target,
+            "source_entities": [t for t in tables if t != target],
+            "attribute_mappings": [],
+        })
+
+    def entity_type(name):
+        if name.split(".")[-1].upper().startswith("WK_"):
+            return "WORK_TABLE"
+        return "TARGET_TABLE" if name in targets else "SOURCE_TABLE"
+
+    sources = [t for t in tables if t not in targets]
+    return {
+        "job_metadata": {"job_name": "Synthetic Job", "version": "v1", "default_database": "",
+                         "functional_overview": "Generated by the fake LLM client."},
+        "entities": [
+            {"entity_name": name, "entity_type": entity_type(name), "creation_source": "Inferred from DML",
+             "primary_key": [], "attributes": []}
+            for name in tables
+        ],
+        "relationships": [
+            {"type": "INNER", "left_entity": left, "right_entity": right, "join_conditions": []}
+            for left, right in zip(sources, sources[1:])
+        ],
+        "data_flows": data_flows,
+    }
+
+
+def fake_response_text(prompt: str, generation_config: dict = None) -> str:
+    """
+    Template-generated response for the prompts used in this repo: the JSON
+    extraction, the Markdown report and the consolidated data model.
+    """
+    sql_blocks = _SQL_BLOCK_PATTERN.findall(prompt)
+    if sql_blocks:
+        parser_output = fake_extraction_json(sql_blocks[-1])
+        wants_json = (generation_config or {}).get("response_mime_type") == "application/json"
+        if wants_json or "machine-readable JSON" in prompt:
+            return "```json\n" + json.dumps(parser_output, indent=2) + "\n```"
+        lines = ["# Data Lineage Report: Synthetic Job", "", "## 2\\. Schema Overview", ""]
+        lines += [f"  - **`{e['entity_name']}`** (Type: {e['entity_type']})" for e in parser_output["entities"]]
+        return "\n".join(lines)
+
+    # Data model prompt: only the entities of the input, not the example output
+    input_json = prompt.rsplit("Input JSON:", 1)[-1]
+    names = list(dict.fromkeys(_ENTITY_NAME_PATTERN.findall(input_json)))
+    return json.dumps({
+        "entities": [{"name": name} for name in names],
+        "relationships": [{"from": a, "to": b, "type": "JOIN", "details": ""} for a, b in zip(names, names[1:])],
+    })
+
+
+class FakeLLMClient(LLMClient):
+    """
+    Deterministic, offline stand-in for a hosted model, for throughput and
+    load testing. Responses come from `responder` (or the template generator
+    above); `latency`/`latency_jitter` simulate the round trip;
+    `failure_rate` and `rate_limit_rate` inject 500 and 429 errors, and
+    `quota_concurrency` rejects calls beyond that many in flight with a 429
+    (a quota ceiling); token counts are estimated unless `output_tokens` is
+    fixed. With a `seed`, latencies and injected failures are reproducible.
+    """
+
+    def __init__(self, model_name: str = "fake-model", latency: float = 0.0, latency_jitter: float = 0.0,
+                 failure_rate: float = 0.0, rate_limit_rate: float = 0.0, output_tokens: int = None,
+                 seed: int = None, responder: Callable[[str, dict], str] = None, quota_concurrency: int = 0):
+        self.model_name = model_name
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.output_tokens = output_tokens
+        self.responder = responder or fake_response_text
+        self.quota_concurrency = quota_concurrency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.calls = 0
+        self.quota_rejections = 0
+        self.prompt_tokens_total = 0
+        self.output_tokens_total = 0
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.latency_jitter)
+            roll = self._random.random()
+            if self.quota_concurrency and self._in_flight >= self.quota_concurrency:
+                self.quota_rejections += 1
+                raise RateLimitError("Fake quota exceeded", retry_after=None)
+            self._in_flight += 1
+        return delay, roll
+
+    def _done(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _respond(self, prompt: str, generation_config: dict, delay: float, roll: float) -> LLMResponse:
+        if roll < self.rate_limit_rate:
+            raise RateLimitError("Fake quota exhausted", retry_after=delay or None)
+        if roll < self.rate_limit_rate + self.failure_rate:
+            raise LLMError("Fake internal error", status_code=500)
+        text = self.responder(prompt, generation_config)
+        response = LLMResponse(
+            text=text,
+            model_name=self.model_name,
+            prompt_tokens=estimate_tokens(prompt),
+            output_tokens=self.output_tokens if self.output_tokens is not None else estimate_tokens(text),
+            finish_reason="STOP",
+            latency_seconds=delay,
+        )
+        with self._lock:
+            self.prompt_tokens_total += response.prompt_tokens
+            self.output_tokens_total += response.output_tokens
+        return response
+
+    def generate(self, prompt: str, generation_config: dict = None, safety_settings: list = None) -> LLMResponse:
+        delay, roll = self._draw()
+        try:
+            if delay:
+                time.sleep(delay)
+            return self._respond(prompt, generation_config, delay, roll)
+        finally:
+            self._done()
+
+    async def generate_async(self, prompt: str, generation_config: dict = None,
+                             safety_settings: list = None) -> LLMResponse:
+        delay, roll = self._draw()
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            return self._respond(prompt, generation_config, delay, roll)
+        finally:
+            self._done()
+
+
+def _error_outcome(e: BaseException) -> str:
+    if isinstance(e, RateLimitError):
+        return "rate_limited"
+    if isinstance(e, asyncio.CancelledError):
+        return "cancelled"
+    return "error"
+
+
+class InstrumentedLLMClient(LLMClient):
+    """
+    Wraps a client and records every call in `metrics`: outcome, latency,
+    prompt and output tokens, and finish reason, labeled by model and by the
+    endpoint and application of the current request.
+    """
+
+    def __init__(self, client: LLMClient):
+        self.client = client
+        self.model_name = client.model_name
+
+    def _record_success(self, response: LLMResponse, latency_seconds: float):
+        model = response.model_name or self.model_name
+        metrics.LLM_REQUESTS.inc(model=model, outcome="success")
+        metrics.LLM_REQUEST_DURATION.observe(latency_seconds, model=model)
+        metrics.LLM_PROMPT_TOKENS.inc(response.prompt_tokens, model=model)
+        metrics.LLM_OUTPUT_TOKENS.inc(response.output_tokens, model=model)
+        metrics.LLM_PROMPT_TOKENS_PER_CALL.observe(response.prompt_tokens, model=model)
+        metrics.LLM_FINISH_REASONS.inc(model=model, finish_reason=response.finish_reason or "UNKNOWN")
+
+    def _record_failure(self, e: BaseException, latency_seconds: float):
+        metrics.LLM_REQUESTS.inc(model=self.model_name, outcome=_error_outcome(e))
+        metrics.LLM_REQUEST_DURATION.observe(latency_seconds, model=self.model_name)
+
+    def generate(self, prompt: str, generation_config: dict = None, safety_settings: list = None) -> LLMResponse:
+        started = time.perf_counter()
+        try:
+            response = self.client.generate(prompt, generation_config, safety_settings)
+        except Exception as e:
+            self._record_failure(e, time.perf_counter() - started)
+            raise
+        self._record_success(response, time.perf_counter() - started)
+        return response
+
+    async def generate_async(self, prompt: str, generation_config: dict = None,
+                             safety_settings: list = None) -> LLMResponse:
+        started = time.perf_counter()
+        try:
+            response = await self.client.generate_async(prompt, generation_config, safety_settings)
+        except (Exception, asyncio.CancelledError) as e:
+            # Timeouts from asyncio.wait_for arrive as a cancellation
+            self._record_failure(e, time.perf_counter() - started)
+            raise
+        self._record_success(response, time.perf_counter() - started)
+        return response
+
+    def count_tokens(self, text: str) -> int:
+        return self.client.count_tokens(text)
+
+
+# HTTP statuses worth retrying; 429 and 503 also tell the limiter to back off
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+OVERLOAD_STATUS_CODES = (429, 503)
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter, never shorter than the server's retry-after hint."""
+    max_attempts: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def is_retryable(self, e: BaseException) -> bool:
+        return isinstance(e, LLMError) and e.status_code in RETRYABLE_STATUS_CODES
+
+    def delay(self, attempt: int, e: BaseException, rng: random.Random = random) -> float:
+        """Seconds to wait after failed attempt number `attempt` (0-based)."""
+        delay = rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = getattr(e, "retry_after", None)
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+def _limiter_outcome(e: BaseException) -> str:
+    if isinstance(e, LLMError) and e.status_code in OVERLOAD_STATUS_CODES:
+        return OVERLOAD
+    return IGNORE
+
+
+class ResilientLLMClient(LLMClient):
+    """
+    Wraps a client with retries and a shared adaptive concurrency limit.
+
+    Each attempt holds a slot of `limiter` (shared by every in-flight call
+    to the model in the process, sync or async). Retryable failures are
+    retried according to `policy`; 429/503 responses also shrink the limit,
+    so the process settles near the quota instead of retrying into it.
+    """
+
+    def __init__(self, client: LLMClient, limiter: AdaptiveConcurrencyLimiter, policy: RetryPolicy):
+        self.client = client
+        self.model_name = client.model_name
+        self.limiter = limiter
+        self.policy = policy
+
+    def _should_retry(self, e: BaseException, attempt: int) -> bool:
+        if attempt + 1 >= self.policy.max_attempts or not self.policy.is_retryable(e):
+            return False
+        metrics.LLM_RETRIES.inc(model=self.model_name, reason=str(e.status_code))
+        return True
+
+    def generate(self, prompt: str, generation_config: dict = None, safety_settings: list = None) -> LLMResponse:
+        attempt = 0
+        while True:
+            started = self.limiter.acquire()
+            try:
+                response = self.client.generate(prompt, generation_config, safety_settings)
+            except Exception as e:
+                self.limiter.release(started, _limiter_outcome(e))
+                if not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self.policy.delay(attempt, e))
+                attempt += 1
+                continue
+            self.limiter.release(started, SUCCESS)
+            return response
+
+    async def generate_async(self, prompt: str, generation_config: dict = None,
+                             safety_settings: list = None) -> LLMResponse:
+        attempt = 0
+        while True:
+            started = await self.limiter.acquire_async()
+            try:
+                response = await self.client.generate_async(prompt, generation_config, safety_settings)
+            except asyncio.CancelledError:
+                self.limiter.release(started, IGNORE)
+                raise
+            except Exception as e:
+                self.limiter.release(started, _limiter_outcome(e))
+                if not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self.policy.delay(attempt, e))
+                attempt += 1
+                continue
+            self.limiter.release(started, SUCCESS)
+            return response
+
+    def count_tokens(self, text: str) -> int:
+        return self.client.count_tokens(text)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model_name: str) -> AdaptiveConcurrencyLimiter:
+    """The process-wide adaptive concurrency limiter for a model, exported as metrics."""
+    with _limiters_lock:
+        limiter = _limiters.get(model_name)
+        if limiter is None:
+            config = get_settings()
+
+            def export(stats: dict):
+                metrics.LLM_CONCURRENCY_LIMIT.set(stats["limit"], model=model_name)
+                metrics.LLM_IN_FLIGHT.set(stats["in_flight"], model=model_name)
+                metrics.LLM_QUEUED.set(stats["queued"], model=model_name)
+                metrics.LLM_LIMIT_DECREASES.set(stats["decreases"], model=model_name)
+
+            limiter = AdaptiveConcurrencyLimiter(
+                initial_limit=config.LLM_CONCURRENCY_INITIAL,
+                min_limit=config.LLM_CONCURRENCY_MIN,
+                max_limit=config.LLM_CONCURRENCY_MAX,
+                on_change=export,
+            )
+            export(limiter.stats())
+            _limiters[model_name] = limiter
+    return limiter
+
+
+def _wrap(client: LLMClient) -> LLMClient:
+    # Metrics record every attempt; the resilient layer decides whether to make another
+    config = get_settings()
+    policy = RetryPolicy(
+        max_attempts=max(1, config.LLM_MAX_ATTEMPTS),
+        base_delay=config.LLM_RETRY_BASE_DELAY_SECONDS,
+        max_delay=config.LLM_RETRY_MAX_DELAY_SECONDS,
+    )
+    return ResilientLLMClient(InstrumentedLLMClient(client), get_limiter(client.model_name), policy)
+
+
+_clients = {}
+_override = None
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(model_name: str = None, system_instruction: str = None) -> LLMClient:
+    """
+    Returns the LLM client for a model, built for the configured
+    `LLM_PROVIDER` ("vertex" or "fake") and instrumented for `/metrics`.
+    """
+    if _override is not None:
+        return _override
+    config = get_settings()
+    model_name = model_name or config.LLM_MODEL
+    key = (model_name, system_instruction)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            if config.LLM_PROVIDER == "fake":
+                client = FakeLLMClient(
+                    model_name=model_name,
+                    latency=config.FAKE_LLM_LATENCY_SECONDS,
+                    failure_rate=config.FAKE_LLM_FAILURE_RATE,
+                    rate_limit_rate=config.FAKE_LLM_RATE_LIMIT_RATE,
+                    quota_concurrency=config.FAKE_LLM_QUOTA_CONCURRENCY,
+                )
+            elif config.LLM_PROVIDER == "vertex":
+                client = VertexLLMClient(model_name, system_instruction)
+            else:
+                raise ValueError(f"Unknown LLM_PROVIDER: {config.LLM_PROVIDER}")
+            client = _wrap(client)
+            _clients[key] = client
+    return client
+
+
+def set_llm_client(client: Optional[LLMClient]):
+    """
+    Makes `get_llm_client` return `client` for every model, wrapped in the same
+    metrics, retry and concurrency layers (None restores the configured provider).
+    """
+    global _override
+    wrapped = _wrap(client) if client is not None else None
+    with _clients_lock:
+        _override = wrapped
+        _clients.clear()
+
+
+def reset_clients():
+    """
+    Drops the cached clients, so the next `get_llm_client` builds them from the
+    current settings and model handles. Runs on every config reload.
+    """
+    with _clients_lock:
+        _clients.clear()
+
+
+on_reload(reset_clients)
@@ -0,0 +1,303 @@
+"""
+In-process metrics exported in the Prometheus text format on `/metrics`.
+
+Counters, gauges and histograms are kept in memory per process. Metrics
+with an `endpoint` or `application` label pick those values up from the
+request context (see `request_labels`) when the caller does not pass them,
+so code deep inside a tool is attributed to the API request or background
+job that triggered it. Context variables are copied into the endpoint
+pools' worker threads and into the batch and chunk executors (see
+`executors.submit_with_context`).
+"""
+import contextvars
+import math
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+_CONTEXT_LABELS = ("endpoint", "application")
+_request_labels = contextvars.ContextVar("request_labels", default={})
+
+
+def set_request_labels(**labels) -> contextvars.Token:
+    """Adds labels (endpoint, application) to the current context; returns a token for `reset_request_labels`."""
+    current = _request_labels.get()
+    return _request_labels.set({**current, **{key: str(value) for key, value in labels.items() if value is not None}})
+
+
+def reset_request_labels(token: contextvars.Token):
+    _request_labels.reset(token)
+
+
+@contextmanager
+def request_labels(**labels):
+    """Context manager form of `set_request_labels`, for worker threads that are reused across requests."""
+    token = set_request_labels(**labels)
+    try:
+        yield
+    finally:
+        reset_request_labels(token)
+
+
+def get_request_labels() -> Dict[str, str]:
+    return dict(_request_labels.get())
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        unknown = set(labels) - set(self.labelnames)
+        if unknown:
+            raise ValueError(f"Unknown labels for {self.name}: {sorted(unknown)}")
+        context = _request_labels.get()
+        return tuple(
+            str(labels[name]) if labels.get(name) is not None
+            else context.get(name, "") if name in _CONTEXT_LABELS else ""
+            for name in self.labelnames
+        )
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values
+        ]
+
+
+class Gauge(_Metric):
+    """A value that can go up and down."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [per-bucket counts, sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        lines = self._header()
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ---------- HTTP ----------
+HTTP_REQUESTS = REGISTRY.counter(
+    "rea_http_requests_total", "API requests by route, method and status code.", ("endpoint", "method", "status")
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "rea_http_request_duration_seconds", "API request latency until the response headers are sent.",
+    ("endpoint", "method"),
+)
+
+# ---------- LLM ----------
+_LLM_LABELS = ("model", "endpoint", "application")
+LLM_REQUESTS = REGISTRY.counter(
+    "rea_llm_requests_total", "Model calls by outcome (success, rate_limited, error, cancelled).",
+    _LLM_LABELS + ("outcome",),
+)
+LLM_REQUEST_DURATION = REGISTRY.histogram(
+    "rea_llm_request_duration_seconds", "Latency of a single model call attempt.", _LLM_LABELS,
+)
+LLM_PROMPT_TOKENS = REGISTRY.counter("rea_llm_prompt_tokens_total", "Prompt tokens sent to the model.", _LLM_LABELS)
+LLM_OUTPUT_TOKENS = REGISTRY.counter("rea_llm_output_tokens_total", "Output tokens returned by the model.", _LLM_LABELS)
+LLM_PROMPT_TOKENS_PER_CALL = REGISTRY.histogram(
+    "rea_llm_prompt_tokens_per_call", "Prompt size of a single model call, in tokens.", ("model",),
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072),
+)
+LLM_FINISH_REASONS = REGISTRY.counter(
+    "rea_llm_finish_reasons_total", "Finish reasons reported for successful model calls.", ("model", "finish_reason"),
+)
+LLM_RETRIES = REGISTRY.counter(
+    "rea_llm_retries_total", "Model calls retried after a retryable failure.", ("model", "reason"),
+)
+LLM_CONCURRENCY_LIMIT = REGISTRY.gauge(
+    "rea_llm_concurrency_limit", "Current adaptive limit on concurrent model calls.", ("model",),
+)
+LLM_IN_FLIGHT = REGISTRY.gauge("rea_llm_in_flight", "Model calls currently holding a concurrency slot.", ("model",))
+LLM_QUEUED = REGISTRY.gauge("rea_llm_queued", "Model calls waiting for a concurrency slot.", ("model",))
+LLM_LIMIT_DECREASES = REGISTRY.gauge(
+    "rea_llm_concurrency_limit_decreases", "Times the adaptive limit was cut after an overload signal.", ("model",),
+)
+LLM_JSON_PARSE = REGISTRY.counter(
+    "rea_llm_json_parse_total", "Model JSON responses by parse outcome (success, failure).",
+    ("endpoint", "application", "outcome"),
+)
+
+# ---------- BigQuery ----------
+_BQ_LABELS = ("operation", "endpoint", "application")
+BQ_JOB_DURATION = REGISTRY.histogram(
+    "rea_bigquery_job_duration_seconds", "Duration of BigQuery queries and streaming inserts.", _BQ_LABELS,
+)
+BQ_JOBS = REGISTRY.counter("rea_bigquery_jobs_total", "BigQuery calls by outcome.", _BQ_LABELS + ("outcome",))
+BQ_BYTES_PROCESSED = REGISTRY.counter(
+    "rea_bigquery_bytes_processed_total", "Bytes processed (billed scan size) by BigQuery queries.", _BQ_LABELS,
+)
+BQ_ROWS_INSERTED = REGISTRY.counter("rea_bigquery_rows_inserted_total", "Rows sent with streaming inserts.")
+BQ_ROWS_READ = REGISTRY.counter(
+    "rea_bigquery_rows_read_total", "Rows streamed as Arrow record batches by bulk reads.", _BQ_LABELS,
+)
+
+# ---------- Analysis cache ----------
+ANALYSIS_CACHE_LOOKUPS = REGISTRY.counter(
+    "rea_analysis_cache_lookups_total",
+    "Analysis cache lookups by cache (result, statement) and outcome (hit, miss).",
+    ("endpoint", "application", "cache", "outcome"),
+)
+ANALYSIS_CACHE_ENTRIES = REGISTRY.gauge(
+    "rea_analysis_cache_entries", "Entries in the local analysis cache, as of the last scrape.", ("cache",),
+)
+ANALYSIS_CACHE_SIZE_BYTES = REGISTRY.gauge(
+    "rea_analysis_cache_size_bytes", "Size of the cached analysis results, as of the last scrape.",
+)
+
+
+def record_json_parse(success: bool):
+    """Counts one parse of a model's JSON response."""
+    LLM_JSON_PARSE.inc(outcome="success" if success else "failure")
+
+
+def render() -> str:
+    return REGISTRY.render()
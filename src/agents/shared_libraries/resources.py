@@ -0,0 +1,235 @@
+import os
+import threading
+
+import google.auth
+import vertexai
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import bigquery
+from requests.adapters import HTTPAdapter
+from vertexai.generative_models import GenerativeModel
+
+from src.agents.config.settings import Settings, get_yaml_file
+
+try:
+    from google.cloud import bigquery_storage
+except ImportError:  # optional, not in poetry.lock: bulk reads fall back to the REST API, page by page
+    bigquery_storage = None
+
+_lock = threading.RLock()
+_settings = None
+_config_mtime = None
+_bq_client = None
+_bqstorage_client = None
+_bqstorage_fallback_logged = False
+_vertex_initialized = False
+_models = {}
+_reload_callbacks = []
+_watcher = None
+_watcher_stop = threading.Event()
+
+
+def _get_config_mtime():
+    try:
+        return os.path.getmtime(get_yaml_file())
+    except OSError:
+        return None
+
+
+def get_settings() -> Settings:
+    """
+    Returns the process-wide, immutable Settings snapshot. The YAML config is
+    parsed once instead of on every call.
+    """
+    global _settings, _config_mtime
+    if _settings is None:
+        with _lock:
+            if _settings is None:
+                _config_mtime = _get_config_mtime()
+                _settings = Settings.get_settings()
+    return _settings
+
+
+def get_bq_client() -> bigquery.Client:
+    """
+    Returns the shared BigQuery client. The client is thread-safe; its HTTP
+    session is given a connection pool of `BQ_HTTP_POOL_SIZE` so concurrent
+    requests reuse connections instead of churning them.
+    """
+    global _bq_client
+    if _bq_client is None:
+        with _lock:
+            if _bq_client is None:
+                _bq_client = _build_bq_client(get_settings())
+    return _bq_client
+
+
+def _build_bq_client(config: Settings) -> bigquery.Client:
+    credentials, default_project = google.auth.default(scopes=bigquery.Client.SCOPE)
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=config.BQ_HTTP_POOL_SIZE, pool_maxsize=config.BQ_HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    return bigquery.Client(project=config.PROJECT_ID or default_project, credentials=credentials, _http=session)
+
+
+def get_bqstorage_client():
+    """
+    Returns the shared BigQuery Storage Read API client, used for columnar
+    (Arrow) reads of query results; None when the
+    `google-cloud-bigquery-storage` package is not installed (logged once)
+    or `BQ_STORAGE_READ_ENABLED` is off.
+    """
+    global _bqstorage_client, _bqstorage_fallback_logged
+    if not get_settings().BQ_STORAGE_READ_ENABLED:
+        return None
+    if bigquery_storage is None:
+        if not _bqstorage_fallback_logged:
+            _bqstorage_fallback_logged = True
+            print("google-cloud-bigquery-storage is not installed; bulk reads fall back to the BigQuery REST API.")
+        return None
+    if _bqstorage_client is None:
+        with _lock:
+            if _bqstorage_client is None:
+                _bqstorage_client = bigquery_storage.BigQueryReadClient()
+    return _bqstorage_client
+
+
+def get_generative_model(model_name: str = None, system_instruction: str = None) -> GenerativeModel:
+    """
+    Returns a pre-built model handle per (model name, system instruction).
+    `vertexai.init` runs once per process instead of once per request.
+    """
+    global _vertex_initialized
+    config = get_settings()
+    model_name = model_name or config.LLM_MODEL
+    key = (model_name, system_instruction)
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                if not _vertex_initialized:
+                    vertexai.init(project=config.PROJECT_ID, location=config.REGION)
+                    _vertex_initialized = True
+                if system_instruction:
+                    model = GenerativeModel(model_name, system_instruction=[system_instruction])
+                else:
+                    model = GenerativeModel(model_name)
+                _models[key] = model
+    return model
+
+
+def on_reload(callback):
+    """
+    Registers `callback` to run whenever the shared clients are replaced or
+    released, so caches built on top of them (e.g. the LLM clients holding
+    model handles) are dropped with them.
+    """
+    _reload_callbacks.append(callback)
+
+
+def _run_reload_callbacks():
+    for callback in _reload_callbacks:
+        try:
+            callback()
+        except Exception as e:
+            print(f"Error while resetting clients after a reload: {e}")
+
+
+def _swap_clients(config: Settings):
+    """
+    Replaces the shared clients with ones built for `config`. The old ones
+    are not closed: threads still running a query or stream on them finish
+    it, and they are collected once the last reference is dropped.
+    """
+    global _bq_client, _bqstorage_client, _models, _vertex_initialized
+    try:
+        bq_client = _build_bq_client(config)
+    except Exception as e:
+        # Built on next use instead, as at startup
+        print(f"Could not rebuild the BigQuery client: {e}")
+        bq_client = None
+    _bq_client = bq_client
+    _bqstorage_client = None
+    _models = {}
+    _vertex_initialized = False
+
+
+def _release_clients():
+    global _bq_client, _bqstorage_client, _vertex_initialized
+    if _bq_client is not None:
+        try:
+            _bq_client.close()
+        except Exception as e:
+            print(f"Error while closing the BigQuery client: {e}")
+        _bq_client = None
+    _bqstorage_client = None
+    _models.clear()
+    _vertex_initialized = False
+
+
+def reload_if_changed() -> bool:
+    """
+    Rebuilds the Settings snapshot and swaps in new shared clients when the
+    config file has changed since it was loaded. Returns True on reload.
+
+    Callers holding the old snapshot or clients keep using them until they
+    are done. Endpoint pools are resized on their next use
+    (`executors.get_pool`); the job workers (`JOB_WORKERS`) are only sized at
+    startup and need a restart.
+    """
+    global _settings, _config_mtime
+    mtime = _get_config_mtime()
+    if _settings is None or mtime == _config_mtime:
+        return False
+    with _lock:
+        settings = Settings.get_settings()
+        _swap_clients(settings)
+        _settings = settings
+        _config_mtime = mtime
+    # Outside `_lock`: callbacks take their own locks, which are held while
+    # building model handles here
+    _run_reload_callbacks()
+    print("Configuration file changed; settings and clients reloaded.")
+    return True
+
+
+def _watch_config(interval: float):
+    while not _watcher_stop.wait(interval):
+        try:
+            reload_if_changed()
+        except Exception as e:
+            print(f"Could not reload configuration: {e}")
+
+
+def startup():
+    """
+    Builds the Settings snapshot and the BigQuery client eagerly, and starts
+    the config watcher if `CONFIG_RELOAD_INTERVAL_SECONDS` is set. Model
+    handles are keyed by system instruction, so they are warmed up by their
+    users (`sql_analysis.warm_up`).
+    """
+    global _watcher
+    config = get_settings()
+    try:
+        get_bq_client()
+    except Exception as e:
+        print(f"Could not connect to BigQuery. Please check your GCP authentication. Error: {e}")
+
+    if config.CONFIG_RELOAD_INTERVAL_SECONDS > 0 and _watcher is None:
+        _watcher_stop.clear()
+        _watcher = threading.Thread(
+            target=_watch_config, args=(config.CONFIG_RELOAD_INTERVAL_SECONDS,), name="config-watcher", daemon=True
+        )
+        _watcher.start()
+
+
+def shutdown():
+    """Stops the config watcher and closes the shared clients."""
+    global _watcher
+    if _watcher is not None:
+        _watcher_stop.set()
+        _watcher.join()
+        _watcher = None
+    with _lock:
+        _release_clients()
+    _run_reload_callbacks()
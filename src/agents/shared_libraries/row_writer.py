@@ -0,0 +1,249 @@
+import json
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+
+class InMemorySink:
+    """
+    Local stand-in for a BigQuery table, for tests and benchmarks.
+
+    Follows the `insert_rows_json` contract: returns a list of
+    `{"index": i, "errors": [...]}` for the rows that failed. `fail_rows` can
+    be set to a predicate that marks individual rows as failed, and `latency`
+    simulates the round trip of a streaming insert.
+    """
+
+    def __init__(self, latency: float = 0.0, fail_rows: Callable[[dict], bool] = None):
+        self.latency = latency
+        self.fail_rows = fail_rows
+        self.rows = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, rows: List[dict]) -> list:
+        if self.latency:
+            time.sleep(self.latency)
+        errors = []
+        with self._lock:
+            self.calls += 1
+            for index, row in enumerate(rows):
+                if self.fail_rows and self.fail_rows(row):
+                    errors.append({"index": index, "errors": [{"reason": "injected", "message": "Injected failure"}]})
+                else:
+                    self.rows.append(row)
+        return errors
+
+
+class BufferedRowWriter:
+    """
+    Write-behind buffer that collects rows and flushes them to a sink in
+    batches.
+
+    A background thread flushes when `max_batch_rows` or `max_batch_bytes` are
+    buffered, or `flush_interval` seconds after the oldest buffered row. When
+    `max_buffered_rows` rows are waiting, `write()` blocks (backpressure).
+    Rows the sink rejects, or whole batches whose call raises, are retried up
+    to `max_retries` times with a growing delay; after that they are reported
+    through `on_rows_failed` and dropped.
+    """
+
+    def __init__(self, sink: Callable[[List[dict]], list], max_batch_rows: int = 500,
+                 max_batch_bytes: int = 8 * 1024 * 1024, flush_interval: float = 2.0,
+                 max_buffered_rows: int = 5000, max_retries: int = 3, retry_backoff: float = 1.0,
+                 on_rows_written: Optional[Callable[[List[dict]], None]] = None,
+                 on_rows_failed: Optional[Callable[[List[dict]], None]] = None):
+        self.sink = sink
+        self.max_batch_rows = max_batch_rows
+        self.max_batch_bytes = max_batch_bytes
+        self.flush_interval = flush_interval
+        self.max_buffered_rows = max_buffered_rows
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.on_rows_written = on_rows_written
+        self.on_rows_failed = on_rows_failed
+
+        # Entries are (row, size_bytes, attempts, not_before)
+        self._buffer = deque()
+        self._buffered_bytes = 0
+        self._in_flight = 0
+        self._oldest_at = None
+        self._closed = False
+        self._force_flush = False
+        self._cond = threading.Condition()
+
+        self._started_at = time.monotonic()
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.rows_retried = 0
+        self.flushes = 0
+        self._flush_seconds_total = 0.0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="row-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, row: dict, timeout: float = None) -> bool:
+        """
+        Buffers one row. Blocks while the buffer is full; returns False if it
+        is still full after `timeout` seconds or the writer is closed.
+        """
+        size_bytes = len(json.dumps(row, default=str).encode("utf-8"))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while len(self._buffer) >= self.max_buffered_rows and not self._closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            if self._closed:
+                return False
+            self._append(row, size_bytes, 0, 0.0)
+            self._cond.notify_all()
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits until every buffered row has been written or has failed permanently."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._force_flush = True
+            self._cond.notify_all()
+            while self._buffer or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 0.5)
+            self._force_flush = False
+        return True
+
+    def close(self, timeout: float = None):
+        """Flushes the remaining rows and stops the background thread."""
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self._started_at
+        with self._cond:
+            buffered = len(self._buffer)
+        return {
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "rows_retried": self.rows_retried,
+            "rows_buffered": buffered,
+            "flushes": self.flushes,
+            "rows_per_second": self.rows_written / elapsed if elapsed else 0.0,
+            "mean_flush_seconds": self._flush_seconds_total / self.flushes if self.flushes else 0.0,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+        }
+
+    # ---------- Internals ----------
+
+    def _append(self, row: dict, size_bytes: int, attempts: int, not_before: float):
+        self._buffer.append((row, size_bytes, attempts, not_before))
+        self._buffered_bytes += size_bytes
+        if self._oldest_at is None:
+            self._oldest_at = time.monotonic()
+
+    def _batch_ready(self, now: float) -> bool:
+        if not self._buffer or self._buffer[0][3] > now:
+            return False
+        return (
+            self._force_flush
+            or self._closed
+            or len(self._buffer) >= self.max_batch_rows
+            or self._buffered_bytes >= self.max_batch_bytes
+            or (self._oldest_at is not None and now - self._oldest_at >= self.flush_interval)
+        )
+
+    def _take_batch(self) -> list:
+        batch = []
+        batch_bytes = 0
+        now = time.monotonic()
+        while self._buffer and len(batch) < self.max_batch_rows:
+            entry = self._buffer[0]
+            if entry[3] > now or (batch and batch_bytes + entry[1] > self.max_batch_bytes):
+                break
+            self._buffer.popleft()
+            self._buffered_bytes -= entry[1]
+            batch_bytes += entry[1]
+            batch.append(entry)
+        self._oldest_at = time.monotonic() if self._buffer else None
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._batch_ready(now):
+                        break
+                    if self._closed and not self._buffer:
+                        return
+                    self._cond.wait(self._next_wakeup(now))
+                batch = self._take_batch()
+                self._in_flight = len(batch)
+                # Writers blocked on a full buffer can proceed
+                self._cond.notify_all()
+
+            self._flush_batch(batch)
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _next_wakeup(self, now: float) -> float:
+        if not self._buffer:
+            return self.flush_interval
+        waits = [self.flush_interval]
+        if self._oldest_at is not None:
+            waits.append(self._oldest_at + self.flush_interval - now)
+        waits.append(self._buffer[0][3] - now)
+        return max(0.01, min(waits))
+
+    def _flush_batch(self, batch: list):
+        rows = [entry[0] for entry in batch]
+        started = time.monotonic()
+        try:
+            errors = self.sink(rows) or []
+            failed_indexes = {error["index"] for error in errors}
+            failure = errors[0] if errors else None
+        except Exception as e:
+            failed_indexes = set(range(len(batch)))
+            failure = str(e)
+        elapsed = time.monotonic() - started
+
+        self.flushes += 1
+        self._flush_seconds_total += elapsed
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+        written = [entry[0] for i, entry in enumerate(batch) if i not in failed_indexes]
+        self.rows_written += len(written)
+        if written and self.on_rows_written:
+            self.on_rows_written(written)
+        if not failed_indexes:
+            return
+
+        print(f"Failed to write {len(failed_indexes)} of {len(batch)} buffered row(s). First error: {failure}")
+        dropped = []
+        with self._cond:
+            for i in sorted(failed_indexes):
+                row, size_bytes, attempts, _ = batch[i]
+                if attempts + 1 > self.max_retries:
+                    dropped.append(row)
+                    continue
+                self.rows_retried += 1
+                not_before = time.monotonic() + self.retry_backoff * (2 ** attempts)
+                self._append(row, size_bytes, attempts + 1, not_before)
+            self._cond.notify_all()
+        if dropped:
+            self.rows_failed += len(dropped)
+            print(f"Dropping {len(dropped)} row(s) after {self.max_retries} retries.")
+            if self.on_rows_failed:
+                self.on_rows_failed(dropped)
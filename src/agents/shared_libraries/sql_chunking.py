@@ -0,0 +1,183 @@
+"""
+Splits very large SQL scripts into statement groups that are analyzed
+independently, and merges the partial `parser_output`s back into one.
+"""
+from dataclasses import dataclass, field
+from typing import List
+
+from src.agents.shared_libraries.llm_client import estimate_tokens
+from src.agents.shared_libraries.sql_parser import parse_statement, preprocess, read_job_header
+
+# When the same table is classified differently by two chunks, the stronger type wins
+_ENTITY_TYPE_PRECEDENCE = {"WORK_TABLE": 3, "TARGET_TABLE": 2, "SOURCE_TABLE": 1}
+
+
+@dataclass
+class SqlChunk:
+    index: int
+    text: str
+    statements: int
+    tokens: int
+    context_tables: List[str] = field(default_factory=list)
+
+
+def chunk_script(sql: str, max_tokens: int) -> List[SqlChunk]:
+    """
+    Groups a script's statements (split on terminal semicolons) into chunks
+    of at most ~`max_tokens` tokens. A script that fits, or `max_tokens <= 0`,
+    gives a single chunk with the original text; a single statement larger
+    than the budget gets a chunk of its own.
+
+    Statements are never split, so aliases (which are statement-scoped) stay
+    resolvable. The context a statement inherits from earlier ones is carried
+    into each chunk as a preamble: the `DATABASE` default in effect and the
+    `CREATE TABLE` DDL of tables created in earlier chunks that the chunk uses.
+    """
+    total_tokens = estimate_tokens(sql)
+    if max_tokens <= 0 or total_tokens <= max_tokens:
+        return [SqlChunk(index=0, text=sql, statements=0, tokens=total_tokens)]
+
+    chunks = []
+    database = ""
+    ddl = {}
+    current = []
+    current_tokens = 0
+    chunk_database = ""
+    chunk_ddl = {}
+
+    def flush():
+        referenced = []
+        created_here = set()
+        for _, info in current:
+            if info.kind in ("CREATE_TABLE", "CREATE_TABLE_AS"):
+                created_here.add(info.target)
+            for table in [info.target, *info.sources]:
+                if table and table in chunk_ddl and table not in created_here and table not in referenced:
+                    referenced.append(table)
+        preamble = []
+        if chunk_database and current[0][1].kind != "DATABASE":
+            preamble.append(f"DATABASE {chunk_database}")
+        preamble += [chunk_ddl[table] for table in referenced]
+        text = ";\n\n".join(preamble + [statement for statement, _ in current]) + ";\n"
+        chunks.append(SqlChunk(index=len(chunks), text=text, statements=len(current),
+                               tokens=estimate_tokens(text), context_tables=referenced))
+
+    for statement in preprocess(sql):
+        info = parse_statement(statement, database)
+        tokens = estimate_tokens(statement)
+        if current and current_tokens + tokens > max_tokens:
+            flush()
+            current, current_tokens = [], 0
+        if not current:
+            chunk_database = database
+            chunk_ddl = dict(ddl)
+        current.append((statement, info))
+        current_tokens += tokens
+        if info.kind == "DATABASE" and info.database:
+            database = info.database
+        elif info.kind == "CREATE_TABLE" and info.target:
+            ddl[info.target] = statement
+    if current:
+        flush()
+    return chunks
+
+
+def check_chunk_output(output: dict):
+    """
+    Raises ValueError when a chunk's `parser_output` does not have the shape
+    `merge_parser_outputs` relies on (lists of objects, object attributes,
+    string join conditions).
+    """
+    if not isinstance(output.get("job_metadata") or {}, dict):
+        raise ValueError("job_metadata is not an object")
+    for name in ("entities", "relationships", "data_flows"):
+        items = output.get(name) or []
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError(f"{name} is not a list of objects")
+    for entity in output.get("entities") or []:
+        attributes = entity.get("attributes") or []
+        if not isinstance(attributes, list) or not all(isinstance(attribute, dict) for attribute in attributes):
+            raise ValueError(f"attributes of entity '{entity.get('entity_name')}' are not a list of objects")
+    for relationship in output.get("relationships") or []:
+        conditions = relationship.get("join_conditions") or []
+        if not isinstance(conditions, list) or not all(isinstance(condition, str) for condition in conditions):
+            raise ValueError("join_conditions is not a list of strings")
+
+
+def _merge_entity(merged: dict, entity: dict):
+    if not merged.get("primary_key") and entity.get("primary_key"):
+        merged["primary_key"] = entity["primary_key"]
+    if "DDL" in str(entity.get("creation_source", "")) and "DDL" not in str(merged.get("creation_source", "")):
+        merged["creation_source"] = entity["creation_source"]
+    if _ENTITY_TYPE_PRECEDENCE.get(entity.get("entity_type"), 0) > \
+            _ENTITY_TYPE_PRECEDENCE.get(merged.get("entity_type"), 0):
+        merged["entity_type"] = entity["entity_type"]
+
+    attributes = {str(a.get("attribute_name", "")).upper(): a for a in merged.get("attributes", [])}
+    for attribute in entity.get("attributes", []) or []:
+        key = str(attribute.get("attribute_name", "")).upper()
+        existing = attributes.get(key)
+        if existing is None:
+            merged.setdefault("attributes", []).append(attribute)
+            attributes[key] = attribute
+        elif not existing.get("data_type") and attribute.get("data_type"):
+            existing.update(attribute)
+
+
+def merge_parser_outputs(outputs: List[dict], sql: str = "") -> dict:
+    """
+    Merges partial `parser_output`s (checked with `check_chunk_output`), in
+    chunk order, into one. Entities are
+    deduplicated by name (case-insensitive) with their attributes unioned;
+    relationships are deduplicated; data flows are concatenated. Job metadata
+    comes from the first chunk that has each field, falling back to the
+    script's header comment.
+    """
+    job_metadata = {}
+    overviews = []
+    entities = {}
+    relationships = []
+    seen_relationships = set()
+    data_flows = []
+
+    for output in outputs:
+        metadata = output.get("job_metadata") or {}
+        for key, value in metadata.items():
+            if key == "functional_overview":
+                if value and value not in overviews:
+                    overviews.append(value)
+            elif value and not job_metadata.get(key):
+                job_metadata[key] = value
+
+        for entity in output.get("entities") or []:
+            key = str(entity.get("entity_name", "")).upper()
+            if key not in entities:
+                entities[key] = {**entity, "attributes": list(entity.get("attributes") or [])}
+            else:
+                _merge_entity(entities[key], entity)
+
+        for relationship in output.get("relationships") or []:
+            key = (
+                str(relationship.get("type", "")).upper(),
+                str(relationship.get("left_entity", "")).upper(),
+                str(relationship.get("right_entity", "")).upper(),
+                tuple(relationship.get("join_conditions") or []),
+            )
+            if key not in seen_relationships:
+                seen_relationships.add(key)
+                relationships.append(relationship)
+
+        data_flows.extend(output.get("data_flows") or [])
+
+    if sql:
+        job_name, version = read_job_header(sql)
+        job_metadata.setdefault("job_name", job_name)
+        job_metadata.setdefault("version", version)
+    job_metadata["functional_overview"] = " ".join(overviews)
+
+    return {
+        "job_metadata": job_metadata,
+        "entities": list(entities.values()),
+        "relationships": relationships,
+        "data_flows": data_flows,
+    }
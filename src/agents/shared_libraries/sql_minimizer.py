@@ -0,0 +1,112 @@
+"""
+Shrinks a SQL script before it is embedded in an extraction prompt.
+
+The minimized script keeps everything the lineage analysis depends on
+(statements, names, expressions, join and filter conditions) and drops
+what it does not: comments, BTEQ control lines, layout whitespace, long
+literal lists and runs of statements that differ only in their literals.
+Elided content is replaced by a short `/* ... */` marker so the model
+knows something was there.
+"""
+import re
+from typing import List
+
+from src.agents.shared_libraries.llm_client import estimate_tokens
+from src.agents.shared_libraries.sql_parser import preprocess, read_job_header
+
+# Literal lists longer than this keep their first few items only
+MAX_LITERAL_LIST = 8
+KEPT_LITERALS = 3
+# Runs of statements identical up to their literals keep this many examples
+KEPT_SIMILAR_STATEMENTS = 2
+
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_LITERAL = r"(?:'(?:[^']|'')*'|[-+]?\d+(?:\.\d+)?)"
+_LITERAL_LIST = re.compile(rf"\(\s*{_LITERAL}(?:\s*,\s*{_LITERAL}){{{MAX_LITERAL_LIST},}}\s*\)")
+_LITERAL_TOKEN = re.compile(_LITERAL)
+_NUMBER = re.compile(r"(?<![\w.])[-+]?\d+(?:\.\d+)?(?![\w.])")
+_WHITESPACE = re.compile(r"\s+")
+_SPACE_INSIDE_PARENS = re.compile(r"(?<=\()\s+|\s+(?=[),])")
+
+
+def collapse_whitespace(statement: str) -> str:
+    """Collapses runs of whitespace outside string literals and quoted identifiers."""
+    parts = _QUOTED.split(statement)
+    for i in range(0, len(parts), 2):
+        parts[i] = _SPACE_INSIDE_PARENS.sub("", _WHITESPACE.sub(" ", parts[i]))
+    return "".join(parts).strip()
+
+
+def _elide_literal_list(match: re.Match) -> str:
+    literals = _LITERAL_TOKEN.findall(match.group())
+    kept = ", ".join(literals[:KEPT_LITERALS])
+    return f"({kept} /* +{len(literals) - KEPT_LITERALS} more literals */)"
+
+
+def elide_literal_lists(statement: str) -> str:
+    """Shortens parenthesized lists of more than `MAX_LITERAL_LIST` literals (IN lists, VALUES rows)."""
+    return _LITERAL_LIST.sub(_elide_literal_list, statement)
+
+
+def _literal_shape(statement: str) -> str:
+    parts = _QUOTED.split(statement)
+    for i in range(len(parts)):
+        if i % 2:
+            parts[i] = "?" if parts[i].startswith("'") else parts[i]
+        else:
+            parts[i] = _NUMBER.sub("?", parts[i])
+    return "".join(parts).upper()
+
+
+def elide_similar_statements(statements: List[str]) -> List[str]:
+    """
+    Keeps the first `KEPT_SIMILAR_STATEMENTS` of each run of consecutive
+    statements that are identical once their literals are masked (typically
+    seed-data INSERT ... VALUES blocks), and notes how many were dropped.
+    """
+    out = []
+    i = 0
+    while i < len(statements):
+        shape = _literal_shape(statements[i])
+        j = i + 1
+        while j < len(statements) and _literal_shape(statements[j]) == shape:
+            j += 1
+        run = statements[i:j]
+        if len(run) > KEPT_SIMILAR_STATEMENTS:
+            kept = run[:KEPT_SIMILAR_STATEMENTS]
+            dropped = len(run) - KEPT_SIMILAR_STATEMENTS
+            kept[-1] += f" /* +{dropped} more statements like this one with different literals */"
+            out.extend(kept)
+        else:
+            out.extend(run)
+        i = j
+    return out
+
+
+def minimize_sql(sql: str) -> str:
+    """
+    Returns a smaller script with the same lineage: comments and control lines
+    removed, whitespace collapsed, one statement per line, long literal lists
+    and repeated literal-only statements elided. The header's job name and
+    version, which the prompts ask for, are kept as a leading comment.
+    """
+    statements = [elide_literal_lists(collapse_whitespace(statement)) for statement in preprocess(sql)]
+    statements = elide_similar_statements([statement for statement in statements if statement])
+    if not statements:
+        return sql.strip()
+    job_name, version = read_job_header(sql)
+    header = [f"Job: {job_name}"] if job_name else []
+    header += [f"Version: {version}"] if version else []
+    prefix = f"/* {'  '.join(header)} */\n" if header else ""
+    return prefix + ";\n".join(statements) + ";\n"
+
+
+def count_sql_tokens(original: str, minimized: str) -> dict:
+    """Estimated tokens of a script before and after minimization."""
+    original_tokens = estimate_tokens(original)
+    minimized_tokens = estimate_tokens(minimized)
+    return {
+        "original": original_tokens,
+        "minimized": minimized_tokens,
+        "saved": original_tokens - minimized_tokens,
+    }
@@ -0,0 +1,986 @@
+"""
+Deterministic pre-parser for Teradata BTEQ / ANSI SQL scripts.
+
+Performs the mechanical part of the lineage analysis without a model call:
+comments and BTEQ control lines (.IF/.GOTO/.LABEL/.SET/.QUIT/...) are
+removed, the script is split on terminal semicolons, and each statement is
+scanned for its target, source tables, aliases, joins, DDL columns and, where
+it can be done positionally, attribute mappings. `build_parser_output`
+assembles the result in the same `parser_output` layout the extraction
+prompt asks the model for.
+
+Names are normalized to upper case, and unqualified table names are
+qualified with the script's `DATABASE` (or `USE`) default.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Bump whenever the parser's output changes so cached hybrid results are not reused
+PARSER_VERSION = "1"
+
+_COMMENT_OR_QUOTE = re.compile(r"['\"]|--|/\*")
+_CONTROL_LINE = re.compile(r"^[ \t]*\.[A-Za-z]")
+_QUOTE_OR_SEMICOLON = re.compile(r"'(?:[^']|'')*'?|\"(?:[^\"]|\"\")*\"?|;")
+_JOB_NAME = re.compile(r"\bJob(?:[ _]?Name)?\s*:\s*(.+?)\s*(?:\bVersion\b|\*/|$)", re.IGNORECASE | re.MULTILINE)
+_VERSION = re.compile(r"\bVersion\s*:\s*(v?[\d][\w.]*)", re.IGNORECASE)
+
+_TOKEN = re.compile(
+    r"""
+    (?P<string>'(?:[^']|'')*'?)
+    |(?P<qident>"(?:[^"]|"")*"?)
+    |(?P<number>\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)
+    |(?P<ident>[A-Za-z_$#][\w$#]*)
+    |(?P<op><>|<=|>=|!=|\^=|\|\||[^\s\w])
+    """,
+    re.VERBOSE,
+)
+
+_ABBREVIATIONS = {"INS": "INSERT", "UPD": "UPDATE", "DEL": "DELETE", "SEL": "SELECT"}
+
+# Words that end a table reference / cannot be a table alias
+_RESERVED = {
+    "WHERE", "ON", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "OUTER", "NATURAL", "GROUP", "ORDER",
+    "HAVING", "QUALIFY", "UNION", "INTERSECT", "EXCEPT", "MINUS", "SET", "SELECT", "SEL", "FROM", "USING",
+    "WHEN", "LIMIT", "SAMPLE", "AND", "OR", "WITH", "INTO", "VALUES", "LATERAL", "WINDOW", "TOP", "AS",
+    "ALL", "THEN", "ELSE", "END", "NOT", "IN", "EXISTS", "BY", "FOR", "LOCKING", "LOCK", "ACCESS",
+}
+# Words that end a join condition or WHERE clause at the current depth
+_CLAUSE_END = {
+    "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "WHERE", "GROUP", "ORDER", "HAVING",
+    "QUALIFY", "UNION", "INTERSECT", "EXCEPT", "MINUS", "SET", "WHEN", "SAMPLE", "FROM", "WINDOW",
+}
+_COLUMN_CONSTRAINTS = {
+    "NOT", "NULL", "DEFAULT", "TITLE", "FORMAT", "COMPRESS", "CHARACTER", "CASESPECIFIC", "UPPERCASE",
+    "CHECK", "REFERENCES", "PRIMARY", "UNIQUE", "CONSTRAINT", "GENERATED", "WITH", "NAMED",
+}
+_TABLE_CONSTRAINTS = {"PRIMARY", "UNIQUE", "CONSTRAINT", "INDEX", "FOREIGN", "CHECK", "PARTITION"}
+# Keywords, types and built-ins that are never bare column names in an expression
+_EXPRESSION_KEYWORDS = {
+    "CASE", "WHEN", "THEN", "ELSE", "END", "NULL", "IS", "NOT", "AND", "OR", "IN", "LIKE", "BETWEEN", "CAST",
+    "AS", "DATE", "TIME", "TIMESTAMP", "INTERVAL", "CURRENT_DATE", "CURRENT_TIME", "CURRENT_TIMESTAMP",
+    "CURRENT_USER", "USER", "DAY", "MONTH", "YEAR", "HOUR", "MINUTE", "SECOND", "FORMAT", "CHARACTER",
+    "INTEGER", "INT", "DECIMAL", "NUMERIC", "VARCHAR", "CHAR", "BIGINT", "SMALLINT", "BYTEINT", "FLOAT",
+    "NUMBER", "TRUE", "FALSE", "DISTINCT", "EXISTS", "ANY", "SOME", "ALL", "OVER", "PARTITION", "BY",
+    "ORDER", "ROWS", "RANGE", "UNBOUNDED", "PRECEDING", "FOLLOWING", "ROW", "ASC", "DESC", "LEADING",
+    "TRAILING", "BOTH", "FROM", "FOR", "SELECT", "SEL", "ESCAPE", "TO",
+}
+# Words after which "(" is not a function call, for rendering expressions
+_SPACED_BEFORE_PAREN = {"IN", "AND", "OR", "NOT", "ON", "THEN", "ELSE", "WHEN", "AS", "EXISTS", "FROM", "SELECT"}
+
+_FLOW_KINDS = ("INSERT", "UPDATE", "MERGE")
+_MODIFYING_KINDS = ("INSERT", "UPDATE", "MERGE", "DELETE")
+
+
+@dataclass
+class Token:
+    kind: str
+    text: str
+    upper: str
+
+
+@dataclass
+class StatementInfo:
+    """Everything the parser could determine about one statement."""
+    kind: str
+    text: str
+    target: Optional[str] = None
+    sources: List[str] = field(default_factory=list)
+    aliases: Dict[str, str] = field(default_factory=dict)
+    relationships: List[dict] = field(default_factory=list)
+    columns: List[dict] = field(default_factory=list)
+    primary_key: List[str] = field(default_factory=list)
+    column_refs: Dict[str, List[str]] = field(default_factory=dict)
+    attribute_mappings: List[dict] = field(default_factory=list)
+    database: Optional[str] = None
+
+
+@dataclass
+class ParsedScript:
+    statements: List[StatementInfo]
+    default_database: str = ""
+    job_name: str = ""
+    version: str = ""
+
+
+# ---------- Pre-processing ----------
+
+def strip_comments(sql: str) -> str:
+    """Removes `--` and `/* */` comments, leaving string literals and quoted identifiers intact."""
+    out = []
+    pos = 0
+    length = len(sql)
+    while pos < length:
+        match = _COMMENT_OR_QUOTE.search(sql, pos)
+        if match is None:
+            out.append(sql[pos:])
+            break
+        start = match.start()
+        out.append(sql[pos:start])
+        marker = match.group()
+        if marker in ("'", '"'):
+            end = start + 1
+            while end < length:
+                if sql[end] == marker:
+                    if end + 1 < length and sql[end + 1] == marker:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            out.append(sql[start:end + 1])
+            pos = end + 1
+        elif marker == "--":
+            end = sql.find("\n", start)
+            pos = length if end == -1 else end
+        else:
+            end = sql.find("*/", start + 2)
+            end = length if end == -1 else end + 2
+            # Keep the line structure so control lines stay on their own lines
+            out.append(" " + "\n" * sql.count("\n", start, end))
+            pos = end
+    return "".join(out)
+
+
+def remove_control_lines(sql: str) -> str:
+    """Drops BTEQ dot-commands (.IF, .GOTO, .LABEL, .SET, .QUIT, .LOGON, ...)."""
+    return "\n".join(line for line in sql.split("\n") if not _CONTROL_LINE.match(line))
+
+
+def split_statements(sql: str) -> List[str]:
+    """
+    Splits on terminal semicolons (the last non-blank character of a line).
+    Semicolons inside literals or followed by more text on the same line do
+    not end a statement.
+    """
+    statements = []
+    start = 0
+    for match in _QUOTE_OR_SEMICOLON.finditer(sql):
+        if match.group() != ";":
+            continue
+        line_end = sql.find("\n", match.end())
+        rest = sql[match.end():] if line_end == -1 else sql[match.end():line_end]
+        if rest.strip():
+            continue
+        statement = sql[start:match.start()].strip()
+        if statement:
+            statements.append(statement)
+        start = match.end()
+    tail = sql[start:].strip()
+    if tail:
+        statements.append(tail)
+    return statements
+
+
+def preprocess(sql: str) -> List[str]:
+    """Comment and control-line free statements of a script, in order."""
+    return split_statements(remove_control_lines(strip_comments(sql)))
+
+
+def tokenize(text: str) -> List[Token]:
+    tokens = []
+    for match in _TOKEN.finditer(text):
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "qident":
+            value = value.strip('"').replace('""', '"')
+            kind = "ident"
+        tokens.append(Token(kind, value, value.upper() if kind == "ident" else value))
+    return tokens
+
+
+# ---------- Statement parsing ----------
+
+class _StatementParser:
+    def __init__(self, text: str, default_database: str, known_columns: Dict[str, List[str]]):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.default_database = default_database
+        self.known_columns = known_columns
+        self.info = StatementInfo(kind="OTHER", text=text)
+        # (join type, right table, previous table, condition tokens)
+        self._pending_joins = []
+        # (tables listed with commas at one FROM, WHERE tokens at that depth)
+        self._implicit_joins = []
+
+    # -- helpers --
+
+    def _upper(self, i: int) -> str:
+        return self.tokens[i].upper if i < len(self.tokens) else ""
+
+    def _is_name(self, i: int) -> bool:
+        return i < len(self.tokens) and self.tokens[i].kind == "ident"
+
+    def _read_name(self, i: int) -> Tuple[Optional[str], int]:
+        if not self._is_name(i):
+            return None, i
+        parts = [self.tokens[i].upper]
+        i += 1
+        while self._upper(i) == "." and (self._is_name(i + 1) or self._upper(i + 1) == "*"):
+            parts.append(self.tokens[i + 1].upper)
+            i += 2
+        return ".".join(parts), i
+
+    def _qualify(self, name: str) -> str:
+        if "." not in name and self.default_database:
+            return f"{self.default_database}.{name}"
+        return name
+
+    def _skip_parens(self, i: int) -> int:
+        """Index just past the parenthesis group starting at `i`."""
+        depth = 0
+        while i < len(self.tokens):
+            if self.tokens[i].text == "(":
+                depth += 1
+            elif self.tokens[i].text == ")":
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            i += 1
+        return i
+
+    def _add_table(self, name: str, alias: Optional[str]) -> str:
+        table = self._qualify(name)
+        self.info.aliases[table] = table
+        self.info.aliases.setdefault(table.split(".")[-1], table)
+        if name != table:
+            self.info.aliases.setdefault(name, table)
+        if alias:
+            self.info.aliases[alias] = table
+        if table not in self.info.sources:
+            self.info.sources.append(table)
+        return table
+
+    def _read_table_ref(self, i: int) -> Tuple[Optional[str], int]:
+        """Reads `name [AS] [alias]` or `(subquery) [AS] alias`; returns the table (None for subqueries)."""
+        table = None
+        if self._upper(i) == "(":
+            end = self._skip_parens(i)
+            # Derived table: its own FROM / JOIN clauses still name sources
+            self._scan_tables(i + 1, end=end - 1)
+            i = end
+        else:
+            name, i = self._read_name(i)
+            if name is None:
+                return None, i
+            table = name
+        alias = None
+        if self._upper(i) == "AS":
+            i += 1
+        if self._is_name(i) and self._upper(i) not in _RESERVED:
+            alias = self._upper(i)
+            i += 1
+        if table is not None:
+            table = self._add_table(table, alias)
+        return table, i
+
+    def _collect_until_clause_end(self, i: int) -> Tuple[List[Token], int]:
+        collected = []
+        depth = 0
+        while i < len(self.tokens):
+            token = self.tokens[i]
+            if token.text == "(":
+                depth += 1
+            elif token.text == ")":
+                if depth == 0:
+                    break
+                depth -= 1
+            elif depth == 0 and (token.upper in _CLAUSE_END or token.text in (",", ";")):
+                break
+            collected.append(token)
+            i += 1
+        return collected, i
+
+    # -- table scan --
+
+    def _scan_tables(self, start: int, statement_level_from: bool = False, end: int = None):
+        """
+        Collects tables from FROM / JOIN clauses (and MERGE ... USING). A FROM
+        only counts when a SELECT was seen at the same parenthesis depth, so
+        `EXTRACT(YEAR FROM col)` is not mistaken for a table reference.
+        """
+        tokens = self.tokens
+        select_at_depth = {0: statement_level_from}
+        depth = 0
+        last_table = {}
+        end = len(tokens) if end is None else end
+        i = start
+        while i < end:
+            token = tokens[i]
+            upper = token.upper
+            if token.text == "(":
+                depth += 1
+                select_at_depth[depth] = False
+                i += 1
+            elif token.text == ")":
+                depth = max(0, depth - 1)
+                i += 1
+            elif upper in ("SELECT", "SEL"):
+                select_at_depth[depth] = True
+                i += 1
+            elif upper == "FROM" and select_at_depth.get(depth):
+                i = self._scan_from_list(i + 1, depth, last_table)
+            elif upper == "JOIN":
+                i = self._scan_join(i, depth, last_table)
+            elif upper == "USING" and self.info.kind == "MERGE" and depth == 0:
+                table, i = self._read_table_ref(i + 1)
+                last_table[depth] = table
+                if self._upper(i) == "ON":
+                    conditions, i = self._collect_until_clause_end(i + 1)
+                    self._pending_joins.append(("MERGE", table, self.info.target, conditions))
+            else:
+                i += 1
+
+    def _scan_from_list(self, i: int, depth: int, last_table: dict) -> int:
+        tables = []
+        while True:
+            table, i = self._read_table_ref(i)
+            if table is not None:
+                tables.append(table)
+                last_table[depth] = table
+            if self._upper(i) != ",":
+                break
+            i += 1
+        if len(tables) > 1:
+            # Comma joins: the join conditions live in the WHERE clause (after
+            # the SET clause in a Teradata UPDATE ... FROM)
+            j = i
+            nesting = 0
+            while j < len(self.tokens):
+                token = self.tokens[j]
+                if token.text == "(":
+                    nesting += 1
+                elif token.text == ")":
+                    if nesting == 0:
+                        break
+                    nesting -= 1
+                elif nesting == 0 and token.upper == "WHERE":
+                    where, _ = self._collect_until_clause_end(j + 1)
+                    self._implicit_joins.append((tables, where))
+                    break
+                elif nesting == 0 and (token.upper in ("GROUP", "ORDER", "UNION", "QUALIFY", "HAVING")
+                                       or (token.upper == "SET" and self.info.kind != "UPDATE")):
+                    break
+                j += 1
+        return i
+
+    def _scan_join(self, i: int, depth: int, last_table: dict) -> int:
+        back = i - 1
+        words = []
+        while back >= 0 and self._upper(back) in ("LEFT", "RIGHT", "FULL", "OUTER", "INNER", "CROSS", "NATURAL"):
+            if self._upper(back) not in ("OUTER", "NATURAL"):
+                words.insert(0, self._upper(back))
+            back -= 1
+        join_type = words[-1] if words else "INNER"
+        previous = last_table.get(depth)
+        table, i = self._read_table_ref(i + 1)
+        conditions = []
+        if self._upper(i) == "ON":
+            conditions, i = self._collect_until_clause_end(i + 1)
+        elif self._upper(i) == "USING" and self._upper(i + 1) == "(":
+            end = self._skip_parens(i + 1)
+            columns = [t.upper for t in self.tokens[i + 2:end - 1] if t.kind == "ident"]
+            if previous and table:
+                conditions = tokenize(" AND ".join(f"{previous}.{c} = {table}.{c}" for c in columns))
+            i = end
+        if table is not None:
+            self._pending_joins.append((join_type, table, previous, conditions))
+            last_table[depth] = table
+        return i
+
+    # -- alias resolution --
+
+    def _resolve_table(self, qualifier: str) -> Optional[str]:
+        return self.info.aliases.get(qualifier)
+
+    def _resolve_column(self, name: str) -> Optional[Tuple[str, str]]:
+        """Maps `alias.col` / `db.table.col` to (table, column)."""
+        parts = name.split(".")
+        if len(parts) < 2 or parts[-1] == "*":
+            return None
+        table = self._resolve_table(".".join(parts[:-1]))
+        return (table, parts[-1]) if table else None
+
+    def _record_column(self, table: str, column: str):
+        columns = self.info.column_refs.setdefault(table, [])
+        if column not in columns:
+            columns.append(column)
+
+    def _render(self, tokens: List[Token]) -> Tuple[str, List[str]]:
+        """Renders an expression with aliases replaced by full table names; returns (text, source attributes)."""
+        pieces = []
+        source_attributes = []
+        single_source = self.info.sources[0] if len(self.info.sources) == 1 else None
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token.kind == "ident":
+                parts = [token.upper]
+                j = i + 1
+                while j + 1 < len(tokens) and tokens[j].text == "." and tokens[j + 1].kind in ("ident", "op"):
+                    if tokens[j + 1].kind == "op" and tokens[j + 1].text != "*":
+                        break
+                    parts.append(tokens[j + 1].upper)
+                    j += 2
+                name = ".".join(parts)
+                is_call = j < len(tokens) and tokens[j].text == "("
+                resolved = self._resolve_column(name)
+                if resolved:
+                    name = f"{resolved[0]}.{resolved[1]}"
+                    source_attributes.append(name)
+                    self._record_column(*resolved)
+                elif (len(parts) == 1 and single_source and not is_call and token.upper not in _RESERVED
+                      and token.upper not in _EXPRESSION_KEYWORDS and not (pieces and pieces[-1].upper() == "AS")):
+                    name = f"{single_source}.{token.upper}"
+                    source_attributes.append(name)
+                    self._record_column(single_source, token.upper)
+                else:
+                    name = ".".join(tokens[k].text for k in range(i, j, 2))
+                pieces.append(name)
+                i = j
+                continue
+            pieces.append(token.text)
+            i += 1
+
+        text = _join_pieces(pieces)
+        return text, list(dict.fromkeys(source_attributes))
+
+    def _finish_relationships(self):
+        for join_type, right, previous, conditions in self._pending_joins:
+            rendered = []
+            left = None
+            for part in _split_on_and(conditions):
+                text, attributes = self._render(part)
+                rendered.append(text)
+                for attribute in attributes:
+                    table = attribute.rsplit(".", 1)[0]
+                    if left is None and table != right and table in self.info.aliases.values():
+                        left = table
+            left = left or previous
+            if left and right and left != right:
+                self.info.relationships.append({
+                    "type": join_type,
+                    "left_entity": left,
+                    "right_entity": right,
+                    "join_conditions": rendered,
+                })
+
+        for tables, where in self._implicit_joins:
+            pairs = {}
+            for part in _split_on_and(where):
+                texts = [t.text for t in part]
+                if texts.count("=") != 1 or len(part) < 3:
+                    continue
+                rendered, attributes = self._render(part)
+                sides = {attribute.rsplit(".", 1)[0] for attribute in attributes}
+                if len(attributes) == 2 and len(sides) == 2 and sides <= set(tables):
+                    left, right = (attributes[0].rsplit(".", 1)[0], attributes[1].rsplit(".", 1)[0])
+                    pairs.setdefault((left, right), []).append(rendered)
+            for (left, right), conditions in pairs.items():
+                self.info.relationships.append({
+                    "type": "INNER",
+                    "left_entity": left,
+                    "right_entity": right,
+                    "join_conditions": conditions,
+                })
+
+    # -- statements --
+
+    def parse(self) -> StatementInfo:
+        if not self.tokens:
+            return self.info
+        first = _ABBREVIATIONS.get(self.tokens[0].upper, self.tokens[0].upper)
+        # Teradata request modifiers: LOCKING ROW FOR ACCESS SELECT ...
+        start = 0
+        if first == "LOCKING":
+            while start < len(self.tokens) and self._upper(start) not in ("SELECT", "SEL", "INSERT", "INS",
+                                                                          "UPDATE", "UPD", "DELETE", "DEL"):
+                start += 1
+            first = _ABBREVIATIONS.get(self._upper(start), self._upper(start))
+
+        if first in ("DATABASE", "USE"):
+            self.info.kind = "DATABASE"
+            self.info.database, _ = self._read_name(start + 1)
+        elif first == "CREATE" or first == "CT":
+            self._parse_create(start)
+        elif first == "INSERT":
+            self._parse_insert(start)
+        elif first == "UPDATE":
+            self._parse_update(start)
+        elif first == "DELETE":
+            self._parse_delete(start)
+        elif first == "MERGE":
+            self._parse_merge(start)
+        elif first in ("SELECT", "WITH"):
+            self.info.kind = "SELECT"
+            self._scan_tables(start)
+        else:
+            return self.info
+        self._finish_relationships()
+        return self.info
+
+    def _parse_create(self, start: int):
+        i = start + 1
+        if self.tokens[start].upper != "CT":
+            # CREATE [SET|MULTISET] [VOLATILE|GLOBAL TEMPORARY] TABLE name
+            while i < len(self.tokens) and self._upper(i) != "TABLE":
+                if self._upper(i) in ("VIEW", "PROCEDURE", "MACRO", "INDEX", "FUNCTION", "DATABASE", "USER", "("):
+                    return
+                i += 1
+            i += 1
+        name, i = self._read_name(i)
+        if name is None:
+            return
+        self.info.kind = "CREATE_TABLE"
+        self.info.target = self._qualify(name)
+
+        # Skip Teradata table options: ", NO FALLBACK, NO BEFORE JOURNAL ..."
+        while i < len(self.tokens) and self.tokens[i].text == ",":
+            i += 1
+            while i < len(self.tokens) and self.tokens[i].text not in (",", "(") and self._upper(i) != "AS":
+                i += 1
+
+        if self._upper(i) == "AS":
+            # CREATE TABLE ... AS (SELECT ...) / AS source_table WITH DATA
+            if self._is_name(i + 1) and self._upper(i + 1) not in ("SELECT", "SEL"):
+                self._read_table_ref(i + 1)
+            else:
+                self._scan_tables(i + 1)
+            self.info.kind = "CREATE_TABLE_AS"
+            return
+
+        if self._upper(i) == "(":
+            end = self._skip_parens(i)
+            for definition in _split_top_level(self.tokens[i + 1:end - 1]):
+                self._parse_column_definition(definition)
+            i = end
+
+        # [UNIQUE] PRIMARY INDEX (cols) / PRIMARY KEY (cols)
+        while i < len(self.tokens):
+            if self._upper(i) == "PRIMARY" and self._upper(i + 1) in ("INDEX", "KEY"):
+                j = i + 2
+                if self._is_name(j) and self._upper(j + 1) == "(":
+                    j += 1
+                if self._upper(j) == "(":
+                    end = self._skip_parens(j)
+                    self.info.primary_key = self.info.primary_key or [
+                        t.upper for t in self.tokens[j + 1:end - 1] if t.kind == "ident"
+                    ]
+                    i = end
+                    continue
+            i += 1
+
+    def _parse_column_definition(self, definition: List[Token]):
+        if not definition or definition[0].kind != "ident":
+            return
+        if definition[0].upper in _TABLE_CONSTRAINTS:
+            keyword_index = next((k for k, t in enumerate(definition) if t.text == "("), None)
+            if keyword_index is not None and definition[0].upper in ("PRIMARY", "UNIQUE", "CONSTRAINT"):
+                if any(t.upper == "PRIMARY" for t in definition[:keyword_index]):
+                    self.info.primary_key = [t.upper for t in definition[keyword_index:] if t.kind == "ident"]
+            return
+        type_tokens = []
+        depth = 0
+        for token in definition[1:]:
+            if depth == 0 and token.upper in _COLUMN_CONSTRAINTS:
+                break
+            if token.text == "(":
+                depth += 1
+            elif token.text == ")":
+                depth -= 1
+            type_tokens.append(token)
+        upper_definition = [t.upper for t in definition]
+        not_null = any(
+            upper_definition[k] == "NOT" and upper_definition[k + 1] == "NULL"
+            for k in range(len(upper_definition) - 1)
+        )
+        if "PRIMARY" in upper_definition and "KEY" in upper_definition:
+            self.info.primary_key.append(definition[0].upper)
+        data_type = _join_pieces([t.upper if t.kind == "ident" else t.text for t in type_tokens])
+        self.info.columns.append({
+            "attribute_name": definition[0].upper,
+            "data_type": data_type.strip(),
+            "is_nullable": not not_null,
+        })
+
+    def _parse_insert(self, start: int):
+        self.info.kind = "INSERT"
+        i = start + 1
+        if self._upper(i) == "INTO":
+            i += 1
+        name, i = self._read_name(i)
+        if name is None:
+            return
+        target = self._qualify(name)
+        self.info.target = target
+        target_columns = []
+        if self._upper(i) == "(":
+            end = self._skip_parens(i)
+            target_columns = [t.upper for t in self.tokens[i + 1:end - 1] if t.kind == "ident"]
+            i = end
+        self._scan_tables(i)
+        for column in target_columns:
+            self._record_column(target, column)
+
+        if not target_columns:
+            target_columns = self.known_columns.get(target, [])
+        if self._upper(i) == "VALUES" and self._upper(i + 1) == "(":
+            end = self._skip_parens(i + 1)
+            expressions = _split_top_level(self.tokens[i + 2:end - 1])
+        elif self._upper(i) in ("SELECT", "SEL") or self._upper(i) == "(":
+            expressions = self._select_list(i)
+        else:
+            expressions = []
+        if expressions and target_columns and len(expressions) == len(target_columns):
+            for column, expression in zip(target_columns, expressions):
+                logic, source_attributes = self._render(expression)
+                self.info.attribute_mappings.append({
+                    "target_attribute": column,
+                    "source_attributes": source_attributes,
+                    "transformation_logic": logic,
+                })
+
+    def _select_list(self, i: int) -> List[List[Token]]:
+        while self._upper(i) == "(":
+            i += 1
+        if self._upper(i) not in ("SELECT", "SEL"):
+            return []
+        i += 1
+        if self._upper(i) in ("DISTINCT", "ALL"):
+            i += 1
+        if self._upper(i) == "TOP":
+            i += 2
+        items, _ = self._collect_select_items(i)
+        expressions = []
+        for item in items:
+            if item[-1].text == "*":
+                # SELECT * / T1.*: the columns cannot be mapped positionally
+                return []
+            expressions.append(_strip_select_alias(item))
+        return expressions
+
+    def _collect_select_items(self, i: int) -> Tuple[List[List[Token]], int]:
+        items = [[]]
+        depth = 0
+        while i < len(self.tokens):
+            token = self.tokens[i]
+            if token.text == "(":
+                depth += 1
+            elif token.text == ")":
+                if depth == 0:
+                    break
+                depth -= 1
+            elif depth == 0 and token.upper in ("FROM", "UNION", "INTERSECT", "EXCEPT", "MINUS"):
+                break
+            elif depth == 0 and token.text == ",":
+                items.append([])
+                i += 1
+                continue
+            items[-1].append(token)
+            i += 1
+        return [item for item in items if item], i
+
+    def _parse_update(self, start: int):
+        self.info.kind = "UPDATE"
+        name, i = self._read_name(start + 1)
+        if name is None:
+            return
+        alias = None
+        if self._upper(i) == "AS":
+            i += 1
+        if self._is_name(i) and self._upper(i) not in _RESERVED:
+            alias = self._upper(i)
+            i += 1
+        # Teradata: UPDATE alias FROM t1 alias, t2 src SET ...; ANSI: UPDATE t [alias] SET ... [FROM ...]
+        self._scan_tables(i, statement_level_from=True)
+        target = self._resolve_table(name)
+        if target is None:
+            target = self._add_table(name, alias)
+        elif alias:
+            self.info.aliases[alias] = target
+        self.info.target = target
+        if target in self.info.sources:
+            self.info.sources.remove(target)
+
+        set_index = next((k for k, t in enumerate(self.tokens) if t.upper == "SET"), None)
+        if set_index is None:
+            return
+        assignments, _ = self._collect_assignments(set_index + 1)
+        for assignment in assignments:
+            equals = next((k for k, t in enumerate(assignment) if t.text == "="), None)
+            if equals is None or equals == 0:
+                continue
+            column = assignment[equals - 1].upper
+            self._record_column(target, column)
+            logic, source_attributes = self._render(assignment[equals + 1:])
+            self.info.attribute_mappings.append({
+                "target_attribute": column,
+                "source_attributes": source_attributes,
+                "transformation_logic": logic,
+            })
+
+    def _collect_assignments(self, i: int) -> Tuple[List[List[Token]], int]:
+        items = [[]]
+        depth = 0
+        while i < len(self.tokens):
+            token = self.tokens[i]
+            if token.text == "(":
+                depth += 1
+            elif token.text == ")":
+                depth -= 1
+            elif depth == 0 and token.upper in ("WHERE", "FROM", "ELSE"):
+                break
+            elif depth == 0 and token.text == ",":
+                items.append([])
+                i += 1
+                continue
+            items[-1].append(token)
+            i += 1
+        return [item for item in items if item], i
+
+    def _parse_delete(self, start: int):
+        self.info.kind = "DELETE"
+        i = start + 1
+        if self._upper(i) == "FROM":
+            i += 1
+        name, i = self._read_name(i)
+        if name is None:
+            return
+        alias = None
+        if self._is_name(i) and self._upper(i) not in _RESERVED:
+            alias = self._upper(i)
+            i += 1
+        self._scan_tables(i, statement_level_from=True)
+        target = self._resolve_table(name) or self._qualify(name)
+        self.info.aliases[target] = target
+        if alias:
+            self.info.aliases[alias] = target
+        self.info.target = target
+        if target in self.info.sources:
+            self.info.sources.remove(target)
+
+    def _parse_merge(self, start: int):
+        self.info.kind = "MERGE"
+        i = start + 1
+        if self._upper(i) == "INTO":
+            i += 1
+        name, i = self._read_name(i)
+        if name is None:
+            return
+        target = self._qualify(name)
+        self.info.target = target
+        self.info.aliases[target] = target
+        self.info.aliases.setdefault(target.split(".")[-1], target)
+        if self._upper(i) == "AS":
+            i += 1
+        if self._is_name(i) and self._upper(i) not in _RESERVED:
+            self.info.aliases[self._upper(i)] = target
+            i += 1
+        self._scan_tables(i)
+
+
+def _join_pieces(pieces: List[str]) -> str:
+    """Joins rendered tokens with SQL-style spacing: `SUM(A.B * C)`, `IN ('X', 'Y')`."""
+    text = ""
+    for index, piece in enumerate(pieces):
+        previous = pieces[index - 1] if index else ""
+        if index == 0:
+            text = piece
+        elif piece in (")", ",", ".") or previous in ("(", "."):
+            text += piece
+        elif piece == "(" and previous.upper() not in _SPACED_BEFORE_PAREN and re.match(r"^[\w$#.]+$", previous):
+            text += piece
+        else:
+            text += " " + piece
+    return text
+
+
+def _strip_select_alias(item: List[Token]) -> List[Token]:
+    """Drops `AS alias` or a bare trailing alias from a select-list item."""
+    if len(item) >= 3 and item[-2].upper == "AS":
+        return item[:-2]
+    if len(item) >= 2:
+        last, before = item[-1], item[-2]
+        if (last.kind == "ident" and last.upper not in _RESERVED and last.upper not in _EXPRESSION_KEYWORDS
+                and (before.kind in ("ident", "number") or before.text == ")")
+                and before.upper not in _EXPRESSION_KEYWORDS - {"END"}):
+            return item[:-1]
+    return item
+
+
+def _split_top_level(tokens: List[Token], separator: str = ",") -> List[List[Token]]:
+    parts = [[]]
+    depth = 0
+    for token in tokens:
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+        elif depth == 0 and token.text == separator:
+            parts.append([])
+            continue
+        parts[-1].append(token)
+    return [part for part in parts if part]
+
+
+def _split_on_and(tokens: List[Token]) -> List[List[Token]]:
+    parts = [[]]
+    depth = 0
+    between = False
+    for token in tokens:
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+        elif depth == 0 and token.upper == "BETWEEN":
+            between = True
+        elif depth == 0 and token.upper == "AND":
+            if between:
+                between = False
+            else:
+                parts.append([])
+                continue
+        parts[-1].append(token)
+    # Strip the parentheses around a whole condition
+    cleaned = []
+    for part in parts:
+        while len(part) >= 2 and part[0].text == "(" and part[-1].text == ")" and \
+                len(_split_top_level(part[1:-1], ")")) == 1:
+            part = part[1:-1]
+        if part:
+            cleaned.append(part)
+    return cleaned
+
+
+def parse_statement(text: str, default_database: str = "", known_columns: Dict[str, List[str]] = None) -> StatementInfo:
+    """Parses a single comment-free statement."""
+    return _StatementParser(text, default_database, known_columns or {}).parse()
+
+
+def read_job_header(sql: str) -> Tuple[str, str]:
+    """Job name and version from a script's header comment ("Job: ...  Version: v1.2"), if present."""
+    job_name = _JOB_NAME.search(sql)
+    version = _VERSION.search(sql)
+    return (job_name.group(1).strip() if job_name else "", version.group(1) if version else "")
+
+
+def parse_script(sql: str) -> ParsedScript:
+    """Parses every statement of a script, tracking the `DATABASE` default and DDL columns."""
+    job_name, version = read_job_header(sql)
+    parsed = ParsedScript(statements=[], job_name=job_name, version=version)
+    database = ""
+    known_columns = {}
+    for text in preprocess(sql):
+        info = parse_statement(text, database, known_columns)
+        if info.kind == "DATABASE" and info.database:
+            database = info.database
+            parsed.default_database = parsed.default_database or database
+        elif info.kind == "CREATE_TABLE" and info.columns:
+            known_columns[info.target] = [column["attribute_name"] for column in info.columns]
+        parsed.statements.append(info)
+    return parsed
+
+
+# ---------- parser_output assembly ----------
+
+def _entity_type(name: str, modified: set) -> str:
+    if name.split(".")[-1].upper().startswith("WK_"):
+        return "WORK_TABLE"
+    return "TARGET_TABLE" if name in modified else "SOURCE_TABLE"
+
+
+def _flow_description(info: StatementInfo) -> str:
+    verb = {"INSERT": "Populate", "UPDATE": "Update", "MERGE": "Merge into"}[info.kind]
+    if info.sources:
+        return f"{verb} {info.target} from {', '.join(info.sources)}."
+    return f"{verb} {info.target}."
+
+
+def build_parser_output(sql_or_parsed) -> dict:
+    """
+    Builds a `parser_output` dict (job_metadata, entities, relationships,
+    data_flows) from a script or a `ParsedScript`, without any model call.
+    Attribute mappings are filled where they can be derived positionally
+    (INSERT column lists, target DDL, UPDATE ... SET) and left empty
+    otherwise.
+    """
+    parsed = parse_script(sql_or_parsed) if isinstance(sql_or_parsed, str) else sql_or_parsed
+
+    entities = {}
+    modified = set()
+    relationships = []
+    seen_relationships = set()
+    data_flows = []
+
+    def entity(name: str) -> dict:
+        if name not in entities:
+            entities[name] = {
+                "entity_name": name,
+                "entity_type": "",
+                "creation_source": "Inferred from DML",
+                "primary_key": [],
+                "attributes": [],
+            }
+        return entities[name]
+
+    for info in parsed.statements:
+        if info.kind in ("CREATE_TABLE", "CREATE_TABLE_AS") and info.target:
+            created = entity(info.target)
+            if info.columns:
+                created["creation_source"] = "CREATE TABLE DDL"
+                created["attributes"] = [dict(column) for column in info.columns]
+            if info.primary_key:
+                created["primary_key"] = list(info.primary_key)
+        if info.target and info.kind in _MODIFYING_KINDS:
+            entity(info.target)
+            modified.add(info.target)
+        for source in info.sources:
+            entity(source)
+        for relationship in info.relationships:
+            key = (relationship["type"], relationship["left_entity"], relationship["right_entity"],
+                   tuple(relationship["join_conditions"]))
+            if key not in seen_relationships:
+                seen_relationships.add(key)
+                relationships.append(relationship)
+        if info.kind in _FLOW_KINDS and info.target:
+            data_flows.append({
+                "flow_description": _flow_description(info),
+                "operation_type": info.kind,
+                "target_entity": info.target,
+                "source_entities": [source for source in info.sources if source != info.target],
+                "attribute_mappings": info.attribute_mappings,
+            })
+        if info.kind == "CREATE_TABLE_AS" and info.target:
+            modified.add(info.target)
+
+    # Inferred attributes for tables without DDL
+    for info in parsed.statements:
+        for table, columns in info.column_refs.items():
+            if table not in entities or entities[table]["creation_source"] == "CREATE TABLE DDL":
+                continue
+            known = {attribute["attribute_name"] for attribute in entities[table]["attributes"]}
+            for column in columns:
+                if column not in known:
+                    known.add(column)
+                    entities[table]["attributes"].append(
+                        {"attribute_name": column, "data_type": "", "is_nullable": True}
+                    )
+
+    for name, details in entities.items():
+        details["entity_type"] = _entity_type(name, modified)
+
+    sources = [name for name, details in entities.items() if details["entity_type"] == "SOURCE_TABLE"]
+    targets = [name for name, details in entities.items() if details["entity_type"] == "TARGET_TABLE"]
+    overview = f"Reads {len(sources)} source table(s) and writes {len(targets)} target table(s)"
+    overview += f": {', '.join(targets)}." if targets else "."
+
+    return {
+        "job_metadata": {
+            "job_name": parsed.job_name,
+            "version": parsed.version,
+            "default_database": parsed.default_database,
+            "functional_overview": overview,
+        },
+        "entities": list(entities.values()),
+        "relationships": relationships,
+        "data_flows": data_flows,
+    }
@@ -0,0 +1,197 @@
+"""
+Statement-level memoization of model extractions across files.
+
+ETL estates repeat the same INSERT ... SELECT, UPDATE or DDL statements in
+many job files. Each statement of a script gets a content-addressed key
+(its whitespace-normalized text plus the context it depends on: the
+`DATABASE` default in effect and the DDL of earlier tables it uses), and
+the part of the model's `parser_output` that belongs to it (its data
+flows, the relationships between its tables, and those tables' entities)
+is cached as a fragment under that key.
+
+A script is then analyzed by sending the model only the statements whose
+fragments are not cached yet, splitting the answer back into fragments,
+and assembling the file's `parser_output` from cached and fresh fragments
+in statement order.
+"""
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from src.agents.shared_libraries.sql_chunking import merge_parser_outputs
+from src.agents.shared_libraries.sql_minimizer import collapse_whitespace
+from src.agents.shared_libraries.sql_parser import StatementInfo, parse_statement, preprocess, read_job_header
+
+# Statements whose fragment is only trusted when the model returned a flow for them
+_FLOW_KINDS = ("INSERT", "UPDATE", "MERGE", "CREATE_TABLE_AS")
+
+
+@dataclass
+class StatementUnit:
+    """One statement of a script and the key its fragment is cached under."""
+    index: int
+    text: str
+    info: StatementInfo
+    database: str
+    key: str
+    context: List[str] = field(default_factory=list)
+
+    @property
+    def tables(self) -> List[str]:
+        return [table for table in [self.info.target, *self.info.sources] if table]
+
+
+@dataclass
+class StatementPlan:
+    units: List[StatementUnit]
+    job_name: str = ""
+    version: str = ""
+
+    @property
+    def keys(self) -> List[str]:
+        return list(dict.fromkeys(unit.key for unit in self.units))
+
+
+def statement_key(text: str, database: str, context: List[str], version: str, model_name: str) -> str:
+    """Content-addressed key of a statement's fragment."""
+    digest = hashlib.sha256()
+    for part in (version, model_name, database.upper(), collapse_whitespace(text), *map(collapse_whitespace, context)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def plan_statements(sql: str, version: str, model_name: str) -> StatementPlan:
+    """
+    Splits a script into statement units (every statement except `DATABASE`
+    switches, which only become part of the following statements' keys).
+    """
+    job_name, job_version = read_job_header(sql)
+    plan = StatementPlan(units=[], job_name=job_name, version=job_version)
+    database = ""
+    ddl = {}
+    for text in preprocess(sql):
+        info = parse_statement(text, database)
+        if info.kind == "DATABASE":
+            database = info.database or database
+            continue
+        context = [ddl[table] for table in dict.fromkeys([info.target, *info.sources]) if table in ddl]
+        plan.units.append(StatementUnit(
+            index=len(plan.units), text=text, info=info, database=database,
+            key=statement_key(text, database, context, version, model_name), context=context,
+        ))
+        if info.kind == "CREATE_TABLE" and info.target:
+            ddl[info.target] = text
+    return plan
+
+
+def build_partial_script(plan: StatementPlan, pending_keys: set) -> str:
+    """
+    The script to send the model for the statements in `pending_keys`: each
+    distinct pending statement once, preceded by the `DATABASE` default and
+    the DDL it depends on. Returns "" when nothing is pending.
+    """
+    lines = []
+    if plan.job_name or plan.version:
+        header = [f"Job: {plan.job_name}"] if plan.job_name else []
+        header += [f"Version: {plan.version}"] if plan.version else []
+        lines.append(f"/* {'  '.join(header)} */")
+    emitted = set()
+    database = ""
+    for unit in plan.units:
+        if unit.key not in pending_keys or unit.key in emitted:
+            continue
+        emitted.add(unit.key)
+        if unit.database and unit.database != database:
+            lines.append(f"DATABASE {unit.database};")
+            database = unit.database
+        for statement in unit.context:
+            if statement not in emitted:
+                emitted.add(statement)
+                lines.append(statement + ";")
+        lines.append(unit.text + ";")
+    return "\n".join(lines) + "\n" if emitted else ""
+
+
+def _same_table(name: str, table: str) -> bool:
+    name, table = str(name or "").upper().strip(), table.upper()
+    if name == table:
+        return True
+    # The model does not always qualify names the script left unqualified
+    return ("." not in name or "." not in table) and name.split(".")[-1] == table.split(".")[-1]
+
+
+def _operation_matches(operation_type: str, kind: str) -> bool:
+    words = str(operation_type or "").upper().replace("_", " ").split()
+    return bool(words) and words[0] == kind.split("_")[0]
+
+
+def split_into_fragments(output: dict, plan: StatementPlan, pending_keys: set) -> Tuple[Dict[str, dict], dict]:
+    """
+    Distributes the model's `parser_output` for a partial script over its
+    pending statements. A data flow goes to the statement with the same
+    target and operation (in script order); a relationship and an entity go
+    to every statement that uses the tables involved. Returns the fragments
+    by key and the leftover flows and relationships no statement claimed.
+    """
+    units = []
+    seen = set()
+    for unit in plan.units:
+        if unit.key in pending_keys and unit.key not in seen:
+            seen.add(unit.key)
+            units.append(unit)
+    fragments = {unit.key: {"data_flows": [], "relationships": [], "entities": []} for unit in units}
+    leftover = {"data_flows": [], "relationships": []}
+
+    for flow in output.get("data_flows") or []:
+        target = flow.get("target_entity")
+        candidates = [unit for unit in units if unit.info.target and _same_table(target, unit.info.target)]
+        matching = [unit for unit in candidates if _operation_matches(flow.get("operation_type"), unit.info.kind)]
+        candidates = matching or candidates
+        if not candidates:
+            leftover["data_flows"].append(flow)
+            continue
+        unit = next((unit for unit in candidates if not fragments[unit.key]["data_flows"]), candidates[-1])
+        fragments[unit.key]["data_flows"].append(flow)
+
+    for relationship in output.get("relationships") or []:
+        claimed = False
+        for unit in units:
+            tables = unit.tables
+            if any(_same_table(relationship.get("left_entity"), t) for t in tables) and \
+                    any(_same_table(relationship.get("right_entity"), t) for t in tables):
+                fragments[unit.key]["relationships"].append(relationship)
+                claimed = True
+        if not claimed:
+            leftover["relationships"].append(relationship)
+
+    for entity in output.get("entities") or []:
+        for unit in units:
+            if any(_same_table(entity.get("entity_name"), table) for table in unit.tables):
+                fragments[unit.key]["entities"].append(entity)
+
+    return fragments, leftover
+
+
+def cacheable_fragments(fragments: Dict[str, dict], plan: StatementPlan) -> Dict[str, dict]:
+    """
+    The fragments safe to reuse in other files: a statement that should
+    produce a data flow is only cached once the model returned one for it.
+    """
+    kinds = {unit.key: unit.info.kind for unit in plan.units}
+    return {
+        key: fragment for key, fragment in fragments.items()
+        if kinds.get(key) not in _FLOW_KINDS or fragment["data_flows"]
+    }
+
+
+def assemble_parser_output(plan: StatementPlan, fragments: Dict[str, dict], fresh_output: Optional[dict] = None,
+                           leftover: Optional[dict] = None, sql: str = "") -> dict:
+    """Builds a file's `parser_output` from its statements' fragments, in statement order."""
+    outputs = []
+    if fresh_output:
+        outputs.append({"job_metadata": fresh_output.get("job_metadata") or {}})
+    outputs += [fragments[unit.key] for unit in plan.units if unit.key in fragments]
+    if leftover:
+        outputs.append(leftover)
+    return merge_parser_outputs(outputs, sql)
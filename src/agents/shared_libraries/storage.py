@@ -0,0 +1,408 @@
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional, Sequence
+
+import pyarrow as pa
+
+from src.agents.shared_libraries import bq_utils
+from src.agents.shared_libraries.completed_index import CompletedFilesIndex
+from src.agents.shared_libraries.resources import get_settings
+from src.agents.shared_libraries.row_writer import BufferedRowWriter
+
+
+class StorageBackend(ABC):
+    """
+    Persistence interface for SQL analysis results.
+
+    Rows follow the sql extracts table layout produced by
+    `bq_utils.build_sql_extract_row`.
+    """
+
+    # Whether inserts should go through the write-behind buffer
+    buffered_writes = False
+
+    @abstractmethod
+    def insert_extracts(self, rows: List[dict]) -> list:
+        """
+        Inserts rows. Returns `insert_rows_json`-style per-row errors
+        (`{"index": i, "errors": [...]}`); raises if the whole call fails.
+        """
+
+    @abstractmethod
+    def iter_batches(self, application_name: str, columns: Sequence[str],
+                     order_by: Sequence[str] = ("inserted_at", "sql_id"), since: str = None) -> Iterator[pa.RecordBatch]:
+        """
+        Streams an application's rows as Arrow record batches with only
+        `columns`, in `order_by` order (column names, optionally followed by
+        ASC or DESC); only rows inserted at or after
+        `since` when it is given. Bulk readers (the report, the data model)
+        use this instead of loading every row.
+        """
+
+    @abstractmethod
+    def fetch_page(self, application_name: str, columns: Sequence[str], limit: int,
+                   after: Optional[Sequence[str]] = None, sql_ids: Optional[Sequence[str]] = None) -> List[dict]:
+        """
+        Returns up to `limit` rows with `columns` plus `inserted_at` and
+        `sql_id`, newest first (by `inserted_at`, then `sql_id`). `after` is
+        the (inserted_at, sql_id) key of the previous page's last row;
+        `sql_ids` restricts the rows to those records.
+        """
+
+    @abstractmethod
+    def list_completed_files(self, application_name: str) -> List[str]:
+        """Returns the distinct file names already analyzed for an application."""
+
+    @abstractmethod
+    def is_file_completed(self, application_name: str, sql_file_name: str) -> Optional[bool]:
+        """Point lookup for a single (application, file) pair; None when the lookup fails."""
+
+    @abstractmethod
+    def fetch_latest_data_model(self, application_name: str) -> Optional[dict]:
+        """
+        Returns the newest materialized data model version of an application
+        (`version`, `watermark`, `recent_records`, `fingerprint`, `state`,
+        `result`, `created_at`),
+        or None.
+        """
+
+    @abstractmethod
+    def save_data_model(self, row: dict):
+        """Appends a materialized data model version; raises if it cannot be stored."""
+
+    def close(self):
+        pass
+
+
+class BigQueryStorage(StorageBackend):
+    """Stores analysis results in the BigQuery sql extracts table."""
+
+    def __init__(self, buffered_writes: bool = True):
+        self.buffered_writes = buffered_writes
+        self._data_models_table_ready = False
+
+    def insert_extracts(self, rows: List[dict]) -> list:
+        return bq_utils.insert_rows_to_bq(rows)
+
+    def iter_batches(self, application_name: str, columns: Sequence[str],
+                     order_by: Sequence[str] = ("inserted_at", "sql_id"), since: str = None) -> Iterator[pa.RecordBatch]:
+        return bq_utils.iter_extract_batches_from_bq(application_name, columns, order_by, since)
+
+    def fetch_page(self, application_name: str, columns: Sequence[str], limit: int,
+                   after: Optional[Sequence[str]] = None, sql_ids: Optional[Sequence[str]] = None) -> List[dict]:
+        return bq_utils.fetch_extract_page_from_bq(application_name, columns, limit, after, sql_ids)
+
+    def list_completed_files(self, application_name: str) -> List[str]:
+        return bq_utils.get_completed_sql_files_from_bq(application_name)
+
+    def is_file_completed(self, application_name: str, sql_file_name: str) -> Optional[bool]:
+        return bq_utils.is_sql_file_completed_in_bq(application_name, sql_file_name)
+
+    def _ensure_data_models_table(self):
+        # Checked before the first read, so a new table has had time to accept streaming inserts by the first save
+        if self._data_models_table_ready:
+            return
+        try:
+            bq_utils.ensure_data_models_table()
+            self._data_models_table_ready = True
+        except Exception as e:
+            print(f"Could not create the data models table: {e}")
+
+    def fetch_latest_data_model(self, application_name: str) -> Optional[dict]:
+        self._ensure_data_models_table()
+        return bq_utils.fetch_latest_data_model_from_bq(application_name)
+
+    def save_data_model(self, row: dict):
+        self._ensure_data_models_table()
+        errors = bq_utils.insert_data_model_to_bq(row)
+        if errors:
+            raise RuntimeError(f"Failed to store the data model: {errors}")
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Stores analysis results in an embedded SQLite database, for local
+    development, on-prem deployments, tests and benchmarks. The table is
+    indexed on (application_name, sql_file_name), inserted_at and the
+    (application_name, inserted_at, sql_id) page key.
+    Materialized data models are kept in a `data_models` table.
+    """
+
+    COLUMNS = bq_utils.EXTRACT_COLUMNS
+
+    def __init__(self, db_path: str, batch_rows: int = 500):
+        self.db_path = db_path
+        self.batch_rows = batch_rows
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._connect()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sql_extracts (
+                sql_id TEXT PRIMARY KEY,
+                sql_file_name TEXT,
+                raw_sql_text TEXT,
+                parser_output TEXT,
+                processing_status TEXT,
+                application_name TEXT,
+                inserted_at TEXT,
+                parser_output_tables TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_sql_extracts_app_file
+                ON sql_extracts (application_name, sql_file_name);
+            CREATE INDEX IF NOT EXISTS idx_sql_extracts_inserted_at
+                ON sql_extracts (inserted_at);
+            CREATE INDEX IF NOT EXISTS idx_sql_extracts_app_inserted_at
+                ON sql_extracts (application_name, inserted_at, sql_id);
+            CREATE TABLE IF NOT EXISTS data_models (
+                application_name TEXT,
+                version INTEGER,
+                watermark TEXT,
+                recent_records TEXT,
+                fingerprint TEXT,
+                state TEXT,
+                result TEXT,
+                created_at TEXT,
+                PRIMARY KEY (application_name, version)
+            );
+            """
+        )
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers run alongside the writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def insert_extracts(self, rows: List[dict]) -> list:
+        conn = self._connect()
+        placeholders = ", ".join("?" for _ in self.COLUMNS)
+        errors = []
+        with conn:
+            for index, row in enumerate(rows):
+                try:
+                    conn.execute(
+                        f"INSERT INTO sql_extracts ({', '.join(self.COLUMNS)}) VALUES ({placeholders})",
+                        tuple(row.get(column) for column in self.COLUMNS),
+                    )
+                except sqlite3.Error as e:
+                    errors.append({"index": index, "errors": [{"reason": "sqlite", "message": str(e)}]})
+        return errors
+
+    def _query(self, sql: str, params: tuple) -> List[dict]:
+        return [dict(row) for row in self._connect().execute(sql, params).fetchall()]
+
+    def iter_batches(self, application_name: str, columns: Sequence[str],
+                     order_by: Sequence[str] = ("inserted_at", "sql_id"), since: str = None) -> Iterator[pa.RecordBatch]:
+        columns = bq_utils.check_extract_columns(columns)
+        order_by = bq_utils.check_extract_order(order_by)
+        sql = f"SELECT {', '.join(columns)} FROM sql_extracts WHERE application_name = ?"
+        params = (application_name,)
+        if since:
+            sql += " AND inserted_at >= ?"
+            params += (since,)
+        # A connection of its own: the generator may be resumed from other threads
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        try:
+            cursor = conn.execute(f"{sql} ORDER BY {', '.join(order_by)}", params)
+            schema = pa.schema([(column, pa.string()) for column in columns])
+            while True:
+                rows = cursor.fetchmany(self.batch_rows)
+                if not rows:
+                    break
+                yield pa.RecordBatch.from_arrays(
+                    [pa.array([row[i] for row in rows], type=pa.string()) for i in range(len(columns))],
+                    schema=schema,
+                )
+        finally:
+            conn.close()
+
+    def fetch_page(self, application_name: str, columns: Sequence[str], limit: int,
+                   after: Optional[Sequence[str]] = None, sql_ids: Optional[Sequence[str]] = None) -> List[dict]:
+        columns = bq_utils.check_extract_columns(columns)
+        selected = columns + [column for column in ("inserted_at", "sql_id") if column not in columns]
+        sql = f"SELECT {', '.join(selected)} FROM sql_extracts WHERE application_name = ?"
+        params = (application_name,)
+        if sql_ids is not None:
+            sql += f" AND sql_id IN ({', '.join('?' for _ in sql_ids)})"
+            params += tuple(sql_ids)
+        if after:
+            sql += " AND (inserted_at < ? OR (inserted_at = ? AND sql_id < ?))"
+            params += (after[0], after[0], after[1])
+        return self._query(f"{sql} ORDER BY inserted_at DESC, sql_id DESC LIMIT ?", params + (limit,))
+
+    def list_completed_files(self, application_name: str) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT DISTINCT sql_file_name FROM sql_extracts WHERE application_name = ?", (application_name,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def is_file_completed(self, application_name: str, sql_file_name: str) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM sql_extracts WHERE application_name = ? AND sql_file_name = ? LIMIT 1",
+            (application_name, sql_file_name),
+        ).fetchone()
+        return row is not None
+
+    def fetch_latest_data_model(self, application_name: str) -> Optional[dict]:
+        rows = self._query(
+            "SELECT application_name, version, watermark, recent_records, fingerprint, state, result, created_at "
+            "FROM data_models "
+            "WHERE application_name = ? ORDER BY version DESC LIMIT 1",
+            (application_name,),
+        )
+        return rows[0] if rows else None
+
+    def save_data_model(self, row: dict):
+        columns = ("application_name", "version", "watermark", "recent_records", "fingerprint", "state", "result",
+                   "created_at")
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO data_models ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                tuple(row.get(column) for column in columns),
+            )
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+_storage = None
+_completed_files_index = None
+_row_writer = None
+_lock = threading.RLock()
+
+
+def get_storage() -> StorageBackend:
+    """Returns the configured storage backend (`STORAGE_BACKEND`: "bigquery" or "sqlite")."""
+    global _storage
+    with _lock:
+        if _storage is None:
+            config = get_settings()
+            if config.STORAGE_BACKEND == "sqlite":
+                _storage = SQLiteStorage(config.LOCAL_STORAGE_PATH, batch_rows=config.READ_BATCH_ROWS)
+            elif config.STORAGE_BACKEND == "bigquery":
+                _storage = BigQueryStorage(buffered_writes=config.BQ_WRITE_BUFFER_ENABLED)
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND: {config.STORAGE_BACKEND}")
+    return _storage
+
+
+def set_storage(storage: StorageBackend):
+    """Replaces the storage backend, e.g. with a local one in benchmarks."""
+    global _storage
+    close_storage()
+    with _lock:
+        _storage = storage
+
+
+def get_completed_files_index() -> CompletedFilesIndex:
+    """Returns the process-wide index of completed (application, file) pairs."""
+    global _completed_files_index
+    with _lock:
+        if _completed_files_index is None:
+            storage = get_storage()
+            _completed_files_index = CompletedFilesIndex(
+                load_all=storage.list_completed_files,
+                point_lookup=storage.is_file_completed,
+                ttl_seconds=get_settings().COMPLETED_INDEX_TTL_SECONDS,
+            )
+    return _completed_files_index
+
+
+def _on_rows_failed(rows: list):
+    # The files were optimistically marked as completed when buffered
+    for row in rows:
+        get_completed_files_index().invalidate(row["application_name"])
+
+
+def get_row_writer() -> BufferedRowWriter:
+    """Returns the process-wide write-behind buffer in front of the storage backend."""
+    global _row_writer
+    with _lock:
+        if _row_writer is None:
+            config = get_settings()
+            _row_writer = BufferedRowWriter(
+                sink=get_storage().insert_extracts,
+                max_batch_rows=config.BQ_WRITE_BATCH_ROWS,
+                max_batch_bytes=config.BQ_WRITE_BATCH_BYTES,
+                flush_interval=config.BQ_WRITE_FLUSH_INTERVAL_SECONDS,
+                max_buffered_rows=config.BQ_WRITE_BUFFER_MAX_ROWS,
+                max_retries=config.BQ_WRITE_MAX_RETRIES,
+                on_rows_failed=_on_rows_failed,
+            )
+    return _row_writer
+
+
+def insert_sql_extract(sql_id: str, sql_file_name: str, raw_sql_text: str, parser_output: dict,
+                       parser_output_tables: str, application_name: str, processing_status: str) -> bool:
+    """
+    Stores one analysis result in the configured backend, through the
+    write-behind buffer when the backend uses one, and records the file in
+    the completed-files index.
+    """
+    storage = get_storage()
+    row = bq_utils.build_sql_extract_row(sql_id, sql_file_name, raw_sql_text, parser_output,
+                                         parser_output_tables, application_name, processing_status)
+
+    if storage.buffered_writes:
+        config = get_settings()
+        if not get_row_writer().write(row, timeout=config.BQ_WRITE_BUFFER_TIMEOUT_SECONDS):
+            print(f"Write buffer is full or closed. Could not buffer record with sql_id: {sql_id}")
+            return False
+    else:
+        try:
+            errors = storage.insert_extracts([row])
+        except Exception as e:
+            print(f"An error occurred during the insert operation: {e}")
+            return False
+        if errors:
+            print(f"Failed to insert record: {errors}")
+            return False
+        print(f"Successfully inserted record with sql_id: {sql_id}")
+
+    get_completed_files_index().mark_completed(application_name, sql_file_name)
+    return True
+
+
+def is_sql_file_completed(application_name: str, sql_file_name: str) -> bool:
+    """Checks whether a file was already analyzed, using the cached index."""
+    return get_completed_files_index().is_completed(application_name, sql_file_name)
+
+
+def get_completed_sql_files(application_name: str) -> set:
+    """Returns the set of completed file names for an application, using the cached index."""
+    return get_completed_files_index().get_completed(application_name)
+
+
+def close_storage(timeout: float = None):
+    """Flushes buffered rows and closes the backend; called on shutdown."""
+    global _storage, _completed_files_index, _row_writer
+    # The final flush may still call back into the index and the backend
+    # (_on_rows_failed), so the globals are only cleared once it is done
+    with _lock:
+        writer = _row_writer
+    if writer is not None:
+        writer.close(timeout)
+        print(f"Write buffer closed: {writer.stats()}")
+    with _lock:
+        storage = _storage
+        _row_writer, _storage, _completed_files_index = None, None, None
+    if storage is not None:
+        storage.close()
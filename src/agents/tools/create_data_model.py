@@ -1,55 +1,63 @@
 
 import os
 import json
-from src.agents.shared_libraries.bq_utils import fetch_from_bq
-from vertexai.generative_models import GenerativeModel
+import base64
+import time
+import hashlib
+import itertools
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from src.agents.shared_libraries.resources import get_settings
+from src.agents.shared_libraries.storage import get_storage
+from src.agents.shared_libraries.llm_client import get_llm_client
+from src.agents.shared_libraries.executors import submit_with_context
+from src.agents.shared_libraries.data_model_graph import DataModelGraph, normalize_entity_name
+from src.agents.shared_libraries import metrics
 
-def get_sql_json_from_bq(application_name: str) -> list:
-    return fetch_from_bq(application_name)
+# Progress is reported every this many records while merging (each report is a job queue write)
+_PROGRESS_EVERY = 500
 
-def create_data_model_from_bq(application_name: str) -> dict:
-    """
-    Fetches SQL parser outputs from BigQuery for a given application name.
-    For each parser output, it uses a generative model to extract a structured data model
-    containing entities, attributes, and relationships.
+# Fields returned by `get_sql_json_page` when the request names none
+DEFAULT_PAGE_FIELDS = ("sql_file_name", "parser_output_tables")
 
-    Returns:
-        dict: A dictionary with the following keys:
-            - "status": "success" or "error"
-            - "results": List of generated data model JSON objects (on success)
-            - "error_message": Error message (on error)
-    """
-    results = []
-    try:
-        # Fetch the JSON data from BigQuery using the existing function
-        bq_records = get_sql_json_from_bq(application_name)
-        if not bq_records:
-            return {"status": "success", "results": [], "message": "No records found in BigQuery for the application."}
+def _encode_cursor(record: dict) -> str:
+    key = json.dumps([_timestamp(record["inserted_at"]), record["sql_id"]])
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
 
-        model = GenerativeModel("gemini-2.5-pro")
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        inserted_at, sql_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    return inserted_at, sql_id
 
-        for record in bq_records:
-            parser_output = record.get("parser_output")
-            if not parser_output:
-                continue
+def get_sql_json_page(application_name: str, fields: list = None, limit: int = None, cursor: str = None,
+                      sql_ids: list = None) -> dict:
+    """
+    One page of an application's records, newest first, with only `fields`
+    (default `DEFAULT_PAGE_FIELDS`). Pages are keyset-paginated on
+    (`inserted_at`, `sql_id`): pass the previous page's `next_cursor` as
+    `cursor` for the next one; it is None on the last page. `sql_ids` fetches
+    just those records (e.g. one full report when it is opened).
+    """
+    config = get_settings()
+    fields = list(fields or DEFAULT_PAGE_FIELDS)
+    limit = min(limit or config.DATA_MODEL_PAGE_SIZE, config.DATA_MODEL_MAX_PAGE_SIZE)
+    if limit < 1:
+        raise ValueError("limit must be positive.")
+    after = _decode_cursor(cursor) if cursor else None
+    # One extra row tells whether there is a next page
+    rows = get_storage().fetch_page(application_name, fields, limit + 1, after=after, sql_ids=sql_ids)
+    records = [
+        {field: _timestamp(row[field]) if field == "inserted_at" else row[field] for field in fields}
+        for row in rows[:limit]
+    ]
+    return {"records": records, "next_cursor": _encode_cursor(rows[limit - 1]) if len(rows) > limit else None}
 
-            # Pre-process the parser output to remove bulky attributes, focusing on entities and relationships
-            try:
-                if isinstance(parser_output, str):
-                    parser_output_json = json.loads(parser_output)
-                else:
-                    parser_output_json = parser_output
-
-                skimmed_input = {
-                    "entities": [{"name": entity.get("entity_name")} for entity in parser_output_json.get("entities", [])],
-                    "relationships": parser_output_json.get("relationships", [])
-                }
-                input_for_prompt = json.dumps(skimmed_input, indent=2)
-            except (json.JSONDecodeError, TypeError):
-                # If parsing fails, use the raw output but it might be less effective
-                input_for_prompt = parser_output
-
-            prompt = f"""
+def _data_model_prompt(input_for_prompt: str) -> str:
+    return f"""
             Given the following JSON data from a SQL script analysis, identify the core entities and their relationships.
 
             **CRITICAL INSTRUCTIONS:**
@@ -70,18 +78,395 @@ def create_data_model_from_bq(application_name: str) -> dict:
             **Input JSON:**
             {input_for_prompt}
             """
-            response = model.generate_content(prompt)
-            response_text = response.text.strip().strip("` \n")
-            if response_text.startswith("json"):
-                response_text = response_text[4:].strip()
 
-            try:
-                data_model_json = json.loads(response_text)
-                results.append(data_model_json)
-            except json.JSONDecodeError:
-                # If the model response is not valid JSON, skip this record
+def build_data_model_prompt(parser_output) -> str:
+    """Builds the per-record prompt from a stored `parser_output` (dict or JSON string)."""
+    # Pre-process the parser output to remove bulky attributes, focusing on entities and relationships
+    try:
+        if isinstance(parser_output, str):
+            parser_output_json = json.loads(parser_output)
+        else:
+            parser_output_json = parser_output
+
+        skimmed_input = {
+            "entities": [{"name": entity.get("entity_name")} for entity in parser_output_json.get("entities", [])],
+            "relationships": parser_output_json.get("relationships", [])
+        }
+        input_for_prompt = json.dumps(skimmed_input, indent=2)
+    except (json.JSONDecodeError, TypeError, AttributeError):
+        # If parsing fails, use the raw output but it might be less effective
+        input_for_prompt = parser_output
+
+    return _data_model_prompt(input_for_prompt)
+
+def build_refine_prompt(data_model: dict) -> str:
+    """Builds the prompt for the single model pass over an already merged data model."""
+    skimmed_input = {
+        "entities": [{"name": entity["name"]} for entity in data_model.get("entities", [])],
+        "relationships": [
+            {"from": rel["from"], "to": rel["to"], "type": rel["type"]} for rel in data_model.get("relationships", [])
+        ],
+    }
+    return _data_model_prompt(json.dumps(skimmed_input, indent=2))
+
+def _generate_data_model(model, prompt: str) -> dict:
+    """One model call; raises on a failed call or a response that is not JSON."""
+    response = model.generate(prompt)
+    response_text = response.text.strip().strip("` \n")
+    if response_text.startswith("json"):
+        response_text = response_text[4:].strip()
+    try:
+        data_model_json = json.loads(response_text)
+    except json.JSONDecodeError as e:
+        metrics.record_json_parse(False)
+        raise ValueError(f"Invalid JSON response from model: {e}") from e
+    metrics.record_json_parse(True)
+    return data_model_json
+
+def _load_parser_output(record: dict) -> dict:
+    parser_output = record["parser_output"]
+    if isinstance(parser_output, str):
+        try:
+            parser_output = json.loads(parser_output)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid parser_output JSON: {e}") from e
+    if not isinstance(parser_output, dict):
+        raise ValueError("parser_output is not a JSON object")
+    return parser_output
+
+def _failed_record(record: dict, error: str) -> dict:
+    return {"sql_id": record.get("sql_id"), "sql_file_name": record.get("sql_file_name"), "error": error}
+
+def _apply_refinement(data_model: dict, refined: dict, strip_database: bool) -> dict:
+    """
+    Keeps the merged entities the model kept (with their attributes) and
+    the model's relationships; lineage is kept between the remaining entities.
+    """
+    names = [normalize_entity_name(entity.get("name"), strip_database) for entity in refined.get("entities") or []]
+    names = [name for name in dict.fromkeys(names) if name]
+    if not names:
+        raise ValueError("The model returned no entities")
+    merged = {entity["name"]: entity for entity in data_model["entities"]}
+    kept = set(names)
+    relationships = []
+    for rel in refined.get("relationships") or []:
+        source = normalize_entity_name(rel.get("from"), strip_database)
+        target = normalize_entity_name(rel.get("to"), strip_database)
+        if source in kept and target in kept:
+            relationships.append({**rel, "from": source, "to": target})
+    return {
+        **data_model,
+        "entities": [merged.get(name, {"name": name}) for name in names],
+        "relationships": relationships,
+        "lineage": [lin for lin in data_model["lineage"] if lin["source"] in kept and lin["target"] in kept],
+    }
+
+# Bump when DataModelGraph's state layout changes, to force a full rebuild of stored models
+_GRAPH_STATE_VERSION = 1
+_application_locks = {}
+_application_locks_lock = threading.Lock()
+
+def _application_lock(application_name: str) -> threading.Lock:
+    with _application_locks_lock:
+        return _application_locks.setdefault(application_name, threading.Lock())
+
+def _fingerprint(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def _timestamp(value) -> str:
+    """`inserted_at` as an ISO-8601 string (BigQuery returns datetimes, SQLite strings)."""
+    return value.isoformat() if isinstance(value, datetime) else str(value or "")
+
+def _shift(timestamp: str, seconds: float) -> str:
+    return (datetime.fromisoformat(timestamp.replace("Z", "+00:00")) - timedelta(seconds=seconds)).isoformat()
+
+def _is_compatible(artifact: dict, graph_fingerprint: str) -> bool:
+    """Whether a stored graph was built with the current name normalization settings."""
+    return bool(artifact) and str(artifact.get("fingerprint") or "").split(":")[0] == graph_fingerprint
+
+def _iter_new_records(storage, application_name: str, since: str, merged_ids: dict):
+    """Streams the records inserted since `since` (all when None) that are not in `merged_ids`, as dicts."""
+    columns = ("sql_id", "sql_file_name", "parser_output", "inserted_at")
+    for batch in storage.iter_batches(application_name, columns, since=since):
+        for record in batch.to_pylist():
+            if record["sql_id"] not in merged_ids:
+                yield record
+
+def _consolidated_data_model(application_name: str, config, progress, refine: bool, rebuild: bool,
+                             started: float) -> dict:
+    """
+    Merges every record into one `DataModelGraph`, then optionally refines
+    it with one model call.
+
+    With `DATA_MODEL_MATERIALIZE` each build is stored as a new version
+    together with the graph, an `inserted_at` watermark and the ids of the
+    records inserted within the lookback window before it (`recent_records`). The next call
+    starts from the stored graph and merges only the records inserted since
+    (re-reading the lookback window and skipping the ids already merged);
+    when there are none and the rendering settings are unchanged, the
+    stored result is returned as is.
+    """
+    storage = get_storage()
+    lookback = config.DATA_MODEL_WATERMARK_LOOKBACK_SECONDS
+    graph_fingerprint = _fingerprint(_GRAPH_STATE_VERSION, config.DATA_MODEL_STRIP_DATABASE)
+    render_fingerprint = _fingerprint(list(config.DATA_MODEL_EXCLUDE_PATTERNS), refine)
+
+    with _application_lock(application_name):
+        artifact = storage.fetch_latest_data_model(application_name) if config.DATA_MODEL_MATERIALIZE else None
+        incremental = not rebuild and _is_compatible(artifact, graph_fingerprint)
+
+        recent = json.loads(artifact["recent_records"] or "{}") if incremental else {}
+        since = _shift(artifact["watermark"], lookback) if incremental and artifact.get("watermark") else None
+        rows = _iter_new_records(storage, application_name, since, recent)
+        first = next(rows, None)
+
+        if incremental:
+            if first is None and artifact["fingerprint"] == f"{graph_fingerprint}:{render_fingerprint}":
+                rows.close()
+                response = json.loads(artifact["result"])
+                response["summary"].update({
+                    "delta_records": 0, "cached": True,
+                    "wall_clock_seconds": round(time.perf_counter() - started, 3),
+                })
+                return response
+            state = json.loads(artifact["state"])
+            graph = DataModelGraph.from_state(state["graph"], config.DATA_MODEL_EXCLUDE_PATTERNS)
+        else:
+            if first is None:
+                return {"status": "success", "results": [], "failed_records": [],
+                        "message": "No records found in BigQuery for the application."}
+            graph = DataModelGraph(config.DATA_MODEL_EXCLUDE_PATTERNS, strip_database=config.DATA_MODEL_STRIP_DATABASE)
+            state = {"records": 0, "skipped": 0, "failed_records": []}
+
+        failed_records = list(state["failed_records"])
+        delta_records = 0
+        delta_skipped = 0
+        watermark = artifact["watermark"] if incremental and artifact.get("watermark") else ""
+        for record in itertools.chain([first] if first is not None else [], rows):
+            delta_records += 1
+            inserted_at = _timestamp(record.get("inserted_at"))
+            watermark = max(watermark, inserted_at)
+            recent[record.get("sql_id")] = inserted_at
+            if not record.get("parser_output"):
+                delta_skipped += 1
                 continue
+            try:
+                graph.add_parser_output(_load_parser_output(record), record.get("sql_file_name") or "")
+            except ValueError as e:
+                failed_records.append(_failed_record(record, str(e)))
+            if progress is not None and delta_records % _PROGRESS_EVERY == 0:
+                # The total is not known up front: records are streamed
+                progress(delta_records, 0, f"Merged {delta_records} records")
+
+        data_model = graph.to_dict()
+        merge_seconds = time.perf_counter() - started
+        refine_error = None
+        if refine and data_model["entities"]:
+            try:
+                refined = _generate_data_model(get_llm_client(), build_refine_prompt(data_model))
+                data_model = _apply_refinement(data_model, refined, config.DATA_MODEL_STRIP_DATABASE)
+            except Exception as e:
+                # The merged model is complete on its own; keep it and report the failure
+                refine_error = str(e) or repr(e)
+
+        total_records = state["records"] + delta_records
+        skipped = state["skipped"] + delta_skipped
+        succeeded = graph.records
+        status = "success" if not failed_records and refine_error is None else ("partial_success" if succeeded else "error")
+        version = int(artifact["version"]) + 1 if artifact else 1
+        response = {
+            "status": status,
+            "results": [data_model],
+            "failed_records": failed_records,
+            "summary": {
+                "records": total_records,
+                "succeeded": succeeded,
+                "failed": len(failed_records),
+                "skipped": skipped,
+                "delta_records": delta_records,
+                "entities": len(data_model["entities"]),
+                "relationships": len(data_model["relationships"]),
+                "lineage": len(data_model["lineage"]),
+                "excluded_entities": len(data_model["excluded_entities"]),
+                "duplicate_edges_merged": graph.stats()["duplicate_edges_merged"],
+                "llm_refined": refine and refine_error is None and bool(data_model["entities"]),
+                "version": version,
+                "cached": False,
+                "merge_seconds": round(merge_seconds, 3),
+                "wall_clock_seconds": round(time.perf_counter() - started, 3),
+            },
+        }
+        if refine_error is not None:
+            response["refine_error"] = refine_error
+        if status == "error":
+            response["error_message"] = f"All {len(failed_records)} records failed."
+
+        if config.DATA_MODEL_MATERIALIZE:
+            # A failed refinement is not stored, so the next call retries it
+            render = render_fingerprint if refine_error is None else "unrefined"
+            if watermark:
+                horizon = _shift(watermark, lookback)
+                recent = {sql_id: inserted_at for sql_id, inserted_at in recent.items() if inserted_at >= horizon}
+            new_state = {
+                "graph": graph.state(), "records": total_records, "skipped": skipped, "failed_records": failed_records,
+            }
+            try:
+                storage.save_data_model({
+                    "application_name": application_name,
+                    "version": version,
+                    "watermark": watermark,
+                    "recent_records": json.dumps(recent),
+                    "fingerprint": f"{graph_fingerprint}:{render}",
+                    "state": json.dumps(new_state),
+                    "result": json.dumps(response, default=str),
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                })
+            except Exception as e:
+                print(f"Could not store the data model for '{application_name}': {e}")
+        return response
+
+def _per_record_data_models(records: Iterator[dict], progress, max_workers: int, record_timeout: float,
+                            started: float) -> dict:
+    """
+    One model call per record, at most `max_workers` at a time, each bounded
+    by `record_timeout`. Records are read from the `records` stream only as
+    calls finish, so an application's parser outputs are never all in memory.
+    """
+    model = get_llm_client()
+    max_workers = max(1, max_workers)
+
+    results = {}
+    failed = {}
+    started_at = {}
+    # index -> sql_id and sql_file_name, kept for the progress and failure reports
+    names = {}
+    total = 0
+    skipped = 0
+
+    def report(message: str):
+        if progress is not None:
+            # The total is not known up front: records are streamed
+            progress(len(results) + len(failed), 0, message)
+
+    def run(index: int, parser_output) -> dict:
+        started_at[index] = time.monotonic()
+        return _generate_data_model(model, build_data_model_prompt(parser_output))
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="data-model")
+    futures = {}
+    exhausted = False
+    try:
+        while True:
+            # Keep a few records queued behind the running calls, no more
+            while not exhausted and len(futures) < 2 * max_workers:
+                record = next(records, None)
+                if record is None:
+                    exhausted = True
+                    break
+                total += 1
+                if not record.get("parser_output"):
+                    skipped += 1
+                    continue
+                index = total - 1
+                names[index] = {"sql_id": record.get("sql_id"), "sql_file_name": record.get("sql_file_name")}
+                futures[submit_with_context(executor, run, index, record["parser_output"])] = index
+            if not futures:
+                break
+
+            done, _ = wait(set(futures), timeout=min(1.0, record_timeout), return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures.pop(future)
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    failed[index] = str(e) or repr(e)
+                report(f"Finished '{names[index]['sql_file_name']}'")
+
+            # A call that overruns its timeout is abandoned; its thread finishes in the background
+            now = time.monotonic()
+            for future, index in list(futures.items()):
+                if index in started_at and now - started_at[index] > record_timeout:
+                    del futures[future]
+                    failed[index] = f"Timed out after {record_timeout:g} seconds"
+                    report(f"Timed out '{names[index]['sql_file_name']}'")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    failed_records = [_failed_record(names[index], failed[index]) for index in sorted(failed)]
+    status = "success" if not failed else ("partial_success" if results else "error")
+    response = {
+        "status": status,
+        "results": [results[index] for index in sorted(results)],
+        "failed_records": failed_records,
+        "summary": {
+            "records": total,
+            "succeeded": len(results),
+            "failed": len(failed_records),
+            "skipped": skipped,
+            "wall_clock_seconds": round(time.perf_counter() - started, 3),
+        },
+    }
+    if status == "error":
+        response["error_message"] = f"All {len(failed_records)} records failed."
+    return response
+
+def create_data_model_from_bq(application_name: str, progress=None, mode: str = None, refine: bool = None,
+                              max_workers: int = None, record_timeout: float = None, rebuild: bool = False) -> dict:
+    """
+    Fetches SQL parser outputs from BigQuery for a given application name and
+    builds the application's data model from them.
+
+    In "graph" mode (`DATA_MODEL_MODE`, the default) every record's entities,
+    relationships and data flows are merged locally into one consolidated
+    model, with normalized names, merged duplicate edges and audit/log/work
+    tables filtered out (`DATA_MODEL_EXCLUDE_PATTERNS`). With `refine`
+    (default `DATA_MODEL_LLM_REFINE`) a single model call then trims the
+    merged model to its core business entities. The consolidated model is
+    materialized per application (`DATA_MODEL_MATERIALIZE`): later calls only
+    merge the records inserted since the last build, and return the stored
+    model when there are none. `rebuild` starts over from all records.
+
+    In "per_record" mode a generative model extracts a data model from each
+    record, at most `max_workers` at a time (default
+    `DATA_MODEL_RECORD_CONCURRENCY`); a record whose model call takes longer
+    than `record_timeout` seconds (default `DATA_MODEL_RECORD_TIMEOUT_SECONDS`)
+    is reported as failed.
+
+    `progress(done, total, message)` is called as records are processed.
+
+    Returns:
+        dict: A dictionary with the following keys:
+            - "status": "success", "partial_success" (some records, or the refinement, failed) or "error"
+            - "results": The consolidated model ("graph") or one model per record ("per_record"),
+              each with `entities` and `relationships` (plus `lineage` in "graph" mode)
+            - "failed_records": `sql_id`, `sql_file_name` and `error` of each failed record
+            - "summary": Record and graph counts and wall-clock time ("graph" mode adds
+              `delta_records`, the stored `version` and whether the result was `cached`)
+            - "error_message": Error message (on error)
+    """
+    config = get_settings()
+    mode = mode or config.DATA_MODEL_MODE
+    if refine is None:
+        refine = config.DATA_MODEL_LLM_REFINE
+    if max_workers is None:
+        max_workers = config.DATA_MODEL_RECORD_CONCURRENCY
+    if record_timeout is None:
+        record_timeout = config.DATA_MODEL_RECORD_TIMEOUT_SECONDS
+    started = time.perf_counter()
+
+    try:
+        if mode not in ("graph", "per_record"):
+            raise ValueError(f"Unknown data model mode '{mode}'")
+        if mode == "graph":
+            return _consolidated_data_model(application_name, config, progress, refine, rebuild, started)
+
+        # Stream the parser outputs from storage as Arrow record batches
+        rows = _iter_new_records(get_storage(), application_name, None, {})
+        first = next(rows, None)
+        if first is None:
+            return {"status": "success", "results": [], "failed_records": [],
+                    "message": "No records found in BigQuery for the application."}
+        return _per_record_data_models(itertools.chain([first], rows), progress, max_workers, record_timeout,
+                                       started)
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
-
-    return {"status": "success", "results": results}
\ No newline at end of file
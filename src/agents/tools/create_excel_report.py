@@ -1,8 +1,16 @@
 import io
-import pandas as pd
 import re
 import json
-from src.agents.shared_libraries.bq_utils import fetch_report_data_from_bq
+import tempfile
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from src.agents.shared_libraries.storage import get_storage
+
+HEADER_FONT = Font(bold=True)
+SUMMARY_HEADERS = ("SQL File Name", "Table Name", "Operation Type", "Creation Source")
+# Size of the pieces a report file is streamed to the client in
+REPORT_CHUNK_BYTES = 64 * 1024
 
 def sanitize_sheet_name(name: str) -> str:
     """
@@ -15,67 +23,145 @@ def sanitize_sheet_name(name: str) -> str:
     # Truncate to 31 characters
     return name[:31]
 
-def create_excel_report(application_name: str) -> bytes:
-    """
-    Fetches report data from BigQuery and generates an Excel file in memory.
+def _iter_rows(application_name: str, columns: tuple):
+    """Yields `columns` value tuples per row, reading record batches ordered by file name."""
+    for batch in get_storage().iter_batches(application_name, columns, order_by=("sql_file_name",)):
+        yield from zip(*(batch.column(column).to_pylist() for column in columns))
 
-    Args:
-        application_name: The name of the application to generate the report for.
+def _header_row(sheet, headers) -> list:
+    """Bold header cells for a write-only sheet."""
+    cells = []
+    for header in headers:
+        cell = WriteOnlyCell(sheet, value=header)
+        cell.font = HEADER_FONT
+        cells.append(cell)
+    return cells
 
-    Returns:
-        The Excel file as a bytes object.
+def unique_sheet_name(name: str, used: dict) -> str:
+    """
+    `sanitize_sheet_name(name)`, made unique among the names already in `used`
+    (compared case-insensitively, as Excel does) by replacing its tail with
+    " (2)", " (3)", ... Files whose names share their first 31 characters
+    would otherwise write to the same sheet. `used` maps each lowercased name
+    to the last suffix tried for it, so long runs of clashes stay cheap.
     """
-    report_data = fetch_report_data_from_bq(application_name)
+    base = sanitize_sheet_name(name) or "Untitled"
+    candidate = base
+    n = used.get(base.lower(), 1)
+    while candidate.lower() in used:
+        n += 1
+        suffix = f" ({n})"
+        candidate = base[:31 - len(suffix)] + suffix
+    used[base.lower()] = n
+    used.setdefault(candidate.lower(), 1)
+    return candidate
 
-    if not report_data:
-        # If no data, return an empty Excel file with a notice.
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_empty = pd.DataFrame([{"message": f"No data found for application: {application_name}"}])
-            df_empty.to_excel(writer, sheet_name='Notice', index=False)
-        return output.getvalue()
+def write_excel_report(application_name: str, output) -> int:
+    """
+    Writes the Excel report of an application to `output` (a path or a
+    seekable binary file) and returns the number of records in it.
 
-    # --- Logic for the new Entity Summary sheet ---
-    summary_data = []
-    for record in report_data:
-        sql_file_name = record.get("sql_file_name", "Untitled")
-        json_content_str = record.get("parser_output", "{}")
+    The workbook is written in openpyxl's write-only mode and the rows are
+    streamed twice as record batches, each pass projecting only the columns
+    it needs: the parsed outputs for the summary sheet, then the Markdown
+    reports for the per-file sheets. Each sheet is flushed to a temporary
+    file as soon as it is written; only openpyxl's small per-sheet
+    bookkeeping stays in memory until the workbook is saved.
+    """
+    workbook = Workbook(write_only=True)
+    used_names = {}
 
+    # --- Logic for the new Entity Summary sheet ---
+    summary = None
+    records = 0
+    for sql_file_name, json_content_str in _iter_rows(application_name, ("sql_file_name", "parser_output")):
+        records += 1
+        sql_file_name = sql_file_name or "Untitled"
         try:
             # The parser_output from BQ might be a string, so we need to load it
             if isinstance(json_content_str, str):
                 json_content = json.loads(json_content_str)
             else:
-                json_content = json_content_str # It might already be a dict
+                json_content = json_content_str or {} # It might already be a dict
 
             entities = json_content.get("entities", [])
             if not entities:
                 continue
 
-            for entity in entities:
-                summary_data.append({
-                    "SQL File Name": sql_file_name,
-                    "Table Name": entity.get("entity_name"),
-                    "Operation Type": entity.get("entity_type"),
-                    "Creation Source": entity.get("creation_source")
-                })
-        except (json.JSONDecodeError, TypeError):
+            rows = [
+                [sql_file_name, entity.get("entity_name"), entity.get("entity_type"), entity.get("creation_source")]
+                for entity in entities
+            ]
+        except (json.JSONDecodeError, TypeError, AttributeError):
             # If JSON is malformed or not present, skip this record for the summary
             continue
 
+        if summary is None:
+            # Created on the first entity so it stays the first sheet
+            summary = workbook.create_sheet(unique_sheet_name("Report Summary", used_names))
+            summary.append(_header_row(summary, SUMMARY_HEADERS))
+        for row in rows:
+            summary.append(row)
+
+    if not records:
+        # If no data, write a workbook with a notice.
+        notice = workbook.create_sheet("Notice")
+        notice.append(_header_row(notice, ("message",)))
+        notice.append([f"No data found for application: {application_name}"])
+        workbook.save(output)
+        return 0
+
+    if summary is not None:
+        summary.close()
+
+    # --- Existing logic to create a sheet per SQL file ---
+    for sql_file_name, markdown_content in _iter_rows(application_name, ("sql_file_name", "parser_output_tables")):
+        sheet = workbook.create_sheet(unique_sheet_name(sql_file_name or "Untitled", used_names))
+        sheet.append([markdown_content or ""])
+        sheet.close()
+
+    workbook.save(output)
+    return records
+
+def open_excel_report(application_name: str):
+    """
+    Writes the Excel report of an application to an anonymous temporary file
+    and returns it, open for reading from the start. Stream it with
+    `iter_report_chunks`.
+    """
+    report = tempfile.TemporaryFile(suffix=".xlsx")
+    try:
+        write_excel_report(application_name, report)
+        report.seek(0)
+    except Exception:
+        report.close()
+        raise
+    return report
+
+def iter_report_chunks(report, chunk_size: int = REPORT_CHUNK_BYTES):
+    """Yields the bytes of a report opened by `open_excel_report`, closing (and so deleting) it at the end."""
+    try:
+        while True:
+            chunk = report.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        report.close()
+
+def create_excel_report(application_name: str) -> bytes:
+    """
+    Fetches report data from the storage backend and generates an Excel file in memory.
+
+    Prefer `open_excel_report` for large applications: this holds the whole
+    file in memory.
+
+    Args:
+        application_name: The name of the application to generate the report for.
+
+    Returns:
+        The Excel file as a bytes object.
+    """
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        # Write the new Entity Summary sheet first
-        if summary_data:
-            df_summary = pd.DataFrame(summary_data)
-            df_summary.to_excel(writer, sheet_name="Report Summary", index=False)
-
-        # --- Existing logic to create a sheet per SQL file ---
-        for record in report_data:
-            sql_file_name = record.get("sql_file_name", "Untitled")
-            markdown_content = record.get("parser_output_tables", "")
-            sheet_name = sanitize_sheet_name(sql_file_name)
-            df = pd.DataFrame([markdown_content])
-            df.to_excel(writer, sheet_name=sheet_name, index=False, header=False)
-
-    return output.getvalue()
\ No newline at end of file
+    write_excel_report(application_name, output)
+    return output.getvalue()
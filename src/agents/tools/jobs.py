@@ -0,0 +1,75 @@
+import threading
+import time
+
+from src.agents.shared_libraries import metrics
+from src.agents.shared_libraries.resources import get_settings
+from src.agents.shared_libraries.job_queue import JobContext, JobQueue, sqlite_path_from_url
+from src.agents.tools.create_data_model import create_data_model_from_bq
+from src.agents.tools.sql_analysis import iter_extract_sql_details_batch, summarize_batch
+
+ANALYZE_JOB = "analyze"
+DATA_MODEL_JOB = "create_data_model"
+
+
+def run_analysis_job(payload: dict, ctx: JobContext) -> dict:
+    """
+    Analyzes the job's SQL files, checkpointing each file's result so a
+    resumed job only processes the files it had not finished yet.
+    """
+    application_name = payload["application_name"]
+    items = payload["items"]
+    started = time.perf_counter()
+
+    records = ctx.completed_items()
+    pending = [(index, item) for index, item in enumerate(items) if index not in records]
+    ctx.report_progress(len(records), len(items), "Started" if not records else "Resumed")
+
+    with metrics.request_labels(endpoint=f"job:{ANALYZE_JOB}", application=application_name):
+        for record in iter_extract_sql_details_batch(
+            [item for _, item in pending], application_name, payload.get("max_concurrency")
+        ):
+            index = pending[record["index"]][0]
+            record["index"] = index
+            ctx.record_item(index, record)
+            records[index] = record
+            ctx.report_progress(len(records), len(items),
+                                f"Finished '{record['sql_file_name']}' ({record['status']})")
+
+    ordered = [records[index] for index in sorted(records)]
+    return {
+        "application_name": application_name,
+        "results": ordered,
+        "summary": summarize_batch(ordered, time.perf_counter() - started),
+    }
+
+
+def run_data_model_job(payload: dict, ctx: JobContext) -> dict:
+    """Builds the consolidated data model for an application, reporting per-record progress."""
+    ctx.report_progress(0, 1, "Started")
+    with metrics.request_labels(endpoint=f"job:{DATA_MODEL_JOB}", application=payload["application_name"]):
+        result = create_data_model_from_bq(application_name=payload["application_name"],
+                                           progress=ctx.report_progress)
+    summary = result.get("summary", {})
+    ctx.report_progress(summary.get("records", 1), summary.get("records", 1), "Finished")
+    return result
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Returns the process-wide job queue, stored in the `SESSION_DB_URL` SQLite file."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            config = get_settings()
+            _job_queue = JobQueue(
+                db_path=sqlite_path_from_url(config.SESSION_DB_URL),
+                handlers={ANALYZE_JOB: run_analysis_job, DATA_MODEL_JOB: run_data_model_job},
+                num_workers=config.JOB_WORKERS,
+                poll_interval=config.JOB_POLL_INTERVAL_SECONDS,
+                lease_seconds=config.JOB_LEASE_SECONDS,
+                max_attempts=config.JOB_MAX_ATTEMPTS,
+            )
+    return _job_queue
@@ -0,0 +1,107 @@
+def _md_cell(value) -> str:
+    """Formats a value for use inside a Markdown table cell."""
+    if value is None or value == "":
+        return "N/A"
+    if isinstance(value, (list, tuple)):
+        value = ", ".join(str(v) for v in value if v not in (None, ""))
+        if not value:
+            return "N/A"
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+
+def _split_source_attribute(source_attribute: str):
+    """Splits a fully qualified `schema.table.column` into (`schema.table`, `column`)."""
+    if "." not in source_attribute:
+        return None, source_attribute
+    table, column = source_attribute.rsplit(".", 1)
+    return table, column
+
+
+def render_report_markdown(parser_output: dict) -> str:
+    """
+    Renders the human-readable "Data Lineage Report" Markdown from the
+    machine-readable `parser_output` JSON produced by the extraction prompt.
+
+    The layout mirrors the report the model used to write directly: job
+    summary, schema overview, one section per data flow with an
+    attribute-level lineage table, and a brief functional overview.
+    """
+    job_metadata = parser_output.get("job_metadata") or {}
+    entities = parser_output.get("entities") or []
+    data_flows = parser_output.get("data_flows") or []
+
+    job_name = job_metadata.get("job_name") or "Unknown Job"
+    lines = [
+        f"# Data Lineage Report: {job_name}",
+        "",
+        "## 1\\. Job Summary",
+        "",
+        f"  - **Job Name**: {job_metadata.get('job_name') or 'N/A'}",
+        f"  - **Version**: {job_metadata.get('version') or 'N/A'}",
+        f"  - **Default Database**: {job_metadata.get('default_database') or 'N/A'}",
+        "",
+        "## 2\\. Schema Overview",
+        "",
+    ]
+
+    if entities:
+        for entity in entities:
+            entity_type = (entity.get("entity_type") or "UNKNOWN").replace("_", "\\_")
+            creation_source = entity.get("creation_source") or "Inferred"
+            lines.append(
+                f"  - **`{entity.get('entity_name')}`** (Type: {entity_type}, Source: {creation_source})"
+            )
+    else:
+        lines.append("  - No entities were identified in the script.")
+
+    lines += ["", "## 3\\. Data Transformation Flows", ""]
+    if not data_flows:
+        lines.append("No `INSERT` or `UPDATE` operations were identified in the script.")
+
+    for index, flow in enumerate(data_flows, 1):
+        target_entity = flow.get("target_entity") or "Unknown"
+        lines += [
+            "-----",
+            "",
+            f"### Flow {index}: Populating the `{target_entity}` Table",
+            "",
+        ]
+        if flow.get("flow_description"):
+            lines += [flow["flow_description"], ""]
+        lines += [
+            f"  - **Operation Type**: {flow.get('operation_type') or 'N/A'}",
+            f"  - **Source Entities**: {_md_cell(flow.get('source_entities'))}",
+            f"  - **Target Entity**: {target_entity}",
+            "",
+            "**Attribute-Level Lineage:**",
+            "",
+            "| Target Column | Transformation Logic | Source Table(s) | Source Column(s) |",
+            "| :--- | :--- | :--- | :--- |",
+        ]
+        for mapping in flow.get("attribute_mappings") or []:
+            source_tables = []
+            source_columns = []
+            for source_attribute in mapping.get("source_attributes") or []:
+                table, column = _split_source_attribute(str(source_attribute))
+                if table and table not in source_tables:
+                    source_tables.append(table)
+                if column and column not in source_columns:
+                    source_columns.append(column)
+            if source_tables:
+                tables_cell = ", ".join(f"`{table}`" for table in source_tables)
+            else:
+                tables_cell = "`N/A (Literal Value)`"
+            if source_columns:
+                columns_cell = ", ".join(f"`{column}`" for column in source_columns)
+            else:
+                columns_cell = "`N/A`"
+            logic = _md_cell(mapping.get("transformation_logic"))
+            lines.append(
+                f"| `{_md_cell(mapping.get('target_attribute'))}` | `{logic}` | {tables_cell} | {columns_cell} |"
+            )
+        lines.append("")
+
+    lines += ["-----", "", "## 4\\. Brief Functional Overview", ""]
+    lines.append(job_metadata.get("functional_overview") or "No functional overview was provided.")
+    lines.append("")
+    return "\n".join(lines)
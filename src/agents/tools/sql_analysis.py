@@ -1,17 +1,35 @@
-import glob
-import base64, json
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part, SafetySetting
-import pandas as pd
-import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from src.agents.config.settings import Settings
-import uuid, json
-from src.agents.shared_libraries.bq_utils import (
-    insert_sql_extract_to_bq,
-    get_completed_sql_files_from_bq,
+import asyncio
+import json
+import threading
+from vertexai.generative_models import SafetySetting
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from src.agents.shared_libraries.resources import get_settings
+from src.agents.shared_libraries import metrics
+from src.agents.shared_libraries.executors import submit_with_context
+from src.agents.shared_libraries.llm_client import LLMClient, get_llm_client
+import uuid
+from src.agents.shared_libraries.storage import (
+    insert_sql_extract,
+    get_completed_sql_files,
+    is_sql_file_completed,
 )
-import sys
+from src.agents.shared_libraries.analysis_cache import compute_cache_key, get_analysis_cache
+from src.agents.shared_libraries.sql_parser import PARSER_VERSION, build_parser_output, preprocess
+from src.agents.shared_libraries.sql_chunking import check_chunk_output, chunk_script, merge_parser_outputs
+from src.agents.shared_libraries.sql_minimizer import count_sql_tokens, minimize_sql
+from src.agents.shared_libraries.statement_cache import (
+    assemble_parser_output,
+    build_partial_script,
+    cacheable_fragments,
+    plan_statements,
+    split_into_fragments,
+)
+from src.agents.tools.lineage_report import render_report_markdown
+import time
+
+# Bump whenever the extraction prompts change so cached analyses produced by
+# an older prompt are not served for the new one.
+PROMPT_VERSION = "2"
 
 safety_settings = [
     SafetySetting(
@@ -32,36 +50,18 @@ safety_settings = [
     ),
 ]
 
+generation_config = {"temperature": 1, "top_p": 0.9}
 
-def extract_sql_details(sql_query, application_name: str, sql_file_name: str):
-    # Check if the file has already been processed for this application
-    completed_files = get_completed_sql_files_from_bq(application_name)
-    if sql_file_name in completed_files:
-        message = f"Skipping already processed file '{sql_file_name}' for application '{application_name}'."
-        # Return a clear message to the frontend
-        return {"status": "skipped", "message": message, "sql_file_name": sql_file_name}
-
-    sql_id = str(uuid.uuid4())
-    # try:
-
-    if len(sql_query) < 10:
-        sql_query = "No SQL"
-    config = Settings.get_settings()
 
-    vertexai.init(project=config.PROJECT_ID, location=config.REGION)
-    model = GenerativeModel(
-        config.LLM_MODEL,
-        system_instruction=[
-            """You are an expert data architect specializing in reverse-engineering data models from SQL code. 
+SYSTEM_INSTRUCTION = """You are an expert data architect specializing in reverse-engineering data models from SQL code.
         Your sole purpose is to analyze the structure of SQL scripts to identify entities (tables), 
         attributes (columns), and relationships (joins). You must ignore the business context and focus
-        exclusively on the technical DDL and DML structure to build an accurate data model.""",
-        ],
-    )
+        exclusively on the technical DDL and DML structure to build an accurate data model."""
 
-    ##Change the prompt accordinly to extract various details
 
-    extraction_prompt_json = f"""You are a meticulous and highly accurate data lineage analysis agent. Your task is to analyze the provided SQL script and generate **Comprehensive outputs in a single response**: a machine-readable JSON.
+def build_json_extraction_prompt(sql_query: str) -> str:
+    """Builds the prompt that asks the model for the machine-readable JSON data map."""
+    return f"""You are a meticulous and highly accurate data lineage analysis agent. Your task is to analyze the provided SQL script and generate **Comprehensive outputs in a single response**: a machine-readable JSON.
 
 **CORE ANALYSIS INSTRUCTIONS (Applies to BOTH outputs):**
 
@@ -93,7 +93,8 @@ You must classify each table into one of the following three types for the `enti
   "job_metadata": {{
     "job_name": "Extract the job name, e.g., 'Daily Sales Aggregation'",
     "version": "Extract the version, e.g., 'v1.2'",
-    "default_database": "The database set by a 'USE' or 'DATABASE' command, e.g., 'PROD_DB'"
+    "default_database": "The database set by a 'USE' or 'DATABASE' command, e.g., 'PROD_DB'",
+    "functional_overview": "A short, high-level summary of the script's overall purpose: the data it reads, the main transformations it performs and the data it ultimately produces."
   }},
   "entities": [
     {{
@@ -149,7 +150,10 @@ You must classify each table into one of the following three types for the `enti
 ```
 """
 
-    extraction_prompt_tbl = f"""You are a meticulous and highly accurate data lineage analysis agent. Your task is to analyze the provided SQL script and generate **One, comprehensive output in a single response**: a human-readable Markdown report.
+
+def build_markdown_extraction_prompt(sql_query: str) -> str:
+    """Builds the prompt that asks the model for the human-readable Markdown report."""
+    return f"""You are a meticulous and highly accurate data lineage analysis agent. Your task is to analyze the provided SQL script and generate **One, comprehensive output in a single response**: a human-readable Markdown report.
 
 **CORE ANALYSIS INSTRUCTIONS (Applies to BOTH outputs):**
 
@@ -232,27 +236,447 @@ Provide a short, high-level summary of the script's overall purpose. Describe wh
 ```
 """
 
-    generation_config = {"temperature": 1, "top_p": 0.9}
-    
+
+def build_hybrid_prompt(sql_query: str, parser_output: dict) -> str:
+    """
+    Builds the prompt for hybrid mode: the deterministic parser has already
+    resolved entities, aliases, joins and flow targets, so the model only
+    writes the descriptions and the attribute mappings the parser could not
+    derive.
+    """
+    flows = [
+        {
+            "flow_index": index,
+            "operation_type": flow["operation_type"],
+            "target_entity": flow["target_entity"],
+            "source_entities": flow["source_entities"],
+            "attribute_mappings_resolved": bool(flow["attribute_mappings"]),
+        }
+        for index, flow in enumerate(parser_output["data_flows"])
+    ]
+    script = ";\n".join(preprocess(sql_query))
+    return f"""You are a meticulous and highly accurate data lineage analysis agent. A deterministic parser has already extracted the entities, table aliases, joins and data flow targets of the SQL script below. Your task is to complete **only the parts it could not resolve**.
+
+**PARSED DATA FLOWS:**
+
+```json
+{json.dumps(flows, indent=2)}
+```
+
+**INSTRUCTIONS:**
+
+1.  Write a short, high-level `functional_overview` of the script: the data it reads, the main transformations it performs and the data it ultimately produces. Extract the `job_name` and `version` if the script states them.
+2.  For **every** parsed flow, write a brief, human-readable `flow_description`.
+3.  For every flow whose `attribute_mappings_resolved` is false, list its `attribute_mappings`. Resolve all table aliases back to their fully qualified table names in `source_attributes`, and **rewrite** the `transformation_logic` expression with all aliases replaced. Return no mappings for resolved flows.
+4.  Use the `flow_index` of the parsed flow. Do not add, remove or reorder flows.
+5.  Ground your analysis **exclusively** on the script provided. Do not invent or infer any information.
+
+**OUTPUT STRUCTURE:**
+*(Enclose the output in a single ```json code block)*
+
+```json
+{{
+  "job_metadata": {{
+    "job_name": "The job name, e.g., 'Daily Sales Aggregation'",
+    "version": "The version, e.g., 'v1.2'",
+    "functional_overview": "A short summary of the script's overall purpose."
+  }},
+  "data_flows": [
+    {{
+      "flow_index": 0,
+      "flow_description": "A brief summary, e.g., 'Populate the daily sales summary table.'",
+      "attribute_mappings": [
+        {{
+          "target_attribute": "The column in the target table, e.g., PRODUCT_CATEGORY",
+          "source_attributes": ["e.g., PROD_DB.SOURCE_TABLE_A.CATEGORY_CODE"],
+          "transformation_logic": "The SQL expression with all aliases resolved"
+        }}
+      ]
+    }}
+  ]
+}}
+```
+
+**SQL SCRIPT TO ANALYZE:**
+
+```sql
+    SQL:
+        {script}
+        
+```
+"""
+
+
+def merge_hybrid_response(parser_output: dict, response: dict) -> dict:
+    """Fills the model's descriptions and missing attribute mappings into the parser's output."""
+    metadata = response.get("job_metadata") or {}
+    for key in ("job_name", "version", "functional_overview"):
+        if metadata.get(key) and (key == "functional_overview" or not parser_output["job_metadata"].get(key)):
+            parser_output["job_metadata"][key] = metadata[key]
+
+    flows = parser_output["data_flows"]
+    for position, flow in enumerate(response.get("data_flows") or []):
+        index = flow.get("flow_index", position)
+        if not isinstance(index, int) or not 0 <= index < len(flows):
+            continue
+        if flow.get("flow_description"):
+            flows[index]["flow_description"] = flow["flow_description"]
+        if not flows[index]["attribute_mappings"] and flow.get("attribute_mappings"):
+            flows[index]["attribute_mappings"] = flow["attribute_mappings"]
+    return parser_output
+
+
+def _get_skip_result(application_name: str, sql_file_name: str, completed_files=None):
+    """
+    Returns a "skipped" result if the file was already processed for this
+    application. Batch callers pass the `completed_files` set loaded once per
+    batch; single files go through the cached completed-files index.
+    """
+    if completed_files is None:
+        already_completed = is_sql_file_completed(application_name, sql_file_name)
+    else:
+        already_completed = sql_file_name in completed_files
+    if already_completed:
+        message = f"Skipping already processed file '{sql_file_name}' for application '{application_name}'."
+        # Return a clear message to the frontend
+        return {"status": "skipped", "message": message, "sql_file_name": sql_file_name}
+    return None
+
+
+def _serve_from_cache(analysis_cache, cache_key: str, sql_id: str, sql_query: str, application_name: str,
+                      sql_file_name: str):
+    """Returns the cached analysis (recording it for this file in storage) or None on a miss."""
+    if analysis_cache is None:
+        return None
+    cached = analysis_cache.get(cache_key)
+    if cached is None:
+        return None
+
+    print(f"Analysis cache hit for '{sql_file_name}' ({cache_key[:12]}).")
+    insert_sql_extract(
+        sql_id=sql_id,
+        sql_file_name=sql_file_name,
+        raw_sql_text=sql_query,
+        parser_output=cached["parser_output"],
+        processing_status="NEW",
+        application_name=application_name,
+        parser_output_tables=cached["report_markdown"],
+    )
+    return cached
+
+
+def _get_model(config) -> LLMClient:
+    return get_llm_client(config.LLM_MODEL, SYSTEM_INSTRUCTION)
+
+
+def warm_up():
+    """
+    Builds the analysis model client (and its Vertex AI model handle) at
+    startup, under the same key the analysis calls use.
+    """
+    try:
+        _get_model(get_settings())
+    except Exception as e:
+        print(f"Could not initialize Vertex AI. Error: {e}")
+
+
+def _uses_statement_cache(config) -> bool:
+    return (config.STATEMENT_CACHE_ENABLED and config.ANALYSIS_CACHE_ENABLED
+            and config.EXTRACTION_MODE == "single_pass")
+
+
+def _get_cache_version(config, chunked: bool = False) -> str:
+    version = f"{PROMPT_VERSION}:{config.EXTRACTION_MODE}"
+    if config.EXTRACTION_MODE == "hybrid":
+        version += f":{PARSER_VERSION}"
+    if config.PROMPT_MINIMIZATION_ENABLED:
+        version += ":min"
+    if _uses_statement_cache(config):
+        version += ":stmt"
+    if chunked:
+        version += f":chunked{config.CHUNK_MAX_TOKENS}"
+    return version
+
+
+def _get_chunks(sql_query: str, config):
+    """Statement groups for scripts above `CHUNK_MAX_TOKENS`, or None when the script is analyzed whole."""
+    if config.EXTRACTION_MODE not in ("dual", "single_pass") or _uses_statement_cache(config):
+        return None
+    chunks = chunk_script(sql_query, config.CHUNK_MAX_TOKENS)
+    return chunks if len(chunks) > 1 else None
+
+
+def _get_json_generation_config(single_pass: bool) -> dict:
+    if single_pass:
+        return {**generation_config, "response_mime_type": "application/json"}
+    return generation_config
+
+
+def _store_extraction(parser_output: dict, report_markdown: str, sql_id: str, sql_query: str,
+                      application_name: str, sql_file_name: str, analysis_cache, cache_key: str) -> dict:
+    """Stores a successful analysis in the storage backend and the cache."""
+    insert_sql_extract(
+        sql_id=sql_id,
+        sql_file_name=sql_file_name,
+        raw_sql_text=sql_query,
+        parser_output=parser_output,
+        processing_status="NEW",
+        application_name=application_name,
+        parser_output_tables=report_markdown,
+    )
+    if analysis_cache is not None:
+        analysis_cache.put(cache_key, parser_output, report_markdown)
+    return {
+        "parser_output": parser_output,
+        "report_markdown": report_markdown,
+    }
+
+
+def _clean_json(json_string: str) -> str:
+    return json_string.strip().lstrip("```json").lstrip("```").rstrip("```")
+
+
+def _finalize_extraction(json_string: str, report_markdown: str, single_pass: bool, sql_id: str, sql_query: str,
+                         application_name: str, sql_file_name: str, analysis_cache, cache_key: str,
+                         parsed_output: dict = None) -> dict:
+    """
+    Parses the model's JSON, stores the result in storage and the cache, and
+    builds the response. In hybrid mode `parsed_output` is the parser's
+    result the model's JSON is merged into.
+    """
+    json_string = _clean_json(json_string)
+
+    try:
+        # Validate JSON
+        parser_output = json.loads(json_string)
+        if parsed_output is not None:
+            if not isinstance(parser_output, dict):
+                raise json.JSONDecodeError("Expected a JSON object", json_string, 0)
+            parser_output = merge_hybrid_response(parsed_output, parser_output)
+        metrics.record_json_parse(True)
+        if single_pass or parsed_output is not None or not report_markdown:
+            report_markdown = render_report_markdown(parser_output)
+    except json.JSONDecodeError as e:
+        metrics.record_json_parse(False)
+        parser_output = {
+            "error": "Invalid JSON response from model",
+            "details": str(e),
+            "response_text": json_string,
+        }
+        return {
+            "parser_output": parser_output,
+            "report_markdown": report_markdown,
+        }
+
+    return _store_extraction(parser_output, report_markdown, sql_id, sql_query, application_name, sql_file_name,
+                             analysis_cache, cache_key)
+
+
+def _parse_chunk_outputs(json_strings: list, chunks: list):
+    """
+    Parses and checks the per-chunk JSON; returns (outputs, None), or
+    (None, error result) on the first chunk that is not valid JSON or does
+    not have the `parser_output` shape.
+    """
+    outputs = []
+    for chunk, json_string in zip(chunks, json_strings):
+        json_string = _clean_json(json_string)
+        try:
+            output = json.loads(json_string)
+            if not isinstance(output, dict):
+                raise json.JSONDecodeError("Expected a JSON object", json_string, 0)
+            check_chunk_output(output)
+        except ValueError as e:
+            metrics.record_json_parse(False)
+            parser_output = {
+                "error": "Invalid JSON response from model",
+                "details": f"Chunk {chunk.index + 1} of {len(chunks)}: {e}",
+                "response_text": json_string,
+            }
+            return None, {"parser_output": parser_output, "report_markdown": ""}
+        metrics.record_json_parse(True)
+        outputs.append(output)
+    return outputs, None
+
+
+def _finalize_chunked_extraction(json_strings: list, chunks: list, sql_id: str, sql_query: str,
+                                 application_name: str, sql_file_name: str, analysis_cache, cache_key: str) -> dict:
+    """Merges the per-chunk JSON into one `parser_output`, renders the report locally and stores the result."""
+    outputs, error_result = _parse_chunk_outputs(json_strings, chunks)
+    if error_result is not None:
+        return error_result
+
+    parser_output = merge_parser_outputs(outputs, sql_query)
+    result = _store_extraction(parser_output, render_report_markdown(parser_output), sql_id, sql_query,
+                               application_name, sql_file_name, analysis_cache, cache_key)
+    result["chunks"] = len(chunks)
+    return result
+
+
+def _plan_statement_extraction(prompt_sql: str, config, analysis_cache):
+    """
+    Splits the script into statements, looks their fragments up in the
+    statement cache and chunks the script of the statements still to analyze.
+    Returns (plan, cached fragments, chunks); chunks is empty when every
+    statement is cached.
+    """
+    plan = plan_statements(prompt_sql, _get_cache_version(config), config.LLM_MODEL)
+    cached = analysis_cache.get_fragments(plan.keys)
+    partial_script = build_partial_script(plan, set(plan.keys) - set(cached))
+    chunks = chunk_script(partial_script, config.CHUNK_MAX_TOKENS) if partial_script else []
+    return plan, cached, chunks
+
+
+def _finalize_statement_extraction(json_strings: list, chunks: list, plan, cached: dict, sql_id: str,
+                                   sql_query: str, application_name: str, sql_file_name: str, analysis_cache,
+                                   cache_key: str) -> dict:
+    """
+    Splits the model's answer for the uncached statements into fragments,
+    caches them, and stores the file's `parser_output` assembled from cached
+    and fresh fragments.
+    """
+    fragments = dict(cached)
+    fresh_output = None
+    leftover = None
+    if chunks:
+        outputs, error_result = _parse_chunk_outputs(json_strings, chunks)
+        if error_result is not None:
+            return error_result
+        fresh_output = merge_parser_outputs(outputs)
+        pending = set(plan.keys) - set(cached)
+        fresh, leftover = split_into_fragments(fresh_output, plan, pending)
+        analysis_cache.put_fragments(cacheable_fragments(fresh, plan))
+        fragments.update(fresh)
+
+    parser_output = assemble_parser_output(plan, fragments, fresh_output, leftover, sql_query)
+    result = _store_extraction(parser_output, render_report_markdown(parser_output), sql_id, sql_query,
+                               application_name, sql_file_name, analysis_cache, cache_key)
+    result["statements"] = {"total": len(plan.units), "distinct": len(plan.keys), "cached": len(cached)}
+    if len(chunks) > 1:
+        result["chunks"] = len(chunks)
+    return result
+
+
+def _generate_chunks(model: LLMClient, chunks: list, max_workers: int) -> list:
+    """Generates the JSON of every chunk, at most `max_workers` calls at a time; raises the first failure."""
+    chunk_config = _get_json_generation_config(True)
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks))), thread_name_prefix="sql-chunk")
+    try:
+        futures = [
+            submit_with_context(executor, model.generate, build_json_extraction_prompt(chunk.text), chunk_config,
+                                safety_settings)
+            for chunk in chunks
+        ]
+        return [future.result().text for future in futures]
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _extract_with_parser(sql_id: str, sql_query: str, application_name: str, sql_file_name: str) -> dict:
+    """Parser-only mode: builds and stores the analysis without any model call."""
+    parser_output = build_parser_output(sql_query)
+    return _store_extraction(parser_output, render_report_markdown(parser_output), sql_id, sql_query,
+                             application_name, sql_file_name, None, None)
+
+
+def extract_sql_details(sql_query, application_name: str, sql_file_name: str, completed_files=None):
+    # Check if the file has already been processed for this application
+    skip_result = _get_skip_result(application_name, sql_file_name, completed_files)
+    if skip_result:
+        return skip_result
+
+    sql_id = str(uuid.uuid4())
+
+    if len(sql_query) < 10:
+        sql_query = "No SQL"
+    config = get_settings()
+
+    # Bulk inventory runs: no model call at all
+    if config.EXTRACTION_MODE == "parser_only":
+        return _extract_with_parser(sql_id, sql_query, application_name, sql_file_name)
+
+    # The prompts get a minimized copy of the script; storage keeps the original
+    prompt_sql = minimize_sql(sql_query) if config.PROMPT_MINIMIZATION_ENABLED else sql_query
+    chunks = _get_chunks(prompt_sql, config)
+
+    # Serve identical scripts (modulo whitespace) from the content-addressed cache
+    analysis_cache = get_analysis_cache()
+    cache_key = compute_cache_key(sql_query, _get_cache_version(config, chunks is not None), config.LLM_MODEL)
+    cached = _serve_from_cache(analysis_cache, cache_key, sql_id, sql_query, application_name, sql_file_name)
+    if cached is not None:
+        return cached
+
+    result = _extract_with_model(sql_query, prompt_sql, chunks, config, sql_id, application_name, sql_file_name,
+                                 analysis_cache, cache_key)
+    result["sql_tokens"] = count_sql_tokens(sql_query, prompt_sql)
+    return result
+
+
+def _extract_with_model(sql_query: str, prompt_sql: str, chunks, config, sql_id: str, application_name: str,
+                        sql_file_name: str, analysis_cache, cache_key: str) -> dict:
+    """Runs the model calls for the configured extraction mode and stores the result."""
+
+    model = _get_model(config)
+    single_pass = config.EXTRACTION_MODE == "single_pass"
+
+    if _uses_statement_cache(config):
+        # Only statements not seen in earlier files go to the model
+        plan, cached, statement_chunks = _plan_statement_extraction(prompt_sql, config, analysis_cache)
+        try:
+            json_strings = _generate_chunks(model, statement_chunks, config.CHUNK_MAX_CONCURRENCY) \
+                if statement_chunks else []
+        except Exception as e:
+            error_payload = {"error": "LLM content generation failed", "details": str(e)}
+            return {"parser_output": error_payload, "report_markdown": ""}
+        return _finalize_statement_extraction(json_strings, statement_chunks, plan, cached, sql_id, sql_query,
+                                              application_name, sql_file_name, analysis_cache, cache_key)
+
+    if chunks is not None:
+        # Very large scripts: statement groups are analyzed in parallel (JSON
+        # only) and merged; the report is rendered locally from the merge.
+        try:
+            json_strings = _generate_chunks(model, chunks, config.CHUNK_MAX_CONCURRENCY)
+        except Exception as e:
+            error_payload = {"error": "LLM content generation failed", "details": str(e)}
+            return {"parser_output": error_payload, "report_markdown": ""}
+        return _finalize_chunked_extraction(json_strings, chunks, sql_id, sql_query, application_name,
+                                            sql_file_name, analysis_cache, cache_key)
+
+    if config.EXTRACTION_MODE == "hybrid":
+        # The parser resolves entities, aliases and joins; the model only fills the gaps
+        parsed_output = build_parser_output(sql_query)
+        try:
+            json_string = model.generate(
+                build_hybrid_prompt(prompt_sql, parsed_output),
+                generation_config=_get_json_generation_config(True),
+                safety_settings=safety_settings,
+            ).text
+        except Exception as e:
+            error_payload = {"error": "LLM content generation failed", "details": str(e)}
+            return {"parser_output": error_payload, "report_markdown": ""}
+        return _finalize_extraction(json_string, "", True, sql_id, sql_query, application_name, sql_file_name,
+                                    analysis_cache, cache_key, parsed_output)
+
     report_markdown = ""
     json_string = ""
 
     try:
         # It's safer to wrap each API call in its own try/except block
         # to handle potential failures, like timeouts or empty responses from the model.
-        responses_tbl = model.generate_content(
-            [extraction_prompt_tbl],
-            generation_config=generation_config,
+        if not single_pass:
+            responses_tbl = model.generate(
+                build_markdown_extraction_prompt(prompt_sql),
+                generation_config=generation_config,
+                safety_settings=safety_settings,
+            )
+            report_markdown = responses_tbl.text
+
+        # In single-pass mode only the structured JSON is generated; the
+        # Markdown report is rendered locally from it in _finalize_extraction.
+        responses_json = model.generate(
+            build_json_extraction_prompt(prompt_sql),
+            generation_config=_get_json_generation_config(single_pass),
             safety_settings=safety_settings,
-            stream=False,
-        )
-        report_markdown = responses_tbl.text
-
-        responses_json = model.generate_content(
-            [extraction_prompt_json],
-            generation_config=generation_config,
-            safety_settings=safety_settings,
-            stream=False,
         )
         json_string = responses_json.text
 
@@ -263,34 +687,282 @@ Provide a short, high-level summary of the script's overall purpose. Describe wh
         # Return a dictionary that the FastAPI endpoint can serialize to JSON
         return {"parser_output": error_payload, "report_markdown": ""}
 
-    # Split the response into JSON and Markdown parts
+    return _finalize_extraction(json_string, report_markdown, single_pass, sql_id, sql_query,
+                                application_name, sql_file_name, analysis_cache, cache_key)
+
+
+def _get_result_status(result: dict) -> str:
+    if result.get("status") == "skipped":
+        return "skipped"
+    parser_output = result.get("parser_output")
+    if isinstance(parser_output, dict) and "error" in parser_output:
+        return "error"
+    return "analyzed"
 
-    # Clean up the JSON string
-    json_string = json_string.strip().lstrip("```json").lstrip("```").rstrip("```")
 
+def _analyze_batch_item(item: dict, application_name: str, completed_files: set) -> dict:
+    started = time.perf_counter()
     try:
-        # Validate JSON
-        parser_output = json.loads(json_string)
-        processing_status = "NEW"
-        # Insert into BigQuery
-        insert_sql_extract_to_bq(
-            sql_id=sql_id,
-            sql_file_name=sql_file_name,
-            raw_sql_text=sql_query,
-            parser_output=parser_output,
-            processing_status=processing_status,
+        result = extract_sql_details(
+            sql_query=item["sql_query"],
             application_name=application_name,
-            parser_output_tables=report_markdown,
+            sql_file_name=item["sql_file_name"],
+            completed_files=completed_files,
         )
-    except json.JSONDecodeError as e:
-        parser_output = {
-            "error": "Invalid JSON response from model",
-            "details": str(e),
-            "response_text": json_string,
+        status = _get_result_status(result)
+    except Exception as e:
+        result = {"error": str(e)}
+        status = "error"
+    return {
+        "sql_file_name": item["sql_file_name"],
+        "status": status,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "result": result,
+    }
+
+
+# How often a running batch checks whether its consumer has gone away
+_BATCH_CANCEL_POLL_SECONDS = 0.5
+
+
+def iter_extract_sql_details_batch(items: list, application_name: str, max_workers: int = None,
+                                   cancelled: threading.Event = None):
+    """
+    Analyzes many `{sql_file_name, sql_query}` items for one application with
+    at most `max_workers` (capped at `BATCH_MAX_WORKERS`) files in parallel,
+    yielding one record per file as soon as it finishes.
+
+    The completed-files lookup runs once for the whole batch, and repeated file
+    names within the batch are skipped after their first occurrence.
+
+    Setting `cancelled` (e.g. when a streaming client disconnects) stops the
+    iterator from any thread: files that have not started are dropped and
+    the iterator ends without waiting for the ones in progress.
+    """
+    # A request can lower the parallelism, never raise it above the configured bound
+    limit = get_settings().BATCH_MAX_WORKERS
+    max_workers = limit if max_workers is None else max(1, min(max_workers, limit))
+    completed_files = get_completed_sql_files(application_name)
+
+    to_analyze = []
+    seen = set()
+    for index, item in enumerate(items):
+        sql_file_name = item["sql_file_name"]
+        if sql_file_name in seen:
+            message = f"Skipping duplicate file '{sql_file_name}' in batch for application '{application_name}'."
+            yield {
+                "index": index,
+                "sql_file_name": sql_file_name,
+                "status": "skipped",
+                "elapsed_seconds": 0.0,
+                "result": {"status": "skipped", "message": message, "sql_file_name": sql_file_name},
+            }
+            continue
+        seen.add(sql_file_name)
+        to_analyze.append((index, item))
+
+    if not to_analyze:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sql-batch")
+    try:
+        futures = {
+            submit_with_context(executor, _analyze_batch_item, item, application_name, completed_files): index
+            for index, item in to_analyze
         }
-        processing_status = "ERROR"
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=_BATCH_CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                if cancelled is not None and cancelled.is_set():
+                    return
+                yield {"index": futures[future], **future.result()}
+            if cancelled is not None and cancelled.is_set():
+                return
+    finally:
+        # If the consumer stops early (e.g. a streaming client disconnects),
+        # drop the files that have not started yet.
+        executor.shutdown(wait=cancelled is None or not cancelled.is_set(), cancel_futures=True)
+
+
+def extract_sql_details_batch(items: list, application_name: str, max_workers: int = None) -> dict:
+    """
+    Runs `iter_extract_sql_details_batch` to completion and returns the
+    per-file results in input order together with aggregate timings.
+    """
+    started = time.perf_counter()
+    records = sorted(iter_extract_sql_details_batch(items, application_name, max_workers), key=lambda r: r["index"])
+    return {
+        "application_name": application_name,
+        "results": records,
+        "summary": summarize_batch(records, time.perf_counter() - started),
+    }
 
+
+def summarize_batch(records: list, wall_clock_seconds: float) -> dict:
+    """Aggregates per-file batch records into status counts and timings."""
+    counts = {"analyzed": 0, "skipped": 0, "error": 0}
+    for record in records:
+        counts[record["status"]] += 1
+    elapsed = [record["elapsed_seconds"] for record in records if record["status"] != "skipped"]
     return {
-        "parser_output": parser_output,
-        "report_markdown": report_markdown,
+        "total_files": len(records),
+        **counts,
+        "wall_clock_seconds": round(wall_clock_seconds, 3),
+        "total_file_seconds": round(sum(elapsed), 3),
+        "mean_file_seconds": round(sum(elapsed) / len(elapsed), 3) if elapsed else 0.0,
+        "max_file_seconds": round(max(elapsed), 3) if elapsed else 0.0,
     }
+
+
+async def _generate_text_async(model: LLMClient, prompt: str, config: dict, timeout: float) -> str:
+    response = await asyncio.wait_for(
+        model.generate_async(prompt, generation_config=config, safety_settings=safety_settings),
+        timeout=timeout,
+    )
+    return response.text
+
+
+async def _generate_chunks_async(model: LLMClient, chunks: list, config, timeout: float):
+    """
+    Generates the JSON of every chunk, at most `CHUNK_MAX_CONCURRENCY` calls
+    at a time. Returns (json strings, None), or (None, error result) naming
+    every failed chunk.
+    """
+    semaphore = asyncio.Semaphore(config.CHUNK_MAX_CONCURRENCY)
+    chunk_config = _get_json_generation_config(True)
+
+    async def generate_chunk(chunk):
+        async with semaphore:
+            return await _generate_text_async(model, build_json_extraction_prompt(chunk.text), chunk_config, timeout)
+
+    json_strings = await asyncio.gather(*(generate_chunk(chunk) for chunk in chunks), return_exceptions=True)
+    failures = {chunk.index: result for chunk, result in zip(chunks, json_strings)
+                if isinstance(result, BaseException)}
+    if failures:
+        first = next(iter(failures.values()))
+        error_payload = {"error": "LLM content generation failed", "details": str(first) or repr(first)}
+        return None, {"parser_output": error_payload, "report_markdown": "",
+                      "generation_errors": {f"chunk_{index + 1}": repr(e) for index, e in failures.items()}}
+    return json_strings, None
+
+
+async def extract_sql_details_async(sql_query, application_name: str, sql_file_name: str,
+                                    timeout: float = None):
+    """
+    Async variant of `extract_sql_details`.
+
+    In dual mode the Markdown and JSON generations are issued concurrently, so
+    per-file latency is close to the slower of the two calls rather than their
+    sum. Each call is bounded by `timeout` (defaults to
+    the `LLM_CALL_TIMEOUT_SECONDS` setting). If only the Markdown call fails, the
+    report is rendered locally from the JSON; if only the JSON call fails, the
+    Markdown report is still returned alongside the error.
+    """
+    skip_result = await asyncio.to_thread(_get_skip_result, application_name, sql_file_name)
+    if skip_result:
+        return skip_result
+
+    sql_id = str(uuid.uuid4())
+
+    if len(sql_query) < 10:
+        sql_query = "No SQL"
+    config = get_settings()
+    if timeout is None:
+        timeout = config.LLM_CALL_TIMEOUT_SECONDS
+
+    if config.EXTRACTION_MODE == "parser_only":
+        return await asyncio.to_thread(_extract_with_parser, sql_id, sql_query, application_name, sql_file_name)
+
+    prompt_sql = sql_query
+    if config.PROMPT_MINIMIZATION_ENABLED:
+        prompt_sql = await asyncio.to_thread(minimize_sql, sql_query)
+    chunks = await asyncio.to_thread(_get_chunks, prompt_sql, config)
+
+    analysis_cache = get_analysis_cache()
+    cache_key = compute_cache_key(sql_query, _get_cache_version(config, chunks is not None), config.LLM_MODEL)
+    cached = await asyncio.to_thread(
+        _serve_from_cache, analysis_cache, cache_key, sql_id, sql_query, application_name, sql_file_name
+    )
+    if cached is not None:
+        return cached
+
+    result = await _extract_with_model_async(sql_query, prompt_sql, chunks, config, timeout, sql_id,
+                                             application_name, sql_file_name, analysis_cache, cache_key)
+    result["sql_tokens"] = count_sql_tokens(sql_query, prompt_sql)
+    return result
+
+
+async def _extract_with_model_async(sql_query: str, prompt_sql: str, chunks, config, timeout: float, sql_id: str,
+                                    application_name: str, sql_file_name: str, analysis_cache,
+                                    cache_key: str) -> dict:
+    """Async counterpart of `_extract_with_model`."""
+
+    model = _get_model(config)
+    single_pass = config.EXTRACTION_MODE == "single_pass"
+
+    if _uses_statement_cache(config):
+        plan, cached, statement_chunks = await asyncio.to_thread(
+            _plan_statement_extraction, prompt_sql, config, analysis_cache
+        )
+        json_strings, error_result = await _generate_chunks_async(model, statement_chunks, config, timeout)
+        if error_result is not None:
+            return error_result
+        return await asyncio.to_thread(
+            _finalize_statement_extraction, json_strings, statement_chunks, plan, cached, sql_id, sql_query,
+            application_name, sql_file_name, analysis_cache, cache_key,
+        )
+
+    if chunks is not None:
+        json_strings, error_result = await _generate_chunks_async(model, chunks, config, timeout)
+        if error_result is not None:
+            return error_result
+        return await asyncio.to_thread(
+            _finalize_chunked_extraction, json_strings, chunks, sql_id, sql_query, application_name,
+            sql_file_name, analysis_cache, cache_key,
+        )
+
+    if config.EXTRACTION_MODE == "hybrid":
+        parsed_output = await asyncio.to_thread(build_parser_output, sql_query)
+        try:
+            json_string = await _generate_text_async(
+                model, build_hybrid_prompt(prompt_sql, parsed_output), _get_json_generation_config(True), timeout
+            )
+        except Exception as e:
+            error_payload = {"error": "LLM content generation failed", "details": str(e) or repr(e)}
+            return {"parser_output": error_payload, "report_markdown": "",
+                    "generation_errors": {"parser_output": repr(e)}}
+        return await asyncio.to_thread(
+            _finalize_extraction, json_string, "", True, sql_id, sql_query, application_name, sql_file_name,
+            analysis_cache, cache_key, parsed_output,
+        )
+
+    json_call = _generate_text_async(
+        model, build_json_extraction_prompt(prompt_sql), _get_json_generation_config(single_pass), timeout
+    )
+    if single_pass:
+        (json_result,) = await asyncio.gather(json_call, return_exceptions=True)
+        markdown_result = ""
+    else:
+        markdown_call = _generate_text_async(
+            model, build_markdown_extraction_prompt(prompt_sql), generation_config, timeout
+        )
+        markdown_result, json_result = await asyncio.gather(markdown_call, json_call, return_exceptions=True)
+
+    generation_errors = {}
+    if isinstance(markdown_result, BaseException):
+        generation_errors["report_markdown"] = repr(markdown_result)
+        markdown_result = ""
+    if isinstance(json_result, BaseException):
+        generation_errors["parser_output"] = repr(json_result)
+        error_payload = {"error": "LLM content generation failed", "details": str(json_result) or repr(json_result)}
+        return {"parser_output": error_payload, "report_markdown": markdown_result,
+                "generation_errors": generation_errors}
+
+    result = await asyncio.to_thread(
+        _finalize_extraction, json_result, markdown_result, single_pass, sql_id, sql_query,
+        application_name, sql_file_name, analysis_cache, cache_key,
+    )
+    if generation_errors:
+        result["generation_errors"] = generation_errors
+    return result
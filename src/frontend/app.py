@@ -12,6 +12,7 @@ import streamlit.components.v1 as components
 API_BASE_URL = os.environ.get("API_BASE_URL", "http://127.0.0.1:8000")
 # API_BASE_URL = "https://reverse-engineering-agent-api-172009895677.us-central1.run.app"
 ANALYZE_API_URL = f"{API_BASE_URL}/analyze-sql"
+ANALYZE_BATCH_STREAM_URL = f"{API_BASE_URL}/analyze-batch/stream"
 DOWNLOAD_REPORT_URL = f"{API_BASE_URL}/download-report"
 
 st.set_page_config(
@@ -55,79 +56,132 @@ def show_sql_analysis_page():
         st.header("Analysis Results")
         total_files = len(uploaded_files)
         st.info(f"Found {total_files} file(s) to process.")
-        
-        # Iterate through each uploaded file
+
+        # Reserve a slot per file so results can be filled in as they stream back
+        placeholders = []
         for i, uploaded_file in enumerate(uploaded_files, 1):
             st.markdown("---")
-            st.write(f"**Processing file {i} of {total_files}: `{uploaded_file.name}`**")
-            
-            file_id = f"{application_name}_{uploaded_file.name}"
+            st.write(f"**File {i} of {total_files}: `{uploaded_file.name}`**")
+            placeholders.append(st.empty())
 
-            with st.expander(f"Analysis details for `{uploaded_file.name}`", expanded=True):
-                # Only perform analysis if results are not already in session state
-                if file_id not in st.session_state.analysis_results:
-                    if application_name: # Double-check application_name is present
-                        with st.spinner(f"Analyzing `{uploaded_file.name}`..."):
-                            try:
-                                # To read the file content, we use a BytesIO object and decode it
-                                stringio = io.StringIO(uploaded_file.getvalue().decode("utf-8", errors="ignore"))
-                                sql_query = stringio.read()
-
-                                # Prepare the request payload, including application_name
-                                payload = {
-                                    "sql_query": sql_query,
-                                    "application_name": application_name,
-                                    "sql_file_name": uploaded_file.name
-                                }
-
-                                # Send the request to the FastAPI backend
-                                response = requests.post(ANALYZE_API_URL, json=payload)
-                                
-                                # Store result in session state
-                                st.session_state.analysis_results[file_id] = response.json()
-                                st.session_state.analysis_results[file_id]['status_code'] = response.status_code
-
-                            except Exception as e:
-                                st.session_state.analysis_results[file_id] = {'error': str(e), 'status_code': 500}
-                    else:
-                        st.error("Application Name is missing. Please provide it before uploading files.")
-
-                # Display results from session state
-                result = st.session_state.analysis_results.get(file_id)
-                if result:
-                    status_code = result.get('status_code')
-                    if status_code == 200:
-                        st.success(f"Successfully analyzed `{uploaded_file.name}`.")
-                        report_markdown = result.get("report_markdown", "")
-                        parser_output = result.get("parser_output", {})
-                        
-                        # The backend now returns markdown and json. We can offer both for download.
-                        if report_markdown:
-                            st.download_button(
-                                label="Download Report",
-                                data=report_markdown,
-                                file_name=f"{uploaded_file.name}.csv",
-                                mime="text/markdown",
-                                key=f"download_btn_{i}"
-                            )
-                        if parser_output and "error" not in parser_output:
-                            st.download_button(
-                                label="Download JSON",
-                                data=json.dumps(parser_output, indent=2),
-                                file_name=f"{uploaded_file.name}.json",
-                                mime="application/json",
-                                key=f"download_btn_{i}_json"
-                            )
-                        st.json(parser_output)
-                    elif 'error' in result:
-                         st.error(f"An unexpected error occurred while processing `{uploaded_file.name}`: {result['error']}")
-                    else:
-                        st.error(f"Error analyzing `{uploaded_file.name}`. Status code: {status_code}")
-                        st.json(result)
+        pending = []
+        for i, uploaded_file in enumerate(uploaded_files, 1):
+            file_id = f"{application_name}_{uploaded_file.name}"
+            if file_id in st.session_state.analysis_results:
+                render_analysis_result(placeholders[i - 1], uploaded_file.name, i,
+                                       st.session_state.analysis_results[file_id])
+            else:
+                pending.append((i, uploaded_file, file_id))
+                with placeholders[i - 1].container():
+                    st.info(f"Waiting for analysis of `{uploaded_file.name}`...")
+
+        if pending:
+            progress = st.progress(0.0, text=f"Analyzing {len(pending)} file(s)...")
+            done = 0
+            for index, result in stream_batch_analysis(application_name, [f for _, f, _ in pending]):
+                i, uploaded_file, file_id = pending[index]
+                st.session_state.analysis_results[file_id] = result
+                render_analysis_result(placeholders[i - 1], uploaded_file.name, i, result)
+                done += 1
+                progress.progress(done / len(pending), text=f"Analyzed {done} of {len(pending)} file(s).")
+
+def stream_batch_analysis(application_name: str, uploaded_files: list):
+    """
+    Sends the files to the streaming batch endpoint and yields
+    `(index, result)` for each file as soon as the backend finishes it.
+    """
+    items = []
+    for uploaded_file in uploaded_files:
+        # To read the file content, we use a BytesIO object and decode it
+        stringio = io.StringIO(uploaded_file.getvalue().decode("utf-8", errors="ignore"))
+        items.append({"sql_file_name": uploaded_file.name, "sql_query": stringio.read()})
+
+    received = set()
+    try:
+        payload = {"application_name": application_name, "items": items}
+        with requests.post(ANALYZE_BATCH_STREAM_URL, json=payload, stream=True) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Status code: {response.status_code}")
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                record = json.loads(line)
+                if record.get("type") == "error":
+                    raise RuntimeError(record.get("error"))
+                if record.get("type") != "result":
+                    continue
+                result = dict(record.get("result") or {})
+                result["status_code"] = 500 if record.get("status") == "error" else 200
+                received.add(record["index"])
+                yield record["index"], result
+    except Exception as e:
+        for index in range(len(uploaded_files)):
+            if index not in received:
+                yield index, {"error": str(e), "status_code": 500}
+
+def render_analysis_result(placeholder, file_name: str, i: int, result: dict):
+    """Renders one file's analysis result into its reserved placeholder."""
+    with placeholder.container():
+        with st.expander(f"Analysis details for `{file_name}`", expanded=True):
+            status_code = result.get('status_code')
+            if status_code == 200 and result.get("status") == "skipped":
+                st.info(result.get("message", f"Skipped `{file_name}`."))
+            elif status_code == 200:
+                st.success(f"Successfully analyzed `{file_name}`.")
+                report_markdown = result.get("report_markdown", "")
+                parser_output = result.get("parser_output", {})
+
+                # The backend now returns markdown and json. We can offer both for download.
+                if report_markdown:
+                    st.download_button(
+                        label="Download Report",
+                        data=report_markdown,
+                        file_name=f"{file_name}.csv",
+                        mime="text/markdown",
+                        key=f"download_btn_{i}"
+                    )
+                if parser_output and "error" not in parser_output:
+                    st.download_button(
+                        label="Download JSON",
+                        data=json.dumps(parser_output, indent=2),
+                        file_name=f"{file_name}.json",
+                        mime="application/json",
+                        key=f"download_btn_{i}_json"
+                    )
+                st.json(parser_output)
+            elif 'error' in result:
+                st.error(f"An unexpected error occurred while processing `{file_name}`: {result['error']}")
+            else:
+                st.error(f"Error analyzing `{file_name}`. Status code: {status_code}")
+                st.json(result)
+
+# Records listed per "View SQL Analysis" page; full reports are fetched one at a time
+VIEW_PAGE_SIZE = 50
+VIEW_LIST_FIELDS = ["sql_id", "sql_file_name", "processing_status", "inserted_at"]
+
+def fetch_analysis_page(application_name: str, cursor: str = None) -> dict:
+    """Fetches one page of an application's records (names and status only)."""
+    payload = {"application_name": application_name, "fields": VIEW_LIST_FIELDS,
+               "limit": VIEW_PAGE_SIZE, "cursor": cursor}
+    response = requests.post(f"{API_BASE_URL}/get-data-model", json=payload)
+    if response.status_code != 200:
+        raise RuntimeError(f"Status code: {response.status_code}, {response.text}")
+    return response.json()
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def fetch_analysis_report(application_name: str, sql_id: str) -> str:
+    """Fetches the Markdown report of one record."""
+    payload = {"application_name": application_name, "sql_ids": [sql_id], "fields": ["parser_output_tables"]}
+    response = requests.post(f"{API_BASE_URL}/get-data-model", json=payload)
+    if response.status_code != 200:
+        raise RuntimeError(f"Status code: {response.status_code}, {response.text}")
+    records = response.json().get("records") or [{}]
+    return records[0].get("parser_output_tables") or ""
 
 def show_data_model_page():
     """
     Displays the page for fetching and viewing data models from BigQuery.
+    Records are listed a page at a time; each report is fetched when it is opened.
     """
     st.title("View SQL Analysis by Application")
 
@@ -139,12 +193,15 @@ def show_data_model_page():
     # Initialize or clear session state for results
     if 'view_results' not in st.session_state:
         st.session_state.view_results = None
+    if 'view_cursor' not in st.session_state:
+        st.session_state.view_cursor = None
     if 'view_app_name' not in st.session_state:
         st.session_state.view_app_name = None
 
     # If the application name changes, clear the previous results
     if st.session_state.view_app_name != application_name:
         st.session_state.view_results = None
+        st.session_state.view_cursor = None
         st.session_state.view_app_name = application_name
 
     if st.button("Retrieve SQL Analysis Results"):
@@ -154,30 +211,40 @@ def show_data_model_page():
         else:
             with st.spinner(f"Retrieving SQL Analysis Results for `{application_name}`..."):
                 try:
-                    payload = {"application_name": application_name}
-                    response = requests.post(f"{API_BASE_URL}/get-data-model", json=payload)
-
-                    if response.status_code == 200:
-                        st.session_state.view_results = response.json()
-                    else:
-                        st.error(f"Error fetching data model. Status code: {response.status_code}")
-                        st.json(response.json())
-                        st.session_state.view_results = None
+                    page = fetch_analysis_page(application_name)
+                    st.session_state.view_results = page["records"]
+                    st.session_state.view_cursor = page["next_cursor"]
                 except Exception as e:
-                    st.error(f"An unexpected error occurred: {e}")
+                    st.error(f"Error fetching data model: {e}")
                     st.session_state.view_results = None
 
     # Always display results if they are in the session state
     if st.session_state.view_results:
         results = st.session_state.view_results
         st.success(f"Successfully fetched data for `{application_name}`.")
-        st.write(f"Found {len(results)} parser output(s).")
+        more = " (more available)" if st.session_state.view_cursor else ""
+        st.write(f"Showing {len(results)} parser output(s){more}.")
         for result in results:
             sql_file_name = result.get("sql_file_name", "Unknown File")
-            parser_output_tables = result.get("parser_output_tables")
-            with st.expander(f"SQL Analysis for: `{sql_file_name}`", expanded=False):
-                # The parser_output from BQ might be a string-escaped JSON.
-                st.markdown(parser_output_tables if parser_output_tables else "No markdown report available.")
+            status = result.get("processing_status") or "unknown"
+            with st.expander(f"SQL Analysis for: `{sql_file_name}` ({status})", expanded=False):
+                st.caption(f"Analyzed at {result.get('inserted_at')}")
+                # Expander bodies always run, so the report is only requested once asked for
+                if st.toggle("Show report", key=f"view_report_{result.get('sql_id')}"):
+                    try:
+                        report = fetch_analysis_report(application_name, result.get("sql_id"))
+                        st.markdown(report if report else "No markdown report available.")
+                    except Exception as e:
+                        st.error(f"Error fetching the report: {e}")
+        if st.session_state.view_cursor and st.button("Load more"):
+            try:
+                page = fetch_analysis_page(application_name, st.session_state.view_cursor)
+            except Exception as e:
+                st.error(f"Error fetching data model: {e}")
+            else:
+                st.session_state.view_results = results + page["records"]
+                st.session_state.view_cursor = page["next_cursor"]
+                st.rerun()
     elif st.session_state.view_results == []: # Handle case where fetch was successful but returned no data
         st.info(f"No data model found for application: `{application_name}`.")
 
@@ -239,7 +306,7 @@ def show_consolidated_model_page():
     st.title("Generate Consolidated Data Model")
     st.write(
         "This page fetches all individual SQL analysis results for an application from BigQuery "
-        "and uses a generative model to create a single, consolidated data model."
+        "and merges them into a single, consolidated data model."
     )
 
     application_name = st.text_input(
@@ -1,14 +1,31 @@
+import json
 import os
 import sys
-from fastapi import FastAPI, HTTPException, Response
-from pydantic import BaseModel
+import threading
+import time
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.routing import Match
 
 # Add project root to the Python path to allow absolute imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.agents.tools.sql_analysis import extract_sql_details
-from src.agents.tools.create_data_model import get_sql_json_from_bq, create_data_model_from_bq
-from src.agents.tools.create_excel_report import create_excel_report
+from src.agents.tools.sql_analysis import (
+    extract_sql_details_async,
+    extract_sql_details_batch,
+    iter_extract_sql_details_batch,
+    summarize_batch,
+    warm_up,
+)
+from src.agents.tools.create_data_model import get_sql_json_page, create_data_model_from_bq
+from src.agents.tools.create_excel_report import iter_report_chunks, open_excel_report
+from src.agents.tools.jobs import ANALYZE_JOB, DATA_MODEL_JOB, get_job_queue
+from src.agents.shared_libraries.executors import get_pool, shutdown_pools
+from src.agents.shared_libraries import metrics, resources
+from src.agents.shared_libraries.analysis_cache import get_analysis_cache
+from src.agents.shared_libraries.storage import close_storage
 
 # Set a default config path before importing settings
 # This is crucial for the settings module to find the configuration file.
@@ -21,16 +38,100 @@ app = FastAPI(
     version="0.1.0",
 )
 
+
+@app.on_event("startup")
+def startup_event():
+    """
+    Builds the shared settings snapshot and clients, then starts the background
+    job workers, resuming jobs interrupted by a restart.
+    """
+    resources.startup()
+    warm_up()
+    get_job_queue().start()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """Waits for in-flight offloaded work and releases the endpoint pools."""
+    get_job_queue().stop(timeout=5)
+    shutdown_pools()
+    # Flush buffered rows before the shared clients are closed
+    close_storage(timeout=30)
+    resources.shutdown()
+
+
+def _route_template(scope) -> str:
+    """The matched route's path template, so `/jobs/{job_id}` is one label value rather than one per job."""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Times every request and labels the metrics recorded while serving it with its endpoint."""
+    endpoint = _route_template(request.scope)
+    token = metrics.set_request_labels(endpoint=endpoint)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(status))
+        metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint,
+                                              method=request.method)
+        metrics.reset_request_labels(token)
+
+
 class SQLQueryRequest(BaseModel):
     """Request model for a single SQL query."""
     sql_query: str
     application_name: str
     sql_file_name: str
 
+class SQLFileItem(BaseModel):
+    """A single SQL file within a batch analysis request."""
+    sql_file_name: str
+    sql_query: str
+
+class SQLBatchRequest(BaseModel):
+    """Request model for analyzing many SQL files of one application."""
+    application_name: str
+    items: List[SQLFileItem]
+    # Capped at BATCH_MAX_WORKERS
+    max_concurrency: Optional[int] = Field(None, ge=1)
+
 class DataModelRequest(BaseModel):
     """Request model for fetching a data model by application name."""
     application_name: str
 
+class DataModelPageRequest(DataModelRequest):
+    """Request model for one page of an application's SQL analysis records."""
+    fields: Optional[List[str]] = None
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
+    sql_ids: Optional[List[str]] = None
+
+
+@app.get("/health", summary="Liveness check")
+async def health():
+    """Cheap liveness probe; never touches BigQuery or Vertex AI."""
+    return {"status": "ok"}
+
+
+@app.get("/metrics", summary="Prometheus metrics")
+def get_metrics():
+    """Request, model call, BigQuery and analysis cache metrics of this process in the Prometheus text format."""
+    # Sync route: reading the cache size queries its SQLite file, so keep it off the event loop
+    cache = get_analysis_cache()
+    if cache is not None:
+        cache.export_metrics()
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 
 @app.post("/analyze-sql", summary="Analyze a SQL query")
 async def analyze_sql(request: SQLQueryRequest):
@@ -38,27 +139,108 @@ async def analyze_sql(request: SQLQueryRequest):
     Accepts a SQL query, processes it using the reverse-engineering agent,
     and returns the extracted data model as JSON.
     """
+    metrics.set_request_labels(application=request.application_name)
     try:
-        analysis_result = extract_sql_details(
-            sql_query=request.sql_query,
-            application_name=request.application_name,
-            sql_file_name=request.sql_file_name
-        )
+        # Model calls are natively async; the analyze pool bounds how many run at once
+        async with get_pool("analyze").limit():
+            analysis_result = await extract_sql_details_async(
+                sql_query=request.sql_query,
+                application_name=request.application_name,
+                sql_file_name=request.sql_file_name
+            )
         return analysis_result
     except Exception as e:
         # Catch potential exceptions from the agent and return a proper HTTP error
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analyze-batch", summary="Analyze many SQL files of one application")
+async def analyze_batch(request: SQLBatchRequest):
+    """
+    Accepts many SQL files for one application and analyzes them in parallel
+    (bounded by `max_concurrency`, default and at most `BATCH_MAX_WORKERS`). Returns the
+    per-file status (analyzed / skipped / error) and aggregate timings.
+    """
+    metrics.set_request_labels(application=request.application_name)
+    try:
+        return await get_pool("batch").run(
+            extract_sql_details_batch,
+            items=[item.model_dump() for item in request.items],
+            application_name=request.application_name,
+            max_workers=request.max_concurrency,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analyze-batch/stream", summary="Analyze many SQL files, streaming results as NDJSON")
+async def analyze_batch_stream(request: SQLBatchRequest):
+    """
+    Same as `/analyze-batch`, but streams one NDJSON record per file
+    (`{"type": "result", ...}`) as soon as that file finishes, followed by a
+    final `{"type": "summary", ...}` record.
+    """
+    metrics.set_request_labels(application=request.application_name)
+    pool = get_pool("batch")
+    cancelled = threading.Event()
+    records = iter_extract_sql_details_batch(
+        [item.model_dump() for item in request.items],
+        application_name=request.application_name,
+        max_workers=request.max_concurrency,
+        cancelled=cancelled,
+    )
+
+    async def stream_records():
+        started = time.perf_counter()
+        summaries = []
+        # Whether a pool thread may still be running next(records)
+        advancing = False
+        try:
+            while True:
+                advancing = True
+                try:
+                    record = await pool.run(next, records, None)
+                except Exception as e:
+                    advancing = False
+                    yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+                    return
+                advancing = False
+                if record is None:
+                    break
+                # Only the fields needed for the summary are kept in memory
+                summaries.append({"status": record["status"], "elapsed_seconds": record["elapsed_seconds"]})
+                yield json.dumps({"type": "result", **record}) + "\n"
+            summary = summarize_batch(summaries, time.perf_counter() - started)
+            yield json.dumps({"type": "summary", "application_name": request.application_name, **summary}) + "\n"
+        finally:
+            # On a disconnect the iterator stops itself: a generator cannot be
+            # closed while another thread is running it, so it is only closed
+            # here when it is suspended at a yield
+            cancelled.set()
+            if not advancing:
+                await pool.run(records.close)
+
+    return StreamingResponse(stream_records(), media_type="application/x-ndjson")
+
 @app.post("/get-data-model", summary="Get data model from BigQuery")
-async def get_data_model(request: DataModelRequest):
+async def get_data_model(request: DataModelPageRequest):
     """
-    Accepts an application name, fetches the corresponding SQL parser outputs
-    from BigQuery, and returns them.
+    Accepts an application name and returns one page of its SQL parser
+    outputs from BigQuery, newest first, as `{"records": [...], "next_cursor": ...}`.
+    `fields` picks the columns returned (default `sql_file_name` and
+    `parser_output_tables`); pass `next_cursor` back as `cursor` for the next
+    page, and `sql_ids` to fetch specific records.
     """
+    metrics.set_request_labels(application=request.application_name)
     try:
-        # This function now fetches data from BQ and returns it
-        data_model_result = get_sql_json_from_bq(application_name=request.application_name)
-        return data_model_result
+        return await get_pool("read").run(
+            get_sql_json_page,
+            application_name=request.application_name,
+            fields=request.fields,
+            limit=request.limit,
+            cursor=request.cursor,
+            sql_ids=request.sql_ids,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         # Catch potential exceptions and return a proper HTTP error
         raise HTTPException(status_code=500, detail=str(e))
@@ -68,32 +250,81 @@ async def download_report(request: DataModelRequest):
     """
     Accepts an application name, fetches all its analysis reports from BigQuery,
     and returns a consolidated Excel file. Each sheet in the file corresponds
-    to a single SQL file's markdown report.
+    to a single SQL file's markdown report. The file is built in a temporary
+    file and streamed back in chunks.
     """
+    metrics.set_request_labels(application=request.application_name)
     try:
-        excel_bytes = create_excel_report(application_name=request.application_name)
-        
-        # Define headers for the file download response
-        headers = {
-            'Content-Disposition': f'attachment; filename="{request.application_name}_report.xlsx"'
-        }
-        
-        return Response(content=excel_bytes, 
-                        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        headers=headers)
+        report = await get_pool("report").run(
+            open_excel_report, application_name=request.application_name
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    # Define headers for the file download response
+    headers = {
+        'Content-Disposition': f'attachment; filename="{request.application_name}_report.xlsx"'
+    }
+
+    # A sync iterator: Starlette reads the chunks in its thread pool
+    return StreamingResponse(iter_report_chunks(report),
+                             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                             headers=headers)
+
 @app.post("/create-data-model", summary="Create a consolidated data model from BigQuery records")
 async def create_data_model(request: DataModelRequest):
     """
     Accepts an application name, fetches all its SQL parser outputs from BigQuery,
-    and uses a generative model to create a consolidated data model.
+    and merges them into a consolidated data model (see `DATA_MODEL_MODE`).
     """
+    metrics.set_request_labels(application=request.application_name)
     try:
         # This function fetches records and generates a new data model
-        consolidated_model = create_data_model_from_bq(application_name=request.application_name)
+        consolidated_model = await get_pool("data_model").run(
+            create_data_model_from_bq, application_name=request.application_name
+        )
         return consolidated_model
     except Exception as e:
         # Catch potential exceptions and return a proper HTTP error
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/jobs/analyze", summary="Submit a background analysis job")
+async def submit_analysis_job(request: SQLBatchRequest):
+    """
+    Queues the SQL files for background analysis and returns a job id
+    immediately. Poll `/jobs/{job_id}` for status, progress and results.
+    """
+    metrics.set_request_labels(application=request.application_name)
+    try:
+        payload = {
+            "application_name": request.application_name,
+            "items": [item.model_dump() for item in request.items],
+            "max_concurrency": request.max_concurrency,
+        }
+        job_id = await get_pool("read").run(get_job_queue().submit, ANALYZE_JOB, payload)
+        return {"job_id": job_id, "status": "queued"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/jobs/create-data-model", summary="Submit a background consolidated data model job")
+async def submit_data_model_job(request: DataModelRequest):
+    """
+    Queues the consolidated data model build for an application and returns a
+    job id immediately. Poll `/jobs/{job_id}` for the result.
+    """
+    metrics.set_request_labels(application=request.application_name)
+    try:
+        payload = {"application_name": request.application_name}
+        job_id = await get_pool("read").run(get_job_queue().submit, DATA_MODEL_JOB, payload)
+        return {"job_id": job_id, "status": "queued"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/{job_id}", summary="Get the status of a background job")
+async def get_job(job_id: str):
+    """Returns the job's status, progress and, once finished, its result or error."""
+    job = await get_pool("read").run(get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job
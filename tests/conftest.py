@@ -0,0 +1,44 @@
+"""
+Settings are a process-wide snapshot, so the environment is pointed at
+local stand-ins (the fake LLM client, SQLite storage, caches and the job
+database in a temporary directory) before anything under `src` is imported.
+"""
+import os
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="rea-tests-")
+
+os.environ["CONFIG_PATH"] = os.path.join(ROOT, "config.yaml")
+os.environ.update({
+    "APP_LLM_PROVIDER": "fake",
+    "APP_STORAGE_BACKEND": "sqlite",
+    "APP_LOCAL_STORAGE_PATH": os.path.join(WORK_DIR, "rea_local.db"),
+    "APP_ANALYSIS_CACHE_PATH": os.path.join(WORK_DIR, "analysis_cache.db"),
+    "APP_SESSION_DB_URL": f"sqlite:///{os.path.join(WORK_DIR, 'sessions.db')}",
+    "APP_BQ_STORAGE_READ_ENABLED": "false",
+})
+
+from src.agents.shared_libraries import resources  # noqa: E402
+from src.agents.shared_libraries.llm_client import FakeLLMClient, set_llm_client  # noqa: E402
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    """Returns a function that swaps in a copy of the settings snapshot with some fields changed."""
+    def override(**changes):
+        updated = resources.get_settings().model_copy(update=changes)
+        monkeypatch.setattr(resources, "_settings", updated)
+        return updated
+    return override
+
+
+@pytest.fixture
+def fake_llm():
+    """Routes every model call to a fresh `FakeLLMClient` for the duration of the test."""
+    client = FakeLLMClient()
+    set_llm_client(client)
+    yield client
+    set_llm_client(None)
@@ -0,0 +1,80 @@
+import uuid
+
+from src.agents.shared_libraries.analysis_cache import compute_cache_key, get_analysis_cache
+from src.agents.tools import sql_analysis
+from src.agents.tools.sql_analysis import extract_sql_details
+
+
+def _script(tag: str) -> str:
+    return (
+        f"INSERT INTO sales.orders_{tag} (order_id, amount)\n"
+        f"SELECT o.order_id, o.amount FROM staging.orders_{tag} o;\n"
+    )
+
+
+def test_cache_key_ignores_whitespace_only():
+    sql = "SELECT a\nFROM t;"
+    assert compute_cache_key(sql, "1", "m") == compute_cache_key("  SELECT   a \r\n\n FROM t;  ", "1", "m")
+    assert compute_cache_key(sql, "1", "m") != compute_cache_key(sql, "2", "m")
+    assert compute_cache_key(sql, "1", "m") != compute_cache_key(sql, "1", "other")
+
+
+def test_identical_sql_is_served_from_cache(fake_llm):
+    app, sql = f"app_{uuid.uuid4().hex}", _script(uuid.uuid4().hex[:8])
+
+    first = extract_sql_details(sql, app, "first.sql")
+    calls = fake_llm.calls
+    # Same script under another name and layout: no model call
+    second = extract_sql_details(sql.replace("\n", "\r\n   "), app, "second.sql")
+
+    assert calls > 0
+    assert fake_llm.calls == calls
+    assert second["parser_output"] == first["parser_output"]
+
+
+def test_prompt_version_change_misses(fake_llm, monkeypatch):
+    app, sql = f"app_{uuid.uuid4().hex}", _script(uuid.uuid4().hex[:8])
+    extract_sql_details(sql, app, "first.sql")
+    calls = fake_llm.calls
+
+    monkeypatch.setattr(sql_analysis, "PROMPT_VERSION", sql_analysis.PROMPT_VERSION + "-next")
+    extract_sql_details(sql, app, "second.sql")
+
+    assert fake_llm.calls > calls
+
+
+def test_model_change_misses(fake_llm, settings):
+    app, sql = f"app_{uuid.uuid4().hex}", _script(uuid.uuid4().hex[:8])
+    extract_sql_details(sql, app, "first.sql")
+    calls = fake_llm.calls
+
+    settings(LLM_MODEL="another-model")
+    extract_sql_details(sql, app, "second.sql")
+
+    assert fake_llm.calls > calls
+
+
+def test_statement_cache_reuses_shared_statements(fake_llm, settings, monkeypatch):
+    settings(EXTRACTION_MODE="single_pass", STATEMENT_CACHE_ENABLED=True)
+    cache = get_analysis_cache()
+    app, tag = f"app_{uuid.uuid4().hex}", uuid.uuid4().hex[:8]
+    shared = _script(tag)
+
+    extract_sql_details(shared, app, "first.sql")
+    hits = cache.statement_hits
+    # A different file that repeats the statement: its fragment comes from the cache
+    extract_sql_details(shared + f"DELETE FROM sales.returns_{tag};\n", app, "second.sql")
+    assert cache.statement_hits > hits
+
+    # A new prompt version changes every statement key
+    hits, misses = cache.statement_hits, cache.statement_misses
+    monkeypatch.setattr(sql_analysis, "PROMPT_VERSION", sql_analysis.PROMPT_VERSION + "-next")
+    extract_sql_details(shared + f"DELETE FROM sales.archive_{tag};\n", app, "third.sql")
+    assert cache.statement_hits == hits
+    assert cache.statement_misses > misses
+
+
+def test_cache_version_tracks_model_and_mode_settings(settings):
+    base = sql_analysis._get_cache_version(settings())
+    assert sql_analysis._get_cache_version(settings(EXTRACTION_MODE="single_pass")) != base
+    assert sql_analysis._get_cache_version(settings(PROMPT_MINIMIZATION_ENABLED=False)) != base
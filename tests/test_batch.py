@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import httpx
+
+from src.agents.shared_libraries.llm_client import FakeLLMClient, set_llm_client
+from src.agents.tools import sql_analysis
+from src.agents.tools.sql_analysis import iter_extract_sql_details_batch
+from src.main import app
+
+
+def _items(count):
+    tag = uuid.uuid4().hex[:8]
+    return [
+        {"sql_file_name": f"file_{i}.sql", "sql_query": f"INSERT INTO t_{tag}_{i} SELECT a FROM s_{i};"}
+        for i in range(count)
+    ]
+
+
+def test_cancelled_batch_stops_while_another_thread_is_advancing_it():
+    llm = FakeLLMClient(latency=0.3)
+    set_llm_client(llm)
+    try:
+        cancelled = threading.Event()
+        records = iter_extract_sql_details_batch(
+            _items(20), f"app_{uuid.uuid4().hex}", max_workers=2, cancelled=cancelled,
+        )
+        outcome = {}
+
+        def advance():
+            try:
+                while True:
+                    next(records)
+            except StopIteration:
+                outcome["stopped"] = True
+            except Exception as e:
+                outcome["error"] = e
+
+        consumer = threading.Thread(target=advance)
+        consumer.start()
+        time.sleep(0.5)
+        # Set from another thread while next() is running, as on a client disconnect
+        cancelled.set()
+        consumer.join(timeout=3)
+
+        assert not consumer.is_alive()
+        assert outcome == {"stopped": True}
+        # Files that had not started are dropped: no new model calls after the ones in progress
+        time.sleep(0.5)
+        calls = llm.calls
+        time.sleep(1.0)
+        assert llm.calls == calls
+        assert llm.calls < 20
+    finally:
+        set_llm_client(None)
+
+
+def _post_batch(max_concurrency):
+    async def post():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            return await client.post("/analyze-batch", json={
+                "application_name": f"app_{uuid.uuid4().hex}", "items": _items(2),
+                "max_concurrency": max_concurrency,
+            })
+    return asyncio.run(post())
+
+
+def test_batch_concurrency_is_validated_and_capped(fake_llm, settings, monkeypatch):
+    settings(BATCH_MAX_WORKERS=4)
+    sizes = []
+    executor = sql_analysis.ThreadPoolExecutor
+
+    def recording_executor(max_workers, **kwargs):
+        sizes.append(max_workers)
+        return executor(max_workers=max_workers, **kwargs)
+
+    monkeypatch.setattr(sql_analysis, "ThreadPoolExecutor", recording_executor)
+
+    assert _post_batch(0).status_code == 422
+    assert _post_batch(-3).status_code == 422
+    assert _post_batch(100000).status_code == 200
+    assert _post_batch(2).status_code == 200
+    assert _post_batch(None).status_code == 200
+    assert sizes == [4, 2, 4]
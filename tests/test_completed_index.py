@@ -0,0 +1,118 @@
+import threading
+import time
+
+from src.agents.shared_libraries.completed_index import CompletedFilesIndex
+
+
+class _CountingLoader:
+    def __init__(self, files):
+        self.files = files
+        self.calls = 0
+
+    def __call__(self, application_name):
+        self.calls += 1
+        return list(self.files)
+
+
+def test_second_lookup_does_not_reload():
+    load_all = _CountingLoader(["a.sql"])
+    index = CompletedFilesIndex(load_all, ttl_seconds=60)
+
+    assert index.is_completed("app", "a.sql")
+    # Misses are answered from the loaded set too
+    assert not index.is_completed("app", "b.sql")
+    assert not index.is_completed("app", "b.sql")
+    assert index.get_completed("app") == {"a.sql"}
+    assert load_all.calls == 1
+
+
+def test_marked_files_are_merged_on_load():
+    load_all = _CountingLoader(["a.sql"])
+    index = CompletedFilesIndex(load_all, ttl_seconds=60)
+
+    index.mark_completed("app", "b.sql")
+    assert index.is_completed("app", "b.sql")
+    index.mark_completed("app", "c.sql")
+    assert index.get_completed("app") == {"a.sql", "b.sql", "c.sql"}
+    assert load_all.calls == 1
+
+
+def test_expired_entry_is_reloaded():
+    load_all = _CountingLoader(["a.sql"])
+    index = CompletedFilesIndex(load_all, ttl_seconds=-1)
+
+    index.is_completed("app", "a.sql")
+    index.is_completed("app", "a.sql")
+    assert load_all.calls == 2
+
+
+class _SlowLoader(_CountingLoader):
+    """A full scan that blocks until released."""
+
+    def __init__(self, files):
+        super().__init__(files)
+        self.release = threading.Event()
+
+    def __call__(self, application_name):
+        self.release.wait(5)
+        return super().__call__(application_name)
+
+
+class _CountingLookup:
+    def __init__(self, files):
+        self.files = set(files)
+        self.calls = 0
+
+    def __call__(self, application_name, sql_file_name):
+        self.calls += 1
+        return sql_file_name in self.files
+
+
+def _wait_warm(index, application_name):
+    deadline = time.monotonic() + 5
+    while application_name not in index._warm and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_cold_lookup_uses_point_lookup_and_caches_misses():
+    load_all = _SlowLoader(["a.sql"])
+    point_lookup = _CountingLookup(["a.sql"])
+    index = CompletedFilesIndex(load_all, point_lookup, ttl_seconds=60)
+
+    # Answered while the full scan is still blocked
+    assert index.is_completed("app", "a.sql")
+    assert not index.is_completed("app", "b.sql")
+    assert not index.is_completed("app", "b.sql")
+    assert point_lookup.calls == 2
+    assert load_all.calls == 0
+
+    load_all.release.set()
+    _wait_warm(index, "app")
+    assert load_all.calls == 1
+    assert not index.is_completed("app", "c.sql")
+    assert point_lookup.calls == 2
+
+
+def test_failed_point_lookup_is_not_cached():
+    load_all = _SlowLoader([])
+    answers = [None, True]
+    index = CompletedFilesIndex(load_all, lambda app, name: answers.pop(0), ttl_seconds=60)
+
+    assert not index.is_completed("app", "a.sql")
+    assert index.is_completed("app", "a.sql")
+    load_all.release.set()
+
+
+def test_expired_application_is_reloaded_in_the_background():
+    load_all = _CountingLoader(["a.sql"])
+    point_lookup = _CountingLookup(["a.sql"])
+    index = CompletedFilesIndex(load_all, point_lookup, ttl_seconds=60)
+    index.get_completed("app")
+    index.ttl_seconds = -1
+
+    assert index.is_completed("app", "a.sql")
+    assert point_lookup.calls == 1
+    deadline = time.monotonic() + 5
+    while load_all.calls < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert load_all.calls == 2
@@ -0,0 +1,97 @@
+import json
+import uuid
+
+import pytest
+
+from src.agents.shared_libraries.data_model_graph import DataModelGraph
+from src.agents.shared_libraries.storage import get_storage
+from src.agents.tools.create_data_model import create_data_model_from_bq
+
+GOOD = {
+    "entities": [{"entity_name": "DB.ORDERS", "attributes": ["ORDER_ID"]}, {"entity_name": "DB.CUSTOMER"}],
+    "relationships": [{"left_entity": "ORDERS", "right_entity": "CUSTOMER", "join_conditions": ["o.c = c.c"]}],
+    "data_flows": [{"target_entity": "DB.ORDERS", "source_entities": ["DB.CUSTOMER"]}],
+}
+
+
+@pytest.mark.parametrize("parser_output", [
+    {"entities": ["DB.BAD"]},
+    {"entities": {"entity_name": "DB.BAD"}},
+    {"relationships": [{"left_entity": "A", "right_entity": "B", "join_conditions": "a.x = b.x"}]},
+    {"data_flows": [{"target_entity": "TGT", "source_entities": "SRC_TABLE"}]},
+    {"relationships": [{"left_entity": "A", "right_entity": "B", "join_conditions": [{"left": "a.x"}]}]},
+    {"relationships": [{"left_entity": "A", "right_entity": "B", "join_conditions": ["a.x = b.x", 7]}]},
+])
+def test_malformed_parser_output_is_rejected_before_merging(parser_output):
+    graph = DataModelGraph()
+    graph.add_parser_output(GOOD, "good.sql")
+    before = graph.to_dict()
+
+    with pytest.raises(ValueError):
+        graph.add_parser_output({**GOOD, **parser_output}, "bad.sql")
+    assert graph.records == 1
+    assert graph.to_dict() == before
+
+
+def test_malformed_records_are_reported_not_fatal(settings):
+    settings(DATA_MODEL_MODE="graph", DATA_MODEL_LLM_REFINE=False)
+    application_name = f"app_{uuid.uuid4().hex}"
+    outputs = {
+        "good.sql": GOOD,
+        "bare_entities.sql": {"entities": ["DB.BAD"]},
+        "string_sources.sql": {"data_flows": [{"target_entity": "TGT", "source_entities": "SRC_TABLE"}]},
+    }
+    get_storage().insert_extracts([
+        {"sql_id": uuid.uuid4().hex, "sql_file_name": name, "parser_output": json.dumps(output),
+         "application_name": application_name, "inserted_at": f"2026-01-01T00:00:0{i}"}
+        for i, (name, output) in enumerate(outputs.items())
+    ])
+
+    response = create_data_model_from_bq(application_name, rebuild=True)
+
+    assert response["status"] == "partial_success"
+    assert sorted(record["sql_file_name"] for record in response["failed_records"]) == [
+        "bare_entities.sql", "string_sources.sql",
+    ]
+    names = {entity["name"] for entity in response["results"][0]["entities"]}
+    assert names == {"ORDERS", "CUSTOMER"}
+
+
+def test_per_record_mode_streams_records_from_storage(fake_llm, monkeypatch):
+    application_name = f"app_{uuid.uuid4().hex}"
+    get_storage().insert_extracts([
+        {"sql_id": uuid.uuid4().hex, "sql_file_name": f"file_{i}.sql",
+         "parser_output": json.dumps(GOOD) if i % 4 else None,
+         "application_name": application_name, "inserted_at": f"2026-01-01T00:00:{i:02d}"}
+        for i in range(12)
+    ])
+    # Bulk fetches that load every row are gone; only the Arrow batch stream is used
+    batches = []
+    iter_batches = type(get_storage()).iter_batches
+
+    def recording_iter_batches(self, *args, **kwargs):
+        for batch in iter_batches(self, *args, **kwargs):
+            batches.append(batch.num_rows)
+            yield batch
+
+    monkeypatch.setattr(type(get_storage()), "iter_batches", recording_iter_batches)
+
+    response = create_data_model_from_bq(application_name, mode="per_record", max_workers=2)
+
+    assert response["summary"]["records"] == 12
+    assert response["summary"]["skipped"] == 3
+    assert response["summary"]["succeeded"] == 9
+    assert sum(batches) == 12
+
+
+def test_state_stored_before_validation_still_renders():
+    graph = DataModelGraph()
+    graph.add_parser_output(GOOD, "good.sql")
+    state = graph.state()
+    # A non-string join condition merged before check_parser_output rejected them
+    for _, edge in state["relationships"]:
+        edge["join_conditions"].append({"left": "o.c"})
+
+    restored = DataModelGraph.from_state(state)
+    details = [rel["details"] for rel in restored.to_dict()["relationships"]]
+    assert details and "{'left': 'o.c'}" in details[0]
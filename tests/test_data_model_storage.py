@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from src.agents.shared_libraries import bq_utils
+
+
+class _RecordingClient:
+    def __init__(self):
+        self.requests = []
+
+    def insert_rows_json(self, table_id, rows, row_ids=None):
+        self.requests.append((rows, row_ids))
+        return []
+
+
+def _row(state_size: int) -> dict:
+    return {
+        "application_name": "app", "version": 3, "watermark": "2026-01-01T00:00:00", "fingerprint": "f:r",
+        "created_at": "2026-01-02T00:00:00+00:00", "recent_records": json.dumps({"id": "2026-01-01T00:00:00"}),
+        "state": json.dumps({"graph": {"entities": "x" * state_size}}), "result": json.dumps({"status": "success"}),
+    }
+
+
+def test_large_state_is_stored_in_chunks(settings, monkeypatch):
+    settings(DATA_MODEL_STATE_CHUNK_BYTES=1000)
+    client = _RecordingClient()
+    monkeypatch.setattr(bq_utils, "get_bq_client", lambda: client)
+    row = _row(5000)
+
+    assert bq_utils.insert_data_model_to_bq(row) == []
+
+    chunks = [rows[0] for rows, _ in client.requests]
+    assert len(chunks) > 5
+    assert all(len(rows) == 1 for rows, _ in client.requests)
+    assert all(len(chunk["payload"]) <= 1000 for chunk in chunks)
+    assert len({row_ids[0] for _, row_ids in client.requests}) == len(chunks)
+    assert bq_utils.join_data_model_rows(list(reversed(chunks))) == row
+
+
+def test_incomplete_version_is_rejected():
+    chunks = bq_utils.split_data_model_row(_row(5000), 1000)
+    with pytest.raises(ValueError):
+        bq_utils.join_data_model_rows(chunks[:-1])
+
+
+class _TimingOutClient(_RecordingClient):
+    """Commits the rows, then fails the first call as if it had timed out."""
+
+    def insert_rows_json(self, table_id, rows, row_ids=None):
+        super().insert_rows_json(table_id, rows, row_ids)
+        if len(self.requests) == 1:
+            raise TimeoutError("Read timed out")
+        return []
+
+
+def test_retried_extract_batch_reuses_insert_ids(monkeypatch):
+    client = _TimingOutClient()
+    monkeypatch.setattr(bq_utils, "get_bq_client", lambda: client)
+    rows = [{"sql_id": f"id-{i}", "sql_file_name": f"{i}.sql"} for i in range(3)]
+
+    with pytest.raises(TimeoutError):
+        bq_utils.insert_rows_to_bq(rows)
+    assert bq_utils.insert_rows_to_bq(rows) == []
+
+    first, retry = (row_ids for _, row_ids in client.requests)
+    assert first == retry == ["id-0", "id-1", "id-2"]
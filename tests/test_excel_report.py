@@ -0,0 +1,108 @@
+import io
+import json
+import uuid
+
+from openpyxl import load_workbook
+
+from src.agents.shared_libraries.storage import get_storage
+from src.agents.tools.create_excel_report import (
+    SUMMARY_HEADERS,
+    create_excel_report,
+    iter_report_chunks,
+    open_excel_report,
+    unique_sheet_name,
+    write_excel_report,
+)
+
+LONG_NAME = "customer_orders_daily_snapshot_load"
+
+
+def _insert(application_name: str, outputs: dict):
+    get_storage().insert_extracts([
+        {"sql_id": uuid.uuid4().hex, "sql_file_name": name, "parser_output": json.dumps(output),
+         "parser_output_tables": f"# {name}", "application_name": application_name,
+         "inserted_at": f"2026-01-01T00:00:{i:02d}"}
+        for i, (name, output) in enumerate(outputs.items())
+    ])
+
+
+def _rows(sheet) -> list:
+    return [list(row) for row in sheet.iter_rows(values_only=True)]
+
+
+def test_sheet_names_stay_unique_after_truncation():
+    used = {}
+    names = [unique_sheet_name(LONG_NAME + suffix, used) for suffix in ("_a.sql", "_b.sql", "_c.sql")]
+    names += [unique_sheet_name(LONG_NAME.upper() + ".sql", used), unique_sheet_name("a:b/c", used)]
+
+    assert names == [
+        "customer_orders_daily_snapshot_",
+        "customer_orders_daily_snaps (2)",
+        "customer_orders_daily_snaps (3)",
+        "CUSTOMER_ORDERS_DAILY_SNAPS (4)",
+        "abc",
+    ]
+    assert all(len(name) <= 31 for name in names)
+    # A file named like an already suffixed sheet still gets a sheet of its own
+    assert unique_sheet_name("customer_orders_daily_snaps (2)", used) == "customer_orders_daily_snaps (5)"
+
+
+def test_empty_application_gets_a_notice_sheet():
+    application_name = f"app_{uuid.uuid4().hex}"
+    output = io.BytesIO()
+
+    assert write_excel_report(application_name, output) == 0
+
+    workbook = load_workbook(output)
+    assert workbook.sheetnames == ["Notice"]
+    assert _rows(workbook["Notice"]) == [["message"], [f"No data found for application: {application_name}"]]
+
+
+def test_report_summary_skips_records_without_entities():
+    application_name = f"app_{uuid.uuid4().hex}"
+    _insert(application_name, {
+        "a_orders.sql": {"entities": [{"entity_name": "ORDERS", "entity_type": "TABLE", "creation_source": "DDL"}]},
+        "b_no_entities.sql": {"entities": []},
+        LONG_NAME + "_1.sql": {"relationships": []},
+        LONG_NAME + "_2.sql": {"entities": [{"entity_name": "SNAPSHOT", "entity_type": "TABLE"}]},
+    })
+
+    workbook = load_workbook(io.BytesIO(create_excel_report(application_name)))
+
+    assert workbook.sheetnames == [
+        "Report Summary", "a_orders.sql", "b_no_entities.sql",
+        "customer_orders_daily_snapshot_", "customer_orders_daily_snaps (2)",
+    ]
+    assert _rows(workbook["Report Summary"]) == [
+        list(SUMMARY_HEADERS),
+        ["a_orders.sql", "ORDERS", "TABLE", "DDL"],
+        [LONG_NAME + "_2.sql", "SNAPSHOT", "TABLE", None],
+    ]
+    assert _rows(workbook["b_no_entities.sql"]) == [["# b_no_entities.sql"]]
+
+
+def test_records_without_any_entities_have_no_summary_sheet():
+    application_name = f"app_{uuid.uuid4().hex}"
+    _insert(application_name, {"only.sql": {"entities": []}})
+    output = io.BytesIO()
+
+    assert write_excel_report(application_name, output) == 1
+
+    assert load_workbook(output).sheetnames == ["only.sql"]
+
+
+def test_report_chunks_close_the_temporary_file():
+    application_name = f"app_{uuid.uuid4().hex}"
+    _insert(application_name, {"a.sql": {"entities": []}})
+
+    report = open_excel_report(application_name)
+    data = b"".join(iter_report_chunks(report, chunk_size=1024))
+    assert report.closed
+    assert load_workbook(io.BytesIO(data)).sheetnames == ["a.sql"]
+
+    # Also when the client disconnects halfway through the download
+    report = open_excel_report(application_name)
+    chunks = iter_report_chunks(report, chunk_size=16)
+    next(chunks)
+    chunks.close()
+    assert report.closed
@@ -0,0 +1,54 @@
+import asyncio
+import time
+import uuid
+
+import httpx
+
+from src.agents.shared_libraries.llm_client import FakeLLMClient, set_llm_client
+from src.main import app
+
+ANALYSES = 8
+MODEL_LATENCY_SECONDS = 1.0
+HEALTH_BOUND_SECONDS = 0.2
+
+
+async def _health_while_analyzing(llm: FakeLLMClient):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+        application_name = f"app_{uuid.uuid4().hex}"
+        analyses = [
+            asyncio.create_task(client.post("/analyze-sql", json={
+                "sql_query": f"INSERT INTO t_{i}_{uuid.uuid4().hex[:8]} SELECT a FROM s_{i};",
+                "application_name": application_name,
+                "sql_file_name": f"file_{i}.sql",
+            }))
+            for i in range(ANALYSES)
+        ]
+        # Wait until every analysis is blocked on its (slow) model call
+        deadline = time.perf_counter() + 5
+        while llm._in_flight < ANALYSES and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        assert llm._in_flight >= ANALYSES
+
+        started = time.perf_counter()
+        health = await client.get("/health")
+        health_seconds = time.perf_counter() - started
+        still_running = sum(not task.done() for task in analyses)
+
+        responses = await asyncio.gather(*analyses)
+    return health, health_seconds, still_running, responses
+
+
+def test_health_answers_while_analyses_are_in_flight():
+    llm = FakeLLMClient(latency=MODEL_LATENCY_SECONDS)
+    set_llm_client(llm)
+    try:
+        health, health_seconds, still_running, responses = asyncio.run(_health_while_analyzing(llm))
+    finally:
+        set_llm_client(None)
+
+    assert health.status_code == 200
+    assert health.json() == {"status": "ok"}
+    assert health_seconds < HEALTH_BOUND_SECONDS
+    assert still_running == ANALYSES
+    assert all(response.status_code == 200 for response in responses)
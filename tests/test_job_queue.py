@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import threading
+import time
+
+from src.agents.shared_libraries.job_queue import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue
+
+
+def _queue(db_path: str, handler=None, **kwargs) -> JobQueue:
+    kwargs.setdefault("poll_interval", 0.01)
+    return JobQueue(db_path, {"echo": handler or (lambda payload, ctx: payload)}, **kwargs)
+
+
+def _wait_for(predicate, timeout: float = 10):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_two_queues_on_one_database_run_each_job_once(tmp_path):
+    db_path = os.path.join(tmp_path, "jobs.db")
+    runs, runs_lock = [], threading.Lock()
+
+    def handler(payload, ctx):
+        with runs_lock:
+            runs.append(payload["n"])
+        time.sleep(0.005)
+        return payload
+
+    queues = [_queue(db_path, handler, num_workers=4), _queue(db_path, handler, num_workers=4)]
+    job_ids = [queues[0].submit("echo", {"n": n}) for n in range(40)]
+    for queue in queues:
+        queue.start()
+    try:
+        assert _wait_for(lambda: all(queues[0].get(job_id)["status"] == SUCCEEDED for job_id in job_ids))
+    finally:
+        for queue in queues:
+            queue.stop(timeout=5)
+
+    assert sorted(runs) == list(range(40))
+    assert all(queues[0].get(job_id)["attempts"] == 1 for job_id in job_ids)
+
+
+def test_start_leaves_jobs_leased_by_a_live_queue_alone(tmp_path):
+    db_path = os.path.join(tmp_path, "jobs.db")
+    live = _queue(db_path, lease_seconds=60)
+    job_id = live.submit("echo", {})
+    assert live._claim_next()[0] == job_id
+
+    restarted = _queue(db_path)
+    restarted.start()
+    try:
+        time.sleep(0.1)
+        job = restarted.get(job_id)
+    finally:
+        restarted.stop(timeout=5)
+
+    assert job["status"] == RUNNING
+    assert job["attempts"] == 1
+
+
+def test_expired_leases_are_requeued_then_failed_after_max_attempts(tmp_path):
+    db_path = os.path.join(tmp_path, "jobs.db")
+    crashed = _queue(db_path, lease_seconds=0.05, max_attempts=2)
+    job_id = crashed.submit("echo", {})
+
+    # The job's worker dies twice without finishing it
+    for attempt in (1, 2):
+        assert crashed._claim_next()[0] == job_id
+        time.sleep(0.1)
+        other = _queue(db_path, max_attempts=2)
+        requeued = other._requeue_abandoned()
+        if attempt == 1:
+            assert requeued == 1
+            assert other.get(job_id)["status"] == QUEUED
+
+    job = other.get(job_id)
+    assert job["status"] == FAILED
+    assert job["attempts"] == 2
+    assert "Abandoned" in job["error"]
+
+
+def _failing(method, times: int):
+    """Wraps a queue method so its first `times` calls raise `sqlite3.OperationalError`."""
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        if len(calls) <= times:
+            raise sqlite3.OperationalError("database is locked")
+        return method(*args, **kwargs)
+    return wrapper, calls
+
+
+def test_worker_survives_database_errors_while_claiming_and_finishing(tmp_path):
+    queue = _queue(os.path.join(tmp_path, "jobs.db"), num_workers=1)
+    queue._claim_next, claims = _failing(queue._claim_next, 2)
+    queue._finish, finishes = _failing(queue._finish, 2)
+    runs = []
+    queue.handlers["echo"] = lambda payload, ctx: runs.append(payload) or payload
+    job_id = queue.submit("echo", {"n": 1})
+    queue.start()
+    try:
+        assert _wait_for(lambda: queue.get(job_id)["status"] == SUCCEEDED)
+        second = queue.submit("echo", {"n": 2})
+        assert _wait_for(lambda: queue.get(second)["status"] == SUCCEEDED)
+    finally:
+        queue.stop(timeout=5)
+
+    # The handler ran once per job; only the database calls were retried
+    assert runs == [{"n": 1}, {"n": 2}]
+    assert len(claims) > 2
+    assert len(finishes) == 4
@@ -0,0 +1,51 @@
+import asyncio
+import uuid
+
+import httpx
+
+from src.agents.shared_libraries import bq_utils, metrics
+from src.agents.tools.sql_analysis import extract_sql_details
+from src.main import app
+
+
+class _FakeJob:
+    total_bytes_processed = 2048
+
+    def result(self):
+        return []
+
+
+class _FakeClient:
+    def query(self, query, job_config=None):
+        return _FakeJob()
+
+
+def test_bigquery_metrics_carry_request_labels():
+    application_name = f"app_{uuid.uuid4().hex}"
+    with metrics.request_labels(endpoint="/create-data-model", application=application_name):
+        bq_utils.run_query(_FakeClient(), "SELECT 1", None, operation="list_extracts")
+
+    labels = {"operation": "list_extracts", "endpoint": "/create-data-model", "application": application_name}
+    assert metrics.BQ_JOBS.value(outcome="success", **labels) == 1
+    assert metrics.BQ_BYTES_PROCESSED.value(**labels) == 2048
+
+
+def test_analysis_cache_lookups_are_exported(fake_llm):
+    application_name = f"app_{uuid.uuid4().hex}"
+    sql = f"INSERT INTO t_{uuid.uuid4().hex[:8]} SELECT a FROM s;"
+    with metrics.request_labels(endpoint="/analyze-sql", application=application_name):
+        extract_sql_details(sql, application_name, "first.sql")
+        extract_sql_details(sql, application_name, "second.sql")
+
+    labels = {"endpoint": "/analyze-sql", "application": application_name, "cache": "result"}
+    assert metrics.ANALYSIS_CACHE_LOOKUPS.value(outcome="miss", **labels) == 1
+    assert metrics.ANALYSIS_CACHE_LOOKUPS.value(outcome="hit", **labels) == 1
+
+    async def scrape():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/metrics")
+
+    body = asyncio.run(scrape()).text
+    assert f'rea_analysis_cache_lookups_total{{endpoint="/analyze-sql",application="{application_name}",' in body
+    assert 'rea_analysis_cache_entries{cache="result"}' in body
@@ -0,0 +1,92 @@
+import asyncio
+
+from google.auth.credentials import AnonymousCredentials
+from google.auth.transport.requests import AuthorizedSession
+
+from src.agents.config.settings import Settings
+from src.agents.shared_libraries import executors, llm_client, resources
+from src.agents.tools import sql_analysis
+from src.agents.tools.sql_analysis import SYSTEM_INSTRUCTION
+
+
+class _Client:
+    def __init__(self, name: str):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_reload_swaps_clients_and_resizes_pools_without_closing_old_ones(monkeypatch):
+    current = resources.get_settings()
+    reloaded = current.model_copy(update={"READ_MAX_CONCURRENCY": current.READ_MAX_CONCURRENCY + 3})
+    old_client = _Client("old")
+    monkeypatch.setattr(resources, "_bq_client", old_client)
+    monkeypatch.setattr(resources, "_settings", current)
+    monkeypatch.setattr(resources, "_config_mtime", 1.0)
+    monkeypatch.setattr(resources, "_get_config_mtime", lambda: 2.0)
+    monkeypatch.setattr(resources, "_build_bq_client", lambda config: _Client("new"))
+    monkeypatch.setattr(Settings, "get_settings", staticmethod(lambda: reloaded))
+    monkeypatch.setattr(executors, "_pools", {})
+
+    old_pool = executors.get_pool("read")
+    assert resources.reload_if_changed()
+
+    # Readers that picked up the old client or pool keep working with them
+    assert resources.get_bq_client().name == "new"
+    assert not old_client.closed
+    new_pool = executors.get_pool("read")
+    assert new_pool is not old_pool
+    assert new_pool.max_workers == reloaded.READ_MAX_CONCURRENCY
+    assert asyncio.run(old_pool.run(lambda: "still running")) == "still running"
+    new_pool.shutdown()
+
+
+def test_missing_storage_read_package_falls_back_and_logs_once(settings, monkeypatch, capsys):
+    settings(BQ_STORAGE_READ_ENABLED=True)
+    monkeypatch.setattr(resources, "bigquery_storage", None)
+    monkeypatch.setattr(resources, "_bqstorage_fallback_logged", False)
+
+    assert resources.get_bqstorage_client() is None
+    assert resources.get_bqstorage_client() is None
+    assert capsys.readouterr().out.count("fall back to the BigQuery REST API") == 1
+
+
+def test_reload_drops_cached_llm_clients(monkeypatch):
+    current = resources.get_settings()
+    monkeypatch.setattr(resources, "_settings", current)
+    monkeypatch.setattr(resources, "_config_mtime", 1.0)
+    monkeypatch.setattr(resources, "_get_config_mtime", lambda: 2.0)
+    monkeypatch.setattr(resources, "_build_bq_client", lambda config: _Client("new"))
+    monkeypatch.setattr(Settings, "get_settings", staticmethod(lambda: current.model_copy()))
+
+    old_client = llm_client.get_llm_client(current.LLM_MODEL, SYSTEM_INSTRUCTION)
+    assert llm_client.get_llm_client(current.LLM_MODEL, SYSTEM_INSTRUCTION) is old_client
+    assert resources.reload_if_changed()
+    assert llm_client.get_llm_client(current.LLM_MODEL, SYSTEM_INSTRUCTION) is not old_client
+
+
+def test_warm_up_builds_the_model_used_by_analysis(settings, monkeypatch):
+    config = settings(LLM_PROVIDER="vertex")
+    built = []
+    monkeypatch.setattr(llm_client, "_clients", {})
+    monkeypatch.setattr(llm_client, "get_generative_model",
+                        lambda model_name, system_instruction=None: built.append((model_name, system_instruction)))
+
+    sql_analysis.warm_up()
+    sql_analysis._get_model(config)
+
+    assert built == [(config.LLM_MODEL, SYSTEM_INSTRUCTION)]
+
+
+def test_bq_client_uses_a_pooled_authorized_session(settings, monkeypatch):
+    config = settings(PROJECT_ID="test-project", BQ_HTTP_POOL_SIZE=7)
+    monkeypatch.setattr(resources.google.auth, "default", lambda scopes=None: (AnonymousCredentials(), None))
+
+    client = resources._build_bq_client(config)
+
+    assert client.project == "test-project"
+    assert isinstance(client._http, AuthorizedSession)
+    assert client._http.get_adapter("https://bigquery.googleapis.com")._pool_maxsize == 7
+    client.close()
@@ -0,0 +1,128 @@
+import time
+
+from src.agents.shared_libraries import storage
+from src.agents.shared_libraries.row_writer import BufferedRowWriter, InMemorySink
+
+
+def _rows(n, start=0):
+    return [{"application_name": "app", "sql_file_name": f"{i}.sql"} for i in range(start, start + n)]
+
+
+def test_flushes_full_batches_by_size():
+    sink = InMemorySink()
+    writer = BufferedRowWriter(sink, max_batch_rows=10, flush_interval=60)
+    for row in _rows(25):
+        writer.write(row)
+
+    deadline = time.monotonic() + 2
+    while len(sink.rows) < 20 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Two full batches go out; the remaining 5 rows wait for the interval
+    assert len(sink.rows) == 20
+    assert sink.calls == 2
+    writer.close(timeout=2)
+
+
+def test_flushes_partial_batch_by_age():
+    sink = InMemorySink()
+    writer = BufferedRowWriter(sink, max_batch_rows=100, flush_interval=0.1)
+    for row in _rows(3):
+        writer.write(row)
+
+    deadline = time.monotonic() + 2
+    while not sink.rows and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(sink.rows) == 3
+    assert sink.calls == 1
+    writer.close(timeout=2)
+
+
+def test_write_blocks_while_buffer_is_full():
+    sink = InMemorySink(latency=0.5)
+    writer = BufferedRowWriter(sink, max_batch_rows=2, flush_interval=60, max_buffered_rows=2)
+    rows = _rows(5)
+    # The first batch is taken by the slow sink, the next two fill the buffer
+    for row in rows[:2]:
+        assert writer.write(row)
+    deadline = time.monotonic() + 2
+    while writer.stats()["rows_buffered"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for row in rows[2:4]:
+        assert writer.write(row)
+
+    started = time.monotonic()
+    assert not writer.write(rows[4], timeout=0.1)
+    assert time.monotonic() - started >= 0.1
+    # Once the sink frees space, the blocked write goes through
+    assert writer.write(rows[4], timeout=2)
+    writer.close(timeout=5)
+    assert len(sink.rows) == 5
+
+
+def test_rejected_rows_are_retried_then_dropped():
+    failed = []
+    sink = InMemorySink(fail_rows=lambda row: row["sql_file_name"] == "1.sql")
+    writer = BufferedRowWriter(
+        sink, max_batch_rows=10, flush_interval=60, max_retries=2, retry_backoff=0.01,
+        on_rows_failed=failed.extend,
+    )
+    for row in _rows(3):
+        writer.write(row)
+    writer.close(timeout=5)
+
+    assert [row["sql_file_name"] for row in sink.rows] == ["0.sql", "2.sql"]
+    assert [row["sql_file_name"] for row in failed] == ["1.sql"]
+    stats = writer.stats()
+    assert stats["rows_retried"] == 2
+    assert stats["rows_failed"] == 1
+    # One initial attempt plus two retries
+    assert sink.calls == 3
+
+
+def test_close_flushes_buffered_rows():
+    sink = InMemorySink()
+    writer = BufferedRowWriter(sink, max_batch_rows=100, flush_interval=60)
+    for row in _rows(7):
+        writer.write(row)
+    assert not sink.rows
+
+    writer.close(timeout=2)
+    assert len(sink.rows) == 7
+    assert not writer.write(_rows(1)[0])
+
+
+class _FakeBackend:
+    def __init__(self):
+        self.closed = False
+
+    def list_completed_files(self, application_name):
+        return []
+
+    def is_file_completed(self, application_name, file_name):
+        return False
+
+    def close(self):
+        self.closed = True
+
+
+def test_close_storage_does_not_recreate_backend_on_failed_flush(monkeypatch):
+    backend = _FakeBackend()
+    writer = BufferedRowWriter(
+        InMemorySink(fail_rows=lambda row: True), max_batch_rows=10, flush_interval=60,
+        max_retries=0, on_rows_failed=storage._on_rows_failed,
+    )
+    monkeypatch.setattr(storage, "_storage", backend)
+    monkeypatch.setattr(storage, "_row_writer", writer)
+    monkeypatch.setattr(storage, "_completed_files_index", None)
+    created = []
+    monkeypatch.setattr(storage, "SQLiteStorage", lambda *args, **kwargs: created.append(args))
+    monkeypatch.setattr(storage, "BigQueryStorage", lambda *args, **kwargs: created.append(args))
+
+    writer.write(_rows(1)[0])
+    storage.close_storage(timeout=2)
+
+    assert writer.stats()["rows_failed"] == 1
+    assert backend.closed
+    assert not created
+    assert storage._storage is None
+    assert storage._completed_files_index is None
@@ -0,0 +1,52 @@
+import json
+import uuid
+
+import pytest
+
+from src.agents.shared_libraries.llm_client import FakeLLMClient, set_llm_client
+from src.agents.shared_libraries.sql_chunking import check_chunk_output, merge_parser_outputs
+from src.agents.tools.sql_analysis import extract_sql_details
+
+MALFORMED = [
+    {"entities": ["ORDERS"]},
+    {"entities": [{"entity_name": "ORDERS", "attributes": ["ORDER_ID"]}]},
+    {"relationships": [{"left_entity": "A", "right_entity": "B", "join_conditions": [{"left": "a.x"}]}]},
+    {"relationships": [{"left_entity": "A", "right_entity": "B", "join_conditions": "a.x = b.x"}]},
+    {"job_metadata": ["job"]},
+]
+
+
+@pytest.mark.parametrize("output", MALFORMED)
+def test_check_chunk_output_rejects_malformed_shapes(output):
+    with pytest.raises(ValueError):
+        check_chunk_output(output)
+
+
+def test_well_formed_chunks_merge():
+    outputs = [
+        {"entities": [{"entity_name": "ORDERS", "attributes": [{"attribute_name": "ID"}]}],
+         "relationships": [{"left_entity": "A", "right_entity": "B", "join_conditions": ["a.x = b.x"]}]},
+        {"entities": [{"entity_name": "orders", "attributes": [{"attribute_name": "AMOUNT"}]}]},
+    ]
+    for output in outputs:
+        check_chunk_output(output)
+    merged = merge_parser_outputs(outputs)
+    assert [len(entity["attributes"]) for entity in merged["entities"]] == [2]
+
+
+@pytest.mark.parametrize("output", MALFORMED[:4])
+def test_malformed_chunk_reply_is_an_error_result_not_an_exception(output, settings):
+    settings(EXTRACTION_MODE="dual", CHUNK_MAX_TOKENS=20, STATEMENT_CACHE_ENABLED=False,
+             ANALYSIS_CACHE_ENABLED=False)
+    set_llm_client(FakeLLMClient(responder=lambda prompt, config: json.dumps(output)))
+    try:
+        tag = uuid.uuid4().hex[:8]
+        sql = "\n".join(
+            f"INSERT INTO sales.orders_{tag}_{i} (order_id, amount) SELECT o.order_id, o.amount FROM stage.o_{i} o;"
+            for i in range(6)
+        )
+        result = extract_sql_details(sql, f"app_{uuid.uuid4().hex}", "big.sql")
+    finally:
+        set_llm_client(None)
+
+    assert result["parser_output"]["error"] == "Invalid JSON response from model"